@@ -10,6 +10,7 @@ import firebase_admin
 from firebase_admin import credentials
 
 import logging
+import click
 from datetime import datetime, date
 from sqlalchemy import not_
 
@@ -17,6 +18,9 @@ from .provider import db, ma, ap_scheduler, login_manager, google_oauth, mail, m
 from .models import *
 from .util import *
 from .api import *
+from .karma import check_karma, rebuild_karma
+from .karma_replay import KarmaRules, karma_replay_report
+from .characters import CharacterRefresher, character_config, refresh_stale_characters
 
 def create_app(config_file=None):
     # --- Launch app --- 
@@ -109,6 +113,12 @@ def create_app(config_file=None):
     ap_scheduler.start()
 
 
+    # --- Character cache setup ---
+    # created here once, the request threads only ever read it
+    with app.app_context():
+        app.extensions["character_refresher"] = CharacterRefresher(character_config("workers"))
+
+
     # --- Google OAuth setup ---
     google_oauth.init_app(app)
 
@@ -142,6 +152,60 @@ def create_app(config_file=None):
         mail.init_app(app)
 
 
+    # --- CLI commands ---
+    @app.cli.command("check-seat-counts")
+    @click.option("--repair", is_flag=True, help="Correct the counters that are off.")
+    def check_seat_counts(repair):
+        """Verify the cached number of assignments of every adventure."""
+        mismatches = check_assigned_counts(repair=repair)
+        for adventure_id, stored, actual in mismatches:
+            click.echo(f"Adventure {adventure_id}: assigned_count {stored}, actual {actual}")
+        click.echo(f"{len(mismatches)} mismatching adventures{' repaired' if repair and mismatches else ''}.")
+        if mismatches and not repair:
+            raise SystemExit(1)
+
+    @app.cli.command("check-karma")
+    @click.option("--rebuild", is_flag=True, help="Recompute the karma of every user from the ledger.")
+    def check_karma_command(rebuild):
+        """Verify the cached karma of every user against the karma ledger."""
+        mismatches = check_karma()
+        for user_id, cached, ledger in mismatches:
+            click.echo(f"User {user_id}: karma {cached}, ledger {ledger}")
+        if rebuild:
+            rebuild_karma()
+            db.session.commit()
+        click.echo(f"{len(mismatches)} mismatching users{' rebuilt' if rebuild and mismatches else ''}.")
+        if mismatches and not rebuild:
+            raise SystemExit(1)
+
+    @app.cli.command("replay-karma")
+    @click.argument("rules_file", type=click.File("r"), required=False)
+    @click.option("--since", type=click.DateTime(formats=["%Y-%m-%d"]), help="Only replay weeks from this date on.")
+    @click.option("--top", default=20, show_default=True, help="Number of users with the largest difference to list.")
+    @click.option("--trajectories", is_flag=True, help="Include every user's weekly karma in the report.")
+    @click.option("--full-history", is_flag=True,
+                  help="Replay every week with assignments from the starting karma, not only the weeks in the ledger.")
+    @click.option("--output", type=click.File("w"), default="-", help="Where to write the JSON report.")
+    def replay_karma_command(rules_file, since, top, trajectories, full_history, output):
+        """
+        Replay the settled weeks under the rules of RULES_FILE (JSON, default: current rules).
+
+        Only the weeks in the karma ledger are replayed; the weeks before it were folded into an
+        opening balance when the ledger was introduced. --full-history replays every week with
+        assignments instead, starting from the starting karma and dropping manual karma events.
+        """
+        if full_history and since:
+            raise click.UsageError("--full-history replays every week and cannot be combined with --since.")
+        rules = KarmaRules.from_dict(json.load(rules_file)) if rules_file else KarmaRules()
+        report = karma_replay_report(
+            rules, since=since and since.date(), top=top, trajectories=trajectories, full_history=full_history,
+        )
+        if report["meta"]["warning"]:
+            click.echo(f"Warning: {report['meta']['warning']}", err=True)
+        json.dump(report, output, indent=2)
+        output.write("\n")
+
+
     # --- Cronjobs ---   
     a_d, a_h = config['TIMING']['assignment_day'].split("@")
     r_d, r_h = config['TIMING']['release_day'].split("@")
@@ -160,6 +224,11 @@ def create_app(config_file=None):
             app.logger.info("--- Triggering scheduled 'release assignment' job ---")
             release_assignments()
 
+    @ap_scheduler.task('interval', id='refresh_characters', minutes=30)
+    def cron_refresh_characters():
+        with app.app_context():
+            refresh_stale_characters()
+
     @ap_scheduler.task('cron', id='deadline_nudge', day_of_week=a_d, hour=int(a_h)-4)
     def cron_deadline_nudge():
         with app.app_context():
@@ -1,5 +1,6 @@
 from flask_smorest import Blueprint, abort
-from marshmallow import validates_schema, ValidationError
+from marshmallow import validates_schema, ValidationError, validate
+from webargs.fields import DelimitedList
 from flask_login import (
     current_user,
     login_required,
@@ -13,16 +14,25 @@ from flask import (
     url_for, 
     redirect,
     jsonify, 
-    g 
+    g,
+    stream_with_context,
     )
 from sqlalchemy import text, delete
-from sqlalchemy.orm import joinedload
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError, MultipleResultsFound
+import functools
+import hashlib
 import json
 import requests
 
-from .models import db, User, Adventure, Assignment, AdventureRequestedPlayer, FCMToken
+from .models import db, User, Adventure, Assignment, AdventureRequestedPlayer, AssignmentRun, FCMToken
 from .util import *
+from .assignment import MAX_CANDIDATES
+from .board import cached_week_board, invalidate_week_board, load_board_adventure, week_adventure_dates
+from .serializers import BoardSerializer, RowSerializer, UserSignupsSerializer, compile_rows, dumps, render_week_board
+from .versions import bump_version, end_read_snapshot, etag_header, make_etag, not_modified, version_stamps, week_version
+from .characters import character_summary
+from .live import board_publisher, live_config, stream_week
+from .karma import karma_history, karma_rank, leaderboard_page
 from .provider import ma, ap_scheduler
 from firebase_admin import messaging
 
@@ -40,7 +50,11 @@ blp_users = Blueprint("users", "users", url_prefix="/api/users",
 # 1. Define the Blueprint for Notifications
 blp_notifications = Blueprint("notifications", "notifications", url_prefix="/api/notifications",
                description="FCM Operations: Saving tokens and triggering test pushes.")
-api_blueprints = [blp_utils, blp_users, blp_adventures, blp_assignments, blp_signups, blp_notifications]
+blp_characters = Blueprint("characters", "characters", url_prefix="/api/characters",
+               description="Characters API: The D&D Beyond characters of the users, from the server-side cache.")
+blp_stream = Blueprint("stream", "stream", url_prefix="/api/stream",
+               description="Stream API: Server-Sent Events with live changes of the board.")
+api_blueprints = [blp_utils, blp_users, blp_adventures, blp_assignments, blp_signups, blp_characters, blp_stream, blp_notifications]
 
 # ----------------------- Schemas ---------------------------------
 
@@ -58,10 +72,108 @@ class MessageSchema(ma.Schema):
 class AdminActionSchema(ma.Schema):
     action = ma.String(required=True)
     date = ma.Date(allow_none=True, required=False)
+    mode = ma.String(required=False, validate=validate.OneOf(list(SOLVERS))) # solver used by the `assign` action
+    seed = ma.Integer(required=False) # tie-break seed of `assign` and `reassign`, defaults to one per week
+    candidates = ma.Integer(required=False, validate=validate.Range(min=1, max=MAX_CANDIDATES)) # seeds tried by `assign`
 
 class DateSchema(ma.Schema):
     date = ma.Date(allow_none=True)
 
+class AssignmentPreviewQuerySchema(DateSchema):
+    mode = ma.String(required=False, validate=validate.OneOf(list(SOLVERS)))
+    seed = ma.Integer(required=False)
+    candidates = ma.Integer(required=False, validate=validate.Range(min=1, max=MAX_CANDIDATES))
+
+class PreviewPlayerSchema(ma.Schema):
+    id = ma.Integer()
+    display_name = ma.String()
+    preference_place = ma.Integer(allow_none=True)
+
+class PreviewAdventureSchema(ma.Schema):
+    id = ma.Integer()
+    title = ma.String()
+    room = ma.String(allow_none=True)
+    max_players = ma.Integer()
+    already_assigned = ma.Integer()
+    players = ma.List(ma.Nested(PreviewPlayerSchema))
+
+class PreviewUnroomedSchema(ma.Schema):
+    id = ma.Integer()
+    title = ma.String()
+    players = ma.Integer()
+    reason = ma.String()
+
+class PreviewRoundSchema(ma.Schema):
+    round = ma.Integer()
+    assigned = ma.Integer()
+    players = ma.List(ma.String())
+
+class AssignmentPreviewSchema(ma.Schema):
+    week_start = ma.Date()
+    week_end = ma.Date()
+    statistics = ma.Dict()
+    rounds = ma.List(ma.Nested(PreviewRoundSchema))
+    adventures = ma.List(ma.Nested(PreviewAdventureSchema))
+    waiting_list = ma.List(ma.Nested(PreviewPlayerSchema))
+    unroomed = ma.List(ma.Nested(PreviewUnroomedSchema))
+
+class AssignmentRunQuerySchema(ma.Schema):
+    week_start = ma.Date(required=False)
+    limit = ma.Integer(load_default=20, validate=validate.Range(min=1, max=100))
+
+class AssignmentRunSummarySchema(ma.Schema):
+    id = ma.Integer()
+    created_at = ma.DateTime()
+    week_start = ma.Date()
+    mode = ma.String()
+    seed = ma.Integer()
+    inputs_hash = ma.String()
+    statistics = ma.Dict()
+    timings = ma.Dict()
+
+class AssignmentRunDecisionSchema(ma.Schema):
+    user_id = ma.Integer()
+    display_name = ma.String(allow_none=True)
+    adventure_id = ma.Integer(allow_none=True)
+    adventure_title = ma.String(allow_none=True)
+    preference_place = ma.Integer(allow_none=True)
+
+class AssignmentRunRoundSchema(ma.Schema):
+    round = ma.Integer()
+    decisions = ma.List(ma.Nested(AssignmentRunDecisionSchema))
+
+class AssignmentRunSchema(AssignmentRunSummarySchema):
+    rounds = ma.List(ma.Nested(AssignmentRunRoundSchema))
+
+class KarmaHistoryQuerySchema(ma.Schema):
+    limit = ma.Integer(load_default=52, validate=validate.Range(min=1, max=520))
+
+class KarmaWeekSchema(ma.Schema):
+    week_start = ma.Date()
+    points = ma.Integer()
+    balance = ma.Integer()
+    breakdown = ma.Dict(keys=ma.String(), values=ma.Integer())
+
+class KarmaHistorySchema(ma.Schema):
+    user_id = ma.Integer()
+    karma = ma.Integer(allow_none=True)
+    rank = ma.Integer(allow_none=True)
+    weeks = ma.List(ma.Nested(KarmaWeekSchema))
+
+class LeaderboardQuerySchema(ma.Schema):
+    limit = ma.Integer(load_default=50, validate=validate.Range(min=1, max=200))
+    cursor = ma.String(required=False)
+
+class LeaderboardEntrySchema(ma.Schema):
+    rank = ma.Integer()
+    user_id = ma.Integer()
+    display_name = ma.String(allow_none=True)
+    karma = ma.Integer()
+
+class LeaderboardSchema(ma.Schema):
+    entries = ma.List(ma.Nested(LeaderboardEntrySchema))
+    next_cursor = ma.String(allow_none=True)
+
 class JobSchema(ma.Schema):
     id = ma.Str(required=True)
     name = ma.Str(required=True)
@@ -89,6 +201,15 @@ class UserSchema(ma.SQLAlchemyAutoSchema):
         # Exclude the database `name` field
         exclude = ("name","google_id","email")
 
+USER_LIST_FIELDS = list(UserSchema(exclude=['karma']).dump_fields)
+MAX_USERS_PAGE = 500
+
+class UsersQuerySchema(ma.Schema):
+    columns = DelimitedList(ma.String(validate=validate.OneOf(USER_LIST_FIELDS)), data_key="fields", required=False)
+    ids = DelimitedList(ma.Integer(), validate=validate.Length(min=1, max=MAX_USERS_PAGE), required=False)
+    after = ma.Integer(required=False)
+    limit = ma.Integer(required=False, validate=validate.Range(min=1, max=MAX_USERS_PAGE))
+
 class SignupUserSchema(ma.SQLAlchemyAutoSchema):
     class Meta:
         model = Signup
@@ -149,6 +270,19 @@ class AdventureQuerySchema(ma.Schema):
         if sd and ed and sd > ed:
             raise ValidationError("week_start must be <= week_end.")
         
+class WeekSignupSchema(ma.Schema):
+    adventure_id = ma.Integer(required=True)
+    priority = ma.Integer(required=True, validate=validate.Range(min=1, max=3))
+
+class WeekSignupsSchema(ma.Schema):
+    signups = ma.List(ma.Nested(WeekSignupSchema), required=True)
+
+    @validates_schema
+    def validate_adventures(self, data, **kwargs):
+        adventure_ids = [signup["adventure_id"] for signup in data["signups"]]
+        if len(set(adventure_ids)) != len(adventure_ids):
+            raise ValidationError("An adventure can only have one priority.", "signups")
+
 class AssignmentSchema(ma.SQLAlchemyAutoSchema):
     class Meta:
         model = Assignment
@@ -167,6 +301,24 @@ class AssignmentUpdateSchema(ma.Schema):
     adventure_id = ma.Integer(required=True)
     appeared = ma.Boolean(required=True)
 
+class AttendancePlayerSchema(ma.Schema):
+    user_id = ma.Integer(required=True)
+    appeared = ma.Boolean(required=True)
+
+class AttendanceAdventureSchema(ma.Schema):
+    adventure_id = ma.Integer(required=True)
+    players = ma.List(ma.Nested(AttendancePlayerSchema), required=True)
+
+class AttendanceSheetSchema(ma.Schema):
+    """The attendance of any number of adventures, e.g. the whole sheet of a week."""
+    adventures = ma.List(ma.Nested(AttendanceAdventureSchema), required=True)
+
+    @validates_schema
+    def validate_unique(self, data, **kwargs):
+        pairs = [(a["adventure_id"], p["user_id"]) for a in data["adventures"] for p in a["players"]]
+        if len(set(pairs)) != len(pairs):
+            raise ValidationError("A player can only be marked once per adventure.", "adventures")
+
 class AssignmentDeleteSchema(ma.Schema):
     adventure_id = ma.Integer(required=True)
     user_id = ma.Integer(required=False)  # Optional: for admins to specify which user's assignment to delete
@@ -192,6 +344,10 @@ class AdventureSchema(ma.SQLAlchemyAutoSchema):
     # allow creator to be set during creation
     creator = ma.Nested(UserSchema, dump_only=True)
 
+    # seat counters are maintained by the assignment code paths only
+    assigned_count = ma.Integer(dump_only=True)
+    open_seats = ma.Integer(dump_only=True)
+
     class Meta:
         model = Adventure
         include_fk = True
@@ -210,6 +366,23 @@ class AdventureSchema(ma.SQLAlchemyAutoSchema):
         
 
 
+# Precompiled serializers of the hot read endpoints, one per visibility class (see app/serializers.py)
+PLAYER_BOARD_EXCLUDE = ["assignments.user.karma", "creator.karma", "signups"]
+BOARD_SERIALIZERS = {
+    "admin": BoardSerializer(AdventureSchema()),
+    "released": BoardSerializer(AdventureSchema(exclude=PLAYER_BOARD_EXCLUDE)),
+    "unreleased": BoardSerializer(AdventureSchema(exclude=PLAYER_BOARD_EXCLUDE + ["assignments"])),
+}
+@functools.lru_cache(maxsize=64)
+def user_list_serializer(columns=None) -> RowSerializer:
+    """`/api/users` with only `columns` (all public fields if None)."""
+    return compile_rows(UserSchema(exclude=['karma'], only=columns), User)
+
+USER_SIGNUPS_SERIALIZERS = {
+    "admin": UserSignupsSerializer(UserWithSignupsSchema()),
+    "player": UserSignupsSerializer(UserWithSignupsSchema(exclude=["privilege_level", "email", "signups", "karma"])),
+}
+
 class ConflictResponseSchema(ma.Schema):
     message = ma.Str(required=True)
     mis_assignments = ma.List(ma.Integer(), required=True)
@@ -390,6 +563,7 @@ class CallbackResource(MethodView):
                 profile_pic=picture)
             db.session.add(new_user)
             db.session.commit()
+            bump_version("users")
             user = new_user
 
         login_user(user)
@@ -417,34 +591,58 @@ class LockoutResource(MethodView):
 # --- USERS ---
 @blp_users.route("")
 class UsersListResource(MethodView):
+    @blp_users.arguments(UsersQuerySchema, location="query")
     @blp_users.response(200, UserSchema(many=True, exclude=['karma']))
-    def get(self):
+    def get(self, args):
         """
-        Return list of all users. 
+        Return list of users, ordered by id.
         
         Excludes karma.
         Only non-sensitive fields are included by default. 
         If you are not an admin.
+        `fields=display_name,dnd_beyond_name` selects only those fields (in SQL as well),
+        `ids=1,2,3` returns only those users. With `limit` one page is returned; the
+        `X-Next-Cursor` header then holds the `after` value of the next page.
+        Answers `If-None-Match` with 304 while no user was added or changed.
         """
-        try:        
-            return db.session.execute(db.select(User)).scalars().all()
+        etag = make_etag("users", version_stamps().stamp("users"), hashlib.blake2b(request.query_string, digest_size=8).hexdigest())
+        response = not_modified(etag)
+        if response is not None:
+            return response
+        end_read_snapshot()
+        try:
+            serializer = user_list_serializer(tuple(args['columns']) if args.get('columns') else None)
+            stmt = db.select(User.id, *serializer.columns).order_by(User.id)
+            if args.get('ids'):
+                stmt = stmt.where(User.id.in_(args['ids']))
+            if args.get('after') is not None:
+                stmt = stmt.where(User.id > args['after'])
+            if args.get('limit'):
+                stmt = stmt.limit(args['limit'] + 1)
+            rows = db.session.execute(stmt).all()
         except SQLAlchemyError as e:
             abort(500, message=f"Database error: {str(e)}")
 
+        headers = etag_header(etag)
+        if args.get('limit') and len(rows) > args['limit']:
+            rows = rows[:args['limit']]
+            headers["X-Next-Cursor"] = str(rows[-1].id)
+        body = dumps([serializer.dict(row[1:]) for row in rows])
+        return current_app.response_class(body, mimetype="application/json", headers=headers)
+
 @blp_users.route("/signups/<string:day>")
 class UsersListSignupsResource(MethodView):
     @blp_users.response(200)
     def get(self, day):
         """
-        Return list of all users. 
+        Return the users with signups in the upcoming week of `day` (0 for today), ordered by id.
         
         Excludes karma.
         Only non-sensitive fields are included by default. 
-        If you are not an admin.
+        If you are not an admin, the signups are left out as well.
+        The array is streamed, so the response time follows the week's signups, not the number of users.
         """
-        exclude = []
-        if not is_admin(current_user):
-            exclude=["privilege_level", "email", "signups", "karma"]
+        user_is_admin = is_admin(current_user)
         try:
             today = date.today()
             # If day is provided and valid, use it instead of today
@@ -455,21 +653,20 @@ class UsersListSignupsResource(MethodView):
                     abort(400, message="Invalid date format. Use YYYY-MM-DD.")
 
             start_of_week, end_of_week = get_upcoming_week(today)
-            stmt = (
-                    db.select(User)
-                    .options(
-                        joinedload(User.signups),  # type: ignore
-                        db.with_loader_criteria(
-                            Signup,
-                            Signup.adventure_date.between(start_of_week, end_of_week),
-                            include_aliases=True
-                        )
-                    )
-
-                )
-            users = db.session.execute(stmt).unique().scalars().all()
-        
-            return UserWithSignupsSchema(many=True, exclude=exclude).dump(users)
+            # signups and adventures of the week are stamped with the admin board of the week
+            etag = make_etag(
+                "user-signups", start_of_week, user_is_admin,
+                version_stamps().stamp("users"), week_version(start_of_week, end_of_week, "admin"),
+            )
+            response = not_modified(etag)
+            if response is not None:
+                return response
+            end_read_snapshot()
+            serializer = USER_SIGNUPS_SERIALIZERS["admin" if user_is_admin else "player"]
+            return current_app.response_class(
+                stream_with_context(serializer.stream(start_of_week, end_of_week)),
+                mimetype="application/json", headers=etag_header(etag),
+            )
         except SQLAlchemyError as e:
             abort(500, message=f"Database error: {str(e)}")
 
@@ -501,6 +698,8 @@ class UserResource(MethodView):
                     setattr(user, key, val)
 
             db.session.commit()
+            bump_version("users")
+            invalidate_week_board() # names are shown on every board
             return user
 
         except IntegrityError as e:
@@ -514,6 +713,60 @@ class UserResource(MethodView):
     
     
 
+@blp_users.route("/<int:user_id>/karma-history")
+class UserKarmaHistoryResource(MethodView):
+    @login_required
+    @blp_users.arguments(KarmaHistoryQuerySchema, location="query")
+    @blp_users.response(200, KarmaHistorySchema)
+    def get(self, args, user_id):
+        """
+        Return a user's karma week by week, newest first, with the balance after each week
+        and the points per rule. Only for the user themself and admins.
+        """
+        if not is_admin(current_user) and current_user.id != user_id:
+            abort(401, message="Unauthorized")
+        try:
+            karma = db.session.scalar(db.select(User.karma).where(User.id == user_id))
+            if karma is None and db.session.get(User, user_id) is None:
+                abort(404, message="User not found")
+            return {
+                "user_id": user_id,
+                "karma": karma,
+                "rank": karma_rank(karma),
+                "weeks": karma_history(user_id, args['limit']),
+            }
+        except SQLAlchemyError as e:
+            abort(500, message=f"Database error: {str(e)}")
+
+@blp_users.route("/leaderboard")
+class LeaderboardResource(MethodView):
+    @login_required
+    @blp_users.arguments(LeaderboardQuerySchema, location="query")
+    @blp_users.response(200, LeaderboardSchema)
+    def get(self, args):
+        """
+        Return users ranked by karma, one page at a time.
+        Pass the `next_cursor` of a page as `cursor` to get the next one.
+        """
+        if not is_admin(current_user):
+            abort(401, message="Unauthorized")
+        after = None
+        if args.get('cursor'):
+            try:
+                after = tuple(int(part) for part in args['cursor'].split(":"))
+            except ValueError:
+                after = ()
+            if len(after) != 4:
+                abort(400, message="Invalid cursor.")
+        try:
+            entries, next_cursor = leaderboard_page(args['limit'], after)
+        except SQLAlchemyError as e:
+            abort(500, message=f"Database error: {str(e)}")
+        return {
+            "entries": entries,
+            "next_cursor": ":".join(str(part) for part in next_cursor) if next_cursor else None,
+        }
+
 @blp_users.route("/me")
 class MeResource(MethodView):
     @login_required
@@ -533,37 +786,24 @@ class AdventureIDlessRequest(MethodView):
         Returns a list of Adventure objects within the specified date range. 
         
         The field `players` will be present only when the requester is allowed (privilege level or over release date).
+        The serialized board is cached per date range and audience until a write touches those dates.
         """
         try:
-            week_start = args.get("week_start")
-            week_end = args.get("week_end")
-
-            # Eager-load assignments -> user to avoid N+1 queries
-            stmt = db.select(Adventure).options(
-                joinedload(Adventure.assignments).joinedload(Assignment.user)  # type: ignore
-            ).order_by(Adventure.date)
-
-
-            if week_start and week_end:
-                stmt = db.select(Adventure).where(
-                    Adventure.date <= week_end,
-                    Adventure.date >= week_start
-                )
-
-            adventures = db.session.scalars(stmt).all()
-
             # Determine display rights
             user_is_admin = is_admin(current_user)
-            display_players = user_is_admin or check_release(adventures) # check for last one cause handling separately is annoying
-            exclude = []
-            if not user_is_admin:
-                exclude = ["assignments.user.karma", "signups"]
-                pass
-            if not display_players:
-                exclude = exclude + ["assignments"]
-                pass
-            
-            return AdventureSchema(many=True, exclude=exclude).dump(adventures)
+            week_start, week_end = args.get("week_start"), args.get("week_end")
+            audience = "admin" if user_is_admin else "player"
+            etag = make_etag("board", audience, week_start, week_end, week_version(week_start, week_end, audience))
+            response = not_modified(etag)
+            if response is not None:
+                return response
+            end_read_snapshot()
+
+            board = cached_week_board(
+                week_start, week_end, audience,
+                lambda: render_week_board(BOARD_SERIALIZERS, week_start, week_end, user_is_admin),
+            )
+            return current_app.response_class(board, mimetype="application/json", headers=etag_header(etag))
 
         except ValidationError as ve:
             abort(400, message=str(ve))
@@ -608,6 +848,7 @@ class AdventureIDlessRequest(MethodView):
                     pass
 
             db.session.commit()
+            invalidate_week_board(args["date"], args["date"] + timedelta(weeks=args.get("num_sessions", 1) - 1))
             all_tokens = [t.token for t in FCMToken.query.all()]
             if all_tokens:
                 message = messaging.MulticastMessage(
@@ -645,21 +886,14 @@ class AdventureResource(MethodView):
         The field `players` will be present only when the requester is allowed (privilege level or `check_release()`).
         """
         try:
-            # Eager-load assignments -> user to avoid N+1 queries
-            stmt = db.select(Adventure).options(
-                joinedload(Adventure.assignments).joinedload(Assignment.user)  # type: ignore
-            )
-
-            stmt = db.select(Adventure).where(Adventure.id == int(adventure_id))
-
-            adventures = db.session.scalars(stmt).all()
-
             # Determine display rights
             user_is_admin = is_admin(current_user)
+            adventures = load_board_adventure(int(adventure_id), include_signups=user_is_admin)
+
             display_players = user_is_admin or check_release(adventures)
             exclude = []
             if not user_is_admin:
-                exclude = ["assignments.user.karma", "signups"]
+                exclude = list(PLAYER_BOARD_EXCLUDE)
                 pass
             if not display_players:
                 exclude = exclude + ["assignments"]
@@ -690,6 +924,7 @@ class AdventureResource(MethodView):
         # Ownership or admin check
         if not is_admin(current_user) and adventure.user_id != user_id:
             abort(401, message="Unauthorized to edit this adventure.")
+        old_date = adventure.date
             
 
         # Update provided fields
@@ -733,6 +968,8 @@ class AdventureResource(MethodView):
         except Exception as e:
             db.session.rollback()
             abort(500, message=str(e))
+        invalidate_week_board(old_date)
+        invalidate_week_board(adventure.date)
 
         return {"message": "Adventure updated successfully"}
     
@@ -756,7 +993,10 @@ class AdventureResource(MethodView):
             if not is_admin(current_user) and adventure.user_id != user_id:
                 abort(401, message={'error': 'Unauthorized to delete this adventure'})
 
-             # Clear predecessor references in other adventures
+             # Clear predecessor references in other adventures, which can be in other weeks
+            successor_dates = set(db.session.scalars(
+                db.select(Adventure.date).where(Adventure.predecessor_id == adventure_id)
+            ))
             db.session.execute(
                 db.update(Adventure).
                 where(Adventure.predecessor_id == adventure_id).
@@ -774,8 +1014,13 @@ class AdventureResource(MethodView):
             )
 
             # Delete the adventure itself
+            adventure_date = adventure.date
             db.session.delete(adventure)
             db.session.commit()
+            bump_version("signups")
+            invalidate_week_board(adventure_date)
+            for successor_date in successor_dates:
+                invalidate_week_board(successor_date)
 
             return {'message': f'Adventure {adventure_id} and all relations deleted successfully'}
 
@@ -828,10 +1073,13 @@ class AssignmentResource(MethodView):
         elif action == "reset":
             reset_release(today)
         elif action == "assign":
-            assign_rooms_to_adventures(today)
-            assign_players_to_adventures(today) 
+            statistics = assign_players_to_adventures(
+                today, mode=args.get('mode'), seed=args.get('seed'), candidates=args.get('candidates')
+            )
+            rooms = assign_rooms_to_adventures(today, seed=args.get('seed')) # sized by the new rosters
+            return {'message': f'Assign action executed successfully for {today}: {statistics}, adventures without a room: {rooms.unroomed}'}, 200
         elif action == "reassign":
-            reassign_players_from_waiting_list(today)
+            reassign_players_from_waiting_list(today, seed=args.get('seed'))
         elif action == "karma":
             reassign_karma(today)
         else:
@@ -871,8 +1119,10 @@ class AssignmentResource(MethodView):
 
         # Update the value
         assignment.appeared = new_value
+        adventure_date = assignment.adventure.date
         try:
             db.session.commit()
+            invalidate_week_board(adventure_date)
 
             return {'message': 'Assignment updated successfully'}, 200
 
@@ -903,12 +1153,17 @@ class AssignmentResource(MethodView):
         if not assignment:
             abort(404, message="Assignment not found")
 
+        from_date = assignment.adventure.date
         assignment.adventure_id = to_adventure_id
         try:
             db.session.commit()
         except Exception as e:
             db.session.rollback()
             abort(400, message=str(e))
+        invalidate_week_board(from_date)
+        to_adventure = db.session.get(Adventure, to_adventure_id)
+        if to_adventure is not None:
+            invalidate_week_board(to_adventure.date)
 
         return {'message': 'Assignment updated successfully'}, 200
     
@@ -953,6 +1208,7 @@ class AssignmentResource(MethodView):
 
 
         # Delete assignments related to this adventure
+        adventure_date = assignment.adventure.date
         db.session.delete(assignment)
 
         # Punish the player if not canceled by admin
@@ -965,10 +1221,120 @@ class AssignmentResource(MethodView):
         except Exception as e:
             db.session.rollback()
             abort(400, message=str(e))
+        invalidate_week_board(adventure_date)
+
+        # Hand the freed seat to the waiting list right away; the cancellation itself is already stored
+        if current_app.config.get("ASSIGNMENT", {}).get("backfill_on_cancel", True):
+            try:
+                backfill_freed_seats(adventure_id)
+            except SQLAlchemyError as e:
+                current_app.logger.error("Backfill of adventure %s failed: %s", adventure_id, e)
 
         return {'message': 'Assignment updated successfully'}, 200
 
+@blp_assignments.route('/attendance')
+class AttendanceResource(MethodView):
+    @login_required
+    @blp_assignments.arguments(AttendanceSheetSchema)
+    @blp_assignments.response(200, MessageSchema)
+    def post(self, args):
+        """
+        Updates the 'appeared' value of many assignments at once, e.g. the whole sheet of a week.
+        Expects JSON body: { "adventures": [{ "adventure_id": int, "players": [{ "user_id": int, "appeared": bool }] }] }
+        All assignments must exist; they are updated in one transaction or not at all.
+        """
+        if current_user.privilege_level < 1: # Is semi admin (only allowed to watch if players appear)
+            return abort(401, message={'error': 'Unauthorized'})
+
+        rows = [
+            {"adventure_id": adventure["adventure_id"], "user_id": player["user_id"], "appeared": player["appeared"]}
+            for adventure in args["adventures"] for player in adventure["players"]
+        ]
+        if not rows:
+            return {'message': 'No assignments to update'}, 200
+
+        try:
+            existing = db.session.execute(
+                db.select(Assignment.adventure_id, Assignment.user_id, Adventure.date)
+                .join(Adventure, Adventure.id == Assignment.adventure_id)
+                .where(Assignment.adventure_id.in_({row["adventure_id"] for row in rows}))
+            ).all()
+            dates = {(adventure_id, user_id): day for adventure_id, user_id, day in existing}
+            missing = [(row["adventure_id"], row["user_id"]) for row in rows if (row["adventure_id"], row["user_id"]) not in dates]
+            if missing:
+                return abort(404, message={'error': f'Assignments not found (adventure_id, user_id): {missing}'})
+
+            db.session.execute(db.update(Assignment), rows) # executemany by primary key
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            return abort(500, message={'error': str(e)})
+
+        days = [dates[row["adventure_id"], row["user_id"]] for row in rows]
+        invalidate_week_board(min(days), max(days))
+        return {'message': f'{len(rows)} assignments updated successfully'}, 200
+
+@blp_assignments.route('/preview')
+class AssignmentPreviewResource(MethodView):
+    @login_required
+    @blp_assignments.arguments(AssignmentPreviewQuerySchema, location="query")
+    @blp_assignments.response(200, AssignmentPreviewSchema)
+    def get(self, args):
+        """
+        Dry run of the `assign` admin action. Returns the proposed rosters, rooms and
+        per-round statistics for the upcoming week without writing anything.
+        """
+        if not is_admin(current_user):
+            abort(401, message="Unauthorized")
+        try:
+            return preview_assignments(
+                args.get('date') or date.today(),
+                mode=args.get('mode'), seed=args.get('seed'), candidates=args.get('candidates'),
+            )
+        except SQLAlchemyError as e:
+            abort(500, message=f"Database error: {str(e)}")
+
+@blp_assignments.route('/runs')
+class AssignmentRunsResource(MethodView):
+    @login_required
+    @blp_assignments.arguments(AssignmentRunQuerySchema, location="query")
+    @blp_assignments.response(200, AssignmentRunSummarySchema(many=True))
+    def get(self, args):
+        """
+        Lists the most recent assignment runs, optionally of one week only.
+        """
+        if not is_admin(current_user):
+            abort(401, message="Unauthorized")
+        query = db.select(AssignmentRun).order_by(AssignmentRun.id.desc()).limit(args['limit'])
+        if args.get('week_start'):
+            query = query.where(AssignmentRun.week_start == args['week_start'])
+        return db.session.execute(query).scalars().all()
+
+@blp_assignments.route('/runs/<int:run_id>')
+class AssignmentRunResource(MethodView):
+    @login_required
+    @blp_assignments.response(200, AssignmentRunSchema)
+    def get(self, run_id):
+        """
+        Returns one assignment run with every decision per round.
+        """
+        if not is_admin(current_user):
+            abort(401, message="Unauthorized")
+        run = get_assignment_run(run_id)
+        if run is None:
+            abort(404, message="Assignment run not found")
+        return run
+
 # --- SIGNUP ---
+def parse_week(week):
+    """Monday and Sunday of the week of `week`, a day of it as YYYY-MM-DD or 0 for the upcoming week."""
+    if week == "0":
+        return get_upcoming_week()
+    try:
+        return get_this_week(date.fromisoformat(week))
+    except ValueError:
+        abort(400, message="Invalid date format. Use YYYY-MM-DD.")
+
 @blp_signups.route('')
 class SignupResource(MethodView):
     @login_required
@@ -979,11 +1345,16 @@ class SignupResource(MethodView):
         """
         if current_user.is_anonymous: # User is not signed in
             abort(401, message="Unauthorized")
+        etag = make_etag("signups", current_user.id, version_stamps().stamp("signups", "users")) # signups nest their user
+        response = not_modified(etag)
+        if response is not None:
+            return response
+        end_read_snapshot()
 
         try:
             stmt = db.select(Signup).where(Signup.user_id == current_user.id)
             signups = db.session.scalars(stmt).all()
-            return signups
+            return signups, 200, etag_header(etag)
 
         except SQLAlchemyError as e:
             abort(500, message=f"Database error: {str(e)}")
@@ -1052,6 +1423,8 @@ class SignupResource(MethodView):
                 message = 'Signup registered'
 
             db.session.commit()
+            bump_version("signups")
+            invalidate_week_board(adventure_date, audience="admin") # only admins see signups
             return {"message": message}, 200
 
         except SQLAlchemyError as e:
@@ -1061,6 +1434,109 @@ class SignupResource(MethodView):
         except Exception as e:
             abort(500, message=str(e))
 
+@blp_signups.route('/week/<string:week>')
+class WeekSignupsResource(MethodView):
+    @login_required
+    @blp_signups.arguments(WeekSignupsSchema())
+    @blp_signups.response(200, WeekSignupSchema(many=True))
+    def put(self, args, week):
+        """
+        Replaces all signups (priority medals 1, 2, 3) of the authenticated user in the week of `week`
+        (any day of it, 0 for the upcoming week) with `signups`, in one transaction.
+
+        Only the signups that differ are deleted and inserted. Returns the resulting signups of the week.
+        """
+        start_of_week, end_of_week = parse_week(week)
+        user_id = current_user.id
+        dates = week_adventure_dates(start_of_week, end_of_week)
+        desired = {}
+        for signup in args["signups"]:
+            if signup["adventure_id"] not in dates:
+                abort(400, message=f"Adventure {signup['adventure_id']} is not in the week of {start_of_week}.")
+            desired[signup["adventure_id"]] = signup["priority"]
+        if len({(dates[adventure_id], priority) for adventure_id, priority in desired.items()}) != len(desired):
+            abort(400, message="A priority can only be used once per day.")
+
+        try:
+            existing = db.session.execute(
+                db.select(Signup.id, Signup.adventure_id, Signup.priority)
+                .where(Signup.user_id == user_id, Signup.adventure_date.between(start_of_week, end_of_week))
+            ).all()
+            stale = [row.id for row in existing if desired.get(row.adventure_id) != row.priority]
+            kept = {(row.adventure_id, row.priority) for row in existing}
+            new = [
+                {"user_id": user_id, "adventure_id": adventure_id, "priority": priority, "adventure_date": dates[adventure_id]}
+                for adventure_id, priority in desired.items() if (adventure_id, priority) not in kept
+            ]
+            if stale:
+                db.session.execute(delete(Signup).where(Signup.id.in_(stale)))
+            if new:
+                db.session.execute(db.insert(Signup), new)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            abort(409, message="The signups changed concurrently, please retry.")
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            abort(500, message=f"Database error: {str(e)}")
+
+        if stale or new:
+            bump_version("signups")
+            invalidate_week_board(start_of_week, end_of_week, audience="admin") # only admins see signups
+        return sorted(
+            ({"adventure_id": adventure_id, "priority": priority} for adventure_id, priority in desired.items()),
+            key=lambda signup: (dates[signup["adventure_id"]], signup["priority"]),
+        )
+
+# --- CHARACTERS ---
+@blp_characters.route("/summary")
+class CharacterSummaryResource(MethodView):
+    @blp_characters.response(200)
+    def get(self):
+        """
+        Returns the D&D Beyond characters of all users as `{character id: character}`.
+
+        Served from the server-side cache only; stale entries are refreshed by a background job,
+        so a change on D&D Beyond shows up within an hour or so.
+        """
+        try:
+            etag = make_etag("characters", version_stamps().stamp("characters", "users"))
+            response = not_modified(etag)
+            if response is not None:
+                return response
+            end_read_snapshot()
+            return character_summary(), 200, etag_header(etag)
+        except SQLAlchemyError as e:
+            abort(500, message=f"Database error: {str(e)}")
+
+# --- STREAM ---
+@blp_stream.route("/week/<string:week>")
+class WeekStreamResource(MethodView):
+    @blp_stream.response(200)
+    def get(self, week):
+        """
+        Server-Sent Events with the live changes of the week of `week` (any day of it, 0 for the upcoming week).
+
+        Starts with a `snapshot` event of the week's adventures: title, seats, room, signup count and,
+        for admins or once the week is released, the roster. Every change is pushed as a `delta` event
+        with the `changed` entries and the `removed` adventure ids. Answers 503 when too many clients
+        are subscribed; poll the board instead.
+        """
+        week_start, _ = parse_week(week)
+        publisher = board_publisher()
+        subscriber = publisher.subscribe(
+            week_start, "admin" if is_admin(current_user) else "player", live_config("max_subscribers"),
+        )
+        if subscriber is None:
+            abort(503, message="Too many live subscribers, poll the board instead.", headers={"Retry-After": "60"})
+        body = stream_week(
+            publisher, subscriber,
+            live_config("keepalive_seconds"), live_config("stream_seconds"), live_config("retry_ms"),
+        )
+        return current_app.response_class(
+            body, mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
 # --- NOTIFICATIONS ---
 @blp_notifications.route("/save-token")
 class FCMSaveToken(MethodView):
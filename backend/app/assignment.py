@@ -0,0 +1,763 @@
+"""
+In-memory engine for the weekly player and room assignment.
+
+The week is loaded once into a read-only `WeekSnapshot` using a fixed number of
+queries, the assignment rounds run on plain python objects and the resulting
+`AssignmentPlan` is written back with a single bulk insert.
+"""
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from dataclasses import dataclass, field
+from datetime import date
+import hashlib
+import heapq
+
+from sqlalchemy import bindparam, func
+
+from .models import db, adjust_assigned_counts, User, Adventure, Assignment, Signup, AdventureRequestedPlayer
+
+MAX_PRIORITY = 3
+OUTSIDE_TOP_THREE = 4 # preference_place for players assigned outside their signups
+WAITING_LIST_ROUND = 5
+
+# Costs of the optimal solver, see `_AssignmentRun.optimal_signup_round`
+PREFERENCE_COSTS = {1: 0, 2: 1, 3: 2}
+UNPLACED_COST = 3
+UNPLACED = None # stands in for the adventure id of players the flow leaves unplaced
+SOURCE = "source"
+MAX_CANDIDATES = 64 # upper bound of seeds tried by one seed search
+
+
+def week_seed(start_of_week) -> int:
+    """Default seed of a week, so reruns on the same week give the same result."""
+    return int(start_of_week.strftime("%Y%m%d"))
+
+def tie_break(seed, *key) -> int:
+    """
+    Deterministic pseudo-random number for `key` under `seed`, used instead of `func.random()`.
+    The value of one key does not depend on any other key, so adding a player or adventure
+    does not reshuffle everybody else.
+    """
+    digest = hashlib.blake2b(repr((seed, *key)).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+@dataclass(frozen=True)
+class AdventureSlot:
+    id: int
+    title: str
+    max_players: int
+    predecessor_id: int | None
+    is_story_adventure: bool
+    is_waitinglist: int
+
+@dataclass(frozen=True)
+class PlayerEntry:
+    id: int
+    display_name: str
+    karma: int
+    monthly_signups: int
+    story_player: bool
+    signups: tuple # ((adventure_id, priority), ...) ordered by priority
+
+    def priority_for(self, adventure_id):
+        return next((prio for adv_id, prio in self.signups if adv_id == adventure_id), None)
+
+@dataclass(frozen=True)
+class WeekSnapshot:
+    """
+    Everything the assignment rounds need to know about one week.
+
+    The mappings are shared with every solver run and must be treated as read-only.
+    """
+    start_of_week: date
+    end_of_week: date
+    adventures: dict            # adventure_id -> AdventureSlot, every adventure of the week
+    taken: dict                 # adventure_id -> number of already existing assignments
+    players: tuple              # PlayerEntry of everyone signed up but not yet assigned, ordered by id
+    continuing_players: dict    # adventure_id -> frozenset of user ids assigned to its predecessor
+    requested_players: dict     # adventure_id -> frozenset of user ids requested by the DM
+
+    def playable_adventures(self):
+        """All adventures of the week except waiting lists, ordered by id."""
+        return [adv for adv in self.adventures.values() if adv.is_waitinglist == 0]
+
+    def fingerprint(self) -> str:
+        """Hash of all inputs of the assignment; equal snapshots give equal plans for the same seed."""
+        canonical = (
+            str(self.start_of_week),
+            str(self.end_of_week),
+            sorted(self.adventures.items()), # dataclass reprs list every field
+            sorted(self.taken.items()),
+            self.players,
+            sorted((k, sorted(v)) for k, v in self.continuing_players.items()),
+            sorted((k, sorted(v)) for k, v in self.requested_players.items()),
+        )
+        return hashlib.sha256(repr(canonical).encode()).hexdigest()
+
+@dataclass(frozen=True)
+class PlannedAssignment:
+    user_id: int
+    adventure_id: int
+    preference_place: int | None
+
+@dataclass
+class AssignmentPlan:
+    assignments: list = field(default_factory=list)     # PlannedAssignment, in the order they were made
+    waiting_list: list = field(default_factory=list)    # user ids that did not fit anywhere
+    rounds: list = field(default_factory=lambda: [[] for _ in range(WAITING_LIST_ROUND + 1)]) # user ids per round
+    taken: dict = field(default_factory=dict)           # adventure_id -> places taken after the run
+
+
+def load_week_snapshot(start_of_week, end_of_week, start_of_month, end_of_month) -> WeekSnapshot:
+    """
+    Load all data of the week needed to assign players in a fixed number of queries,
+    independent of the number of players and adventures.
+    """
+    in_week = (Adventure.date >= start_of_week, Adventure.date <= end_of_week)
+
+    adventure_rows = db.session.execute(
+        db.select(
+            Adventure.id,
+            Adventure.title,
+            Adventure.max_players,
+            Adventure.predecessor_id,
+            Adventure.is_story_adventure,
+            Adventure.is_waitinglist,
+            Adventure.assigned_count,
+        )
+        .where(*in_week)
+        .order_by(Adventure.id)
+    ).all()
+    adventures = {
+        row.id: AdventureSlot(
+            id=row.id,
+            title=row.title,
+            max_players=row.max_players,
+            predecessor_id=row.predecessor_id,
+            is_story_adventure=bool(row.is_story_adventure),
+            is_waitinglist=row.is_waitinglist,
+        )
+        for row in adventure_rows
+    }
+    taken = {row.id: row.assigned_count for row in adventure_rows if row.assigned_count}
+
+    # Subquery: get all assigned user ids this week
+    assigned_ids_subq = (
+        db.select(Assignment.user_id)
+        .join(Assignment.adventure)
+        .where(*in_week)
+    )
+
+    # Subquery: get number of signups per user this month
+    monthly_signup_count = (
+        db.select(func.count(Signup.id))
+        .join(Signup.adventure)
+        .where(
+            Signup.user_id == User.id,  # correlate to outer User
+            Adventure.date >= start_of_month,
+            Adventure.date <= end_of_month,
+        )
+        .correlate(User)
+        .scalar_subquery()
+    )
+
+    # Players signed up this week but not assigned yet, one row per signup
+    player_rows = db.session.execute(
+        db.select(
+            User.id,
+            User.display_name,
+            User.karma,
+            User.story_player,
+            monthly_signup_count.label("monthly_signups"),
+            Signup.adventure_id,
+            Signup.priority,
+        )
+        .join(User.signups)
+        .join(Signup.adventure)
+        .where(*in_week, ~User.id.in_(assigned_ids_subq))
+        .order_by(User.id, Signup.priority)
+    ).all()
+    players = []
+    for row in player_rows:
+        if not players or players[-1][0].id != row.id:
+            players.append((row, []))
+        players[-1][1].append((row.adventure_id, row.priority))
+
+    # Players assigned to the predecessor of an adventure of this week
+    continuing_players = defaultdict(set)
+    for adventure_id, user_id in db.session.execute(
+        db.select(Adventure.id, Assignment.user_id)
+        .join(Assignment, Assignment.adventure_id == Adventure.predecessor_id)
+        .where(*in_week)
+    ):
+        continuing_players[adventure_id].add(user_id)
+
+    requested_players = defaultdict(set)
+    for adventure_id, user_id in db.session.execute(
+        db.select(AdventureRequestedPlayer.adventure_id, AdventureRequestedPlayer.user_id)
+        .join(AdventureRequestedPlayer.adventure)
+        .where(*in_week)
+    ):
+        requested_players[adventure_id].add(user_id)
+
+    return WeekSnapshot(
+        start_of_week=start_of_week,
+        end_of_week=end_of_week,
+        adventures=adventures,
+        taken=taken,
+        players=tuple(
+            PlayerEntry(
+                id=row.id,
+                display_name=row.display_name,
+                karma=row.karma or 0,
+                monthly_signups=row.monthly_signups or 0,
+                story_player=bool(row.story_player),
+                signups=tuple(signups),
+            )
+            for row, signups in players
+        ),
+        continuing_players={k: frozenset(v) for k, v in continuing_players.items()},
+        requested_players={k: frozenset(v) for k, v in requested_players.items()},
+    )
+
+
+class _AssignmentRun:
+    """Mutable state of one solver run on a snapshot. The rounds are shared by all solver modes."""
+
+    def __init__(self, snapshot: WeekSnapshot, seed):
+        self.snapshot = snapshot
+        self.seed = seed
+        self.plan = AssignmentPlan()
+        self.taken = defaultdict(int, snapshot.taken)
+
+        # Rank players: 1. karma, 2. this month's signups number, 3. random
+        ranked = sorted(
+            snapshot.players,
+            key=lambda p: (-p.karma, -p.monthly_signups, tie_break(seed, "player", p.id)),
+        )
+        self.unassigned = {player.id: player for player in ranked} # keeps the ranking order
+
+    def free_places(self, adventure_id):
+        adventure = self.snapshot.adventures.get(adventure_id)
+        if adventure is None:
+            return 0
+        return adventure.max_players - self.taken[adventure_id]
+
+    def try_assign(self, player, adventure_id, preference_place, round_no):
+        if self.free_places(adventure_id) <= 0:
+            return False # No slot available
+        self.taken[adventure_id] += 1
+        self.plan.assignments.append(PlannedAssignment(player.id, adventure_id, preference_place))
+        self.plan.rounds[round_no].append(player.id)
+        del self.unassigned[player.id]
+        return True
+
+    def requested_round(self):
+        """Round 0: DM-requested players who signed up for that adventure."""
+        for adventure in self.snapshot.playable_adventures():
+            requested = self.snapshot.requested_players.get(adventure.id)
+            if not requested:
+                continue
+            for player in list(self.unassigned.values()):
+                if player.id not in requested:
+                    continue
+                prio = player.priority_for(adventure.id)
+                if prio is not None:
+                    self.try_assign(player, adventure.id, prio, 0)
+
+    def continuing_round(self):
+        """Round 1: players continuing a multi-session adventure."""
+        for prio in range(1, MAX_PRIORITY + 1):
+            for player in list(self.unassigned.values()):
+                for adventure_id, _ in (s for s in player.signups if s[1] == prio):
+                    if player.id in self.snapshot.continuing_players.get(adventure_id, ()):
+                        if self.try_assign(player, adventure_id, prio, 1):
+                            break
+
+    def story_round(self):
+        """Round 2: story players, but only on story adventures."""
+        for prio in range(1, MAX_PRIORITY + 1):
+            for player in list(self.unassigned.values()):
+                if not player.story_player:
+                    continue
+                for adventure_id, _ in (s for s in player.signups if s[1] == prio):
+                    adventure = self.snapshot.adventures.get(adventure_id)
+                    if adventure is None or not adventure.is_story_adventure:
+                        continue
+                    if self.try_assign(player, adventure_id, prio, 2):
+                        break
+
+    def signup_round(self):
+        """Round 3: everyone by karma to the first available adventure of their signups."""
+        for prio in range(1, MAX_PRIORITY + 1):
+            for player in list(self.unassigned.values()):
+                for adventure_id, _ in (s for s in player.signups if s[1] == prio):
+                    if self.try_assign(player, adventure_id, prio, 3):
+                        break
+
+    def optimal_signup_round(self):
+        """
+        Round 3 as a min-cost flow: source -> player -> signed up adventure -> sink, where
+        every player also has an arc to an uncapacitated "unplaced" node.
+
+        Deviating from the first choice costs `PREFERENCE_COSTS[prio]` and staying unplaced
+        costs `UNPLACED_COST`, both multiplied by a weight that grows with the karma rank.
+        Players are added one by one and routed along the shortest augmenting path of the
+        residual graph, which may move already routed players to another of their signups
+        or out of the adventure. Since every added player is routed, each step keeps the flow
+        min-cost (successive shortest paths).
+
+        The player nodes are contracted away: the residual graph only has adventure nodes,
+        where the edge a -> b is the cheapest player in a that could move to b. Each search
+        is a Dijkstra on reduced costs (node potentials) over at most #adventures + 2 nodes.
+        """
+        players = [p for p in self.unassigned.values() if p.signups]
+        num_players = len(players)
+        free = {adv.id: self.free_places(adv.id) for adv in self.snapshot.playable_adventures()}
+        free[UNPLACED] = num_players
+        costs = {} # player id -> {adventure_id: cost}
+        routed = {} # player id -> adventure_id
+        moves = defaultdict(list) # (a, b) -> heap of (cost of moving from a to b, player id)
+        successors = defaultdict(set) # a -> {b, ...} with a (possibly stale) entry in moves
+        potential = defaultdict(int) # adventure_id -> potential keeping reduced costs non-negative
+
+        def route(pid, adventure_id):
+            routed[pid] = adventure_id
+            here = costs[pid][adventure_id]
+            for other, cost in costs[pid].items():
+                if other != adventure_id:
+                    heapq.heappush(moves[(adventure_id, other)], (cost - here, pid))
+                    successors[adventure_id].add(other)
+
+        def cheapest_move(a, b):
+            heap = moves[(a, b)]
+            while heap and routed[heap[0][1]] != a:
+                heapq.heappop(heap) # player left a since the entry was made
+            return heap[0] if heap else None
+
+        for rank, player in enumerate(players):
+            weight = 2 * num_players - rank
+            costs[player.id] = {
+                adventure_id: PREFERENCE_COSTS[prio] * weight
+                for adventure_id, prio in player.signups
+                if adventure_id in free and prio in PREFERENCE_COSTS
+            }
+            costs[player.id][UNPLACED] = UNPLACED_COST * weight
+            source_potential = max(potential[a] - cost for a, cost in costs[player.id].items())
+
+            # Dijkstra from the new player until the first adventure with a free place
+            dist = {}
+            prev = {} # adventure_id -> (previous adventure_id or SOURCE, moving player id)
+            heap = []
+            for a, cost in costs[player.id].items():
+                dist[a] = cost + source_potential - potential[a]
+                prev[a] = (SOURCE, player.id)
+                heap.append((dist[a], a is UNPLACED, a or 0, a))
+            heapq.heapify(heap)
+            visited = set()
+            target = None
+            while heap:
+                d, _, _, a = heapq.heappop(heap)
+                if a in visited:
+                    continue
+                visited.add(a)
+                if free[a] > 0:
+                    target = a # always found, the unplaced node has room for everyone
+                    break
+                for b in list(successors[a]):
+                    move = cheapest_move(a, b)
+                    if move is None:
+                        successors[a].discard(b)
+                        continue
+                    reduced = d + move[0] + potential[a] - potential[b]
+                    if b not in dist or reduced < dist[b]:
+                        dist[b] = reduced
+                        prev[b] = (a, move[1])
+                        heapq.heappush(heap, (reduced, b is UNPLACED, b or 0, b))
+
+            shortest = dist[target]
+            for a in visited:
+                potential[a] += dist[a] - shortest
+
+            free[target] -= 1
+            a = target
+            while a is not SOURCE:
+                a_prev, pid = prev[a]
+                route(pid, a)
+                a = a_prev
+
+        for player in players:
+            adventure_id = routed[player.id]
+            if adventure_id is not UNPLACED:
+                self.try_assign(player, adventure_id, player.priority_for(adventure_id), 3)
+
+    def any_free_round(self):
+        """Round 4: everyone by karma to any adventure with a free place."""
+        open_adventures = sorted(
+            (adv.id for adv in self.snapshot.playable_adventures() if self.free_places(adv.id) > 0),
+            key=lambda adventure_id: tie_break(self.seed, "adventure", adventure_id),
+            reverse=True, # popped from the end
+        )
+        for player in list(self.unassigned.values()):
+            if not open_adventures:
+                break
+            self.try_assign(player, open_adventures[-1], OUTSIDE_TOP_THREE, 4)
+            if self.free_places(open_adventures[-1]) <= 0:
+                open_adventures.pop()
+
+    def finish(self) -> AssignmentPlan:
+        """Round 5: the rest goes to the waiting list."""
+        self.plan.waiting_list = list(self.unassigned)
+        self.plan.rounds[WAITING_LIST_ROUND] = list(self.unassigned)
+        self.plan.taken = dict(self.taken)
+        return self.plan
+
+
+def solve_greedy(snapshot: WeekSnapshot, seed=None) -> AssignmentPlan:
+    """
+    Run the six greedy assignment rounds on a snapshot without touching the database:
+    0. Assign DM-requested players who have signed up for the adventure (highest priority)
+    1. Signup all players that played last week, if they try to signup again for an ongoing adventure.
+    2. Assign all story players sorted by karma.
+    3. Signup all remaining players ranked by their karma to the first available adventure they signed up for according to there priority.
+    4. Signup all remaining players ranked by their karma to any available adventure. Sorted by random.
+    5. Put the rest of the players on the waiting list.
+    Ties are broken by `tie_break` under `seed` (default: `week_seed`), so the same
+    snapshot and seed always give the same plan.
+    """
+    run = _AssignmentRun(snapshot, week_seed(snapshot.start_of_week) if seed is None else seed)
+    run.requested_round()
+    run.continuing_round()
+    run.story_round()
+    run.signup_round()
+    run.any_free_round()
+    return run.finish()
+
+def solve_optimal(snapshot: WeekSnapshot, seed=None) -> AssignmentPlan:
+    """
+    Same rounds as `solve_greedy`, but round 3 is solved as a min-cost flow, so contested
+    places no longer leave seats and preferences unused.
+    Requested, continuing and story players are still placed first as hard constraints.
+    """
+    run = _AssignmentRun(snapshot, week_seed(snapshot.start_of_week) if seed is None else seed)
+    run.requested_round()
+    run.continuing_round()
+    run.story_round()
+    run.optimal_signup_round()
+    run.any_free_round()
+    return run.finish()
+
+SOLVERS = {
+    "greedy": solve_greedy,
+    "optimal": solve_optimal,
+}
+
+def plan_statistics(plan: AssignmentPlan) -> dict:
+    """
+    Summarise how well a plan meets the players' preferences.
+    `satisfaction` gives 3 points for a first choice, 2 for a second and 1 for a third.
+    """
+    places = defaultdict(int)
+    for assignment in plan.assignments:
+        places[assignment.preference_place] += 1
+    return {
+        "first_choice": places[1],
+        "second_choice": places[2],
+        "third_choice": places[3],
+        "outside_top_three": places[OUTSIDE_TOP_THREE],
+        "waiting_list": len(plan.waiting_list),
+        "satisfaction": sum(
+            (MAX_PRIORITY + 1 - place) * count
+            for place, count in places.items()
+            if place is not None and place <= MAX_PRIORITY
+        ),
+    }
+
+
+def score_plan(plan: AssignmentPlan) -> tuple:
+    """
+    Fairness objective of the seed search, compared lexicographically: more first choices,
+    then fewer players placed outside their top three, then a shorter waiting list.
+    """
+    statistics = plan_statistics(plan)
+    return statistics["first_choice"], -statistics["outside_top_three"], -statistics["waiting_list"]
+
+_worker_snapshot = None # snapshot of the search, sent once to every worker process
+
+def _init_search_worker(snapshot):
+    global _worker_snapshot
+    _worker_snapshot = snapshot
+
+def _solve_candidate(mode, seed):
+    plan = SOLVERS[mode](_worker_snapshot, seed)
+    return seed, score_plan(plan), plan
+
+def search_seeds(snapshot: WeekSnapshot, mode: str, seeds: list, workers=None) -> tuple:
+    """
+    Solve the snapshot once per seed and return `(seed, plan, scores)` of the candidate with
+    the best `score_plan`, where `scores` maps every seed to its score.
+    Candidates run in a process pool of `workers` processes (default: one per core); with a
+    single seed or worker they run in this process. Ties go to the earlier seed, so the
+    result does not depend on how the pool schedules the candidates.
+
+    The pool spawns fresh interpreters instead of forking: the app process runs many threads,
+    and a forked child could inherit locks (database pool, logging) held by one of them.
+    """
+    if len(seeds) == 1 or (workers is not None and workers <= 1):
+        _init_search_worker(snapshot)
+        results = [_solve_candidate(mode, seed) for seed in seeds]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_search_worker, initargs=(snapshot,),
+        ) as pool:
+            results = list(pool.map(_solve_candidate, [mode] * len(seeds), seeds))
+    seed, _, plan = max(results, key=lambda result: result[1])
+    return seed, plan, {seed: score for seed, score, _ in results}
+
+
+def persist_plan(plan: AssignmentPlan, waiting_list: Adventure) -> list:
+    """
+    Write a plan to the database with one bulk insert. Players that do not fit on the
+    waiting list anymore are not inserted and returned instead.
+    """
+    rows = [
+        {"user_id": a.user_id, "adventure_id": a.adventure_id, "preference_place": a.preference_place}
+        for a in plan.assignments
+    ]
+    free_places = max(waiting_list.max_players - plan.taken.get(waiting_list.id, 0), 0)
+    rows += [
+        {"user_id": user_id, "adventure_id": waiting_list.id, "preference_place": None}
+        for user_id in plan.waiting_list[:free_places]
+    ]
+    if rows:
+        db.session.execute(db.insert(Assignment), rows)
+        adjust_assigned_counts(Counter(row["adventure_id"] for row in rows))
+    return plan.waiting_list[free_places:]
+
+
+@dataclass(frozen=True)
+class WaitingPlayer:
+    id: int
+    display_name: str
+    karma: int
+    signups: tuple # ((adventure_id, priority), ...) of the week
+
+@dataclass(frozen=True)
+class Promotion:
+    user_id: int
+    adventure_id: int
+    preference_place: int
+
+def load_open_places(start_of_week, end_of_week) -> dict:
+    """`{adventure_id: free places}` of the week's adventures (without the waiting list) in one query."""
+    return dict(
+        db.session.execute(
+            db.select(Adventure.id, Adventure.max_players - Adventure.assigned_count)
+            .where(
+                Adventure.date >= start_of_week,
+                Adventure.date <= end_of_week,
+                Adventure.is_waitinglist == 0,  # Exclude waiting list
+            )
+        ).all()
+    )
+
+def load_waiting_players(waiting_list_id, start_of_week, end_of_week) -> list:
+    """All players on the waiting list with their signups of the week, in one query."""
+    players = {}
+    signups = defaultdict(list)
+    for row in db.session.execute(
+        db.select(User.id, User.display_name, User.karma, Signup.adventure_id, Signup.priority)
+        .join(Assignment, Assignment.user_id == User.id)
+        .outerjoin(Signup, (Signup.user_id == User.id)
+                   & (Signup.adventure_date >= start_of_week)
+                   & (Signup.adventure_date <= end_of_week))
+        .where(Assignment.adventure_id == waiting_list_id)
+    ):
+        players[row.id] = row
+        if row.adventure_id is not None:
+            signups[row.id].append((row.adventure_id, row.priority))
+    return [
+        WaitingPlayer(
+            id=row.id,
+            display_name=row.display_name,
+            karma=row.karma or 0,
+            signups=tuple(sorted(signups[row.id], key=lambda signup: signup[1])),
+        )
+        for row in players.values()
+    ]
+
+def rank_waiting_players(waiting_players, seed) -> list:
+    """Order in which waiting players are promoted: by karma, ties broken under `seed`."""
+    return sorted(waiting_players, key=lambda p: (-p.karma, tie_break(seed, "player", p.id)))
+
+def plan_promotions(waiting_players, open_places, seed) -> list:
+    """
+    Promote waiting players in karma order into the open places, keeping the capacity in memory.
+    Each player gets the signed-up adventure with the best priority that still has a place,
+    otherwise any open adventure (`OUTSIDE_TOP_THREE`); ties are broken by `tie_break` under `seed`.
+    """
+    free = {adventure_id: places for adventure_id, places in open_places.items() if places > 0}
+
+    promotions = []
+    for player in rank_waiting_players(waiting_players, seed):
+        if not free:
+            break
+        wanted = [(prio, adventure_id) for adventure_id, prio in player.signups if adventure_id in free]
+        if wanted:
+            prio, adventure_id = min(
+                wanted, key=lambda choice: (choice[0], tie_break(seed, "waiting", player.id, choice[1]))
+            )
+        else:
+            prio = OUTSIDE_TOP_THREE
+            adventure_id = min(free, key=lambda adventure_id: tie_break(seed, "waiting", player.id, adventure_id))
+        promotions.append(Promotion(player.id, adventure_id, prio))
+        free[adventure_id] -= 1
+        if not free[adventure_id]:
+            del free[adventure_id]
+    return promotions
+
+def apply_promotions(promotions, waiting_list_id):
+    """Move promoted players off the waiting list with one executemany UPDATE."""
+    if not promotions:
+        return
+    assignments = Assignment.__table__
+    db.session.execute(
+        assignments.update()
+        .where(assignments.c.user_id == bindparam("promoted_user_id"), assignments.c.adventure_id == waiting_list_id)
+        .values(adventure_id=bindparam("new_adventure_id"), preference_place=bindparam("new_preference_place")),
+        [
+            {
+                "promoted_user_id": p.user_id,
+                "new_adventure_id": p.adventure_id,
+                "new_preference_place": p.preference_place,
+            }
+            for p in promotions
+        ],
+    )
+    deltas = Counter(p.adventure_id for p in promotions)
+    deltas[waiting_list_id] -= len(promotions)
+    adjust_assigned_counts(deltas)
+
+def claim_promotion(promotion, waiting_list_id) -> bool:
+    """
+    Move one player off the waiting list, but only if they are still on it. Returns False if a
+    concurrent transaction promoted or removed the player first.
+    """
+    result = db.session.execute(
+        db.update(Assignment)
+        .where(Assignment.user_id == promotion.user_id, Assignment.adventure_id == waiting_list_id)
+        .values(adventure_id=promotion.adventure_id, preference_place=promotion.preference_place)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return False
+    adjust_assigned_counts({promotion.adventure_id: 1, waiting_list_id: -1})
+    return True
+
+
+@dataclass(frozen=True)
+class RoomRequest:
+    id: int
+    title: str
+    date: date
+    players: int                # expected table size
+    personal_room: str | None   # of the creator, always granted
+    preferred_room: str | None  # the adventure's requested room, granted if free and large enough
+
+@dataclass
+class RoomPlan:
+    rooms: dict = field(default_factory=dict)     # adventure_id -> room
+    unroomed: dict = field(default_factory=dict)  # adventure_id -> reason
+
+def room_capacities(rooms) -> dict:
+    """
+    `{room: capacity}` from the `ROOMS` config: either a mapping of room to the number of
+    players it seats or, as before capacities existed, a plain list of rooms of any size.
+    """
+    if isinstance(rooms, dict):
+        return {room: capacity for room, capacity in rooms.items()}
+    return {room: None for room in rooms}
+
+def load_room_requests(start_of_week, end_of_week, players=None) -> list:
+    """
+    Adventures of the week that need a room, with their table size and the personal room of
+    their creator. The table size is the number of assigned players, or `max_players` before
+    the assignment; `players` (`{adventure_id: count}`) overrides it, e.g. for a planned roster.
+    """
+    players = players or {}
+    rows = db.session.execute(
+        db.select(
+            Adventure.id, Adventure.title, Adventure.date, Adventure.assigned_count,
+            Adventure.max_players, Adventure.requested_room, User.personal_room,
+        )
+        .outerjoin(Adventure.creator)
+        .where(
+            Adventure.date >= start_of_week,
+            Adventure.date <= end_of_week,
+            Adventure.is_waitinglist == 0,  # Exclude waiting list
+        )
+        .order_by(Adventure.id)
+    ).all()
+    return [
+        RoomRequest(
+            id=row.id,
+            title=row.title,
+            date=row.date,
+            players=players.get(row.id, row.assigned_count or row.max_players),
+            personal_room=row.personal_room,
+            preferred_room=row.requested_room,
+        )
+        for row in rows
+    ]
+
+def plan_rooms(room_requests, capacities, seed=0) -> RoomPlan:
+    """
+    Allocate the rooms of each day in one pass over the requests:
+      1. creators with a personal room get it, whatever its size;
+      2. from the largest table down, preferred rooms are granted if free and large enough;
+      3. from the largest table down, the smallest free room that seats the table is taken,
+         which keeps large rooms for large tables.
+    Tables of equal size are ordered by `seed`. Adventures that get no room are reported
+    in `unroomed` with the reason instead of being left out silently.
+    """
+    plan = RoomPlan()
+    by_day = defaultdict(list)
+    for request in room_requests:
+        by_day[request.date].append(request)
+
+    order = {room: index for index, room in enumerate(capacities)}
+    def fits(room, players):
+        return capacities[room] is None or capacities[room] >= players
+
+    for requests in by_day.values():
+        free = set(capacities)
+        waiting = []
+        for request in requests:
+            if request.personal_room is not None:
+                plan.rooms[request.id] = request.personal_room
+                free.discard(request.personal_room)
+            else:
+                waiting.append(request)
+        waiting.sort(key=lambda request: (-request.players, tie_break(seed, "room", request.id)))
+
+        unplaced = []
+        for request in waiting:
+            if request.preferred_room in free and fits(request.preferred_room, request.players):
+                plan.rooms[request.id] = request.preferred_room
+                free.discard(request.preferred_room)
+            else:
+                unplaced.append(request)
+
+        for request in unplaced:
+            candidates = [room for room in free if fits(room, request.players)]
+            if candidates:
+                room = min(candidates, key=lambda room: (capacities[room] is None, capacities[room] or 0, order[room]))
+                plan.rooms[request.id] = room
+                free.discard(room)
+            elif free:
+                plan.unroomed[request.id] = f"no free room seats {request.players} players"
+            else:
+                plan.unroomed[request.id] = "no free room left"
+    return plan
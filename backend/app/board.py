@@ -0,0 +1,116 @@
+"""
+Read path of the adventure board.
+
+`AdventureSchema` dumps every adventure with its creator, its assignments and their users
+and, for admins, its signups and their users. The queries here load exactly that with one
+`selectinload` query per relationship, so a week board costs the same fixed number of
+queries however many adventures and players it has. Any other relationship is set to
+`raiseload`, so a schema change that would lazy-load per adventure fails loudly instead.
+
+The serialized boards are cached per app, keyed by the requested date range and the
+audience ("admin" sees signups and karma, "player" sees what the release state allows).
+Every write path that changes what a board shows calls `invalidate_week_board` with the
+dates it touched after its commit, which also bumps the version stamps of those weeks and
+pushes the changes to the live subscribers of those weeks (see `app.live`).
+"""
+from collections import OrderedDict
+import threading
+
+from flask import current_app
+from sqlalchemy.orm import raiseload, selectinload
+
+from .live import publish_board_changes
+from .models import db, Adventure, Assignment, Signup
+from .versions import bump_week_versions
+
+
+def board_options(include_signups=True) -> list:
+    """Loader options for dumping adventures with `AdventureSchema`."""
+    options = [
+        selectinload(Adventure.creator),
+        selectinload(Adventure.assignments).selectinload(Assignment.user),
+    ]
+    if include_signups:
+        options.append(selectinload(Adventure.signups).selectinload(Signup.user))
+    return options + [raiseload("*")]
+
+def load_week_board(week_start=None, week_end=None, include_signups=True) -> list:
+    """Adventures between `week_start` and `week_end` (all of them if not given), ordered by date."""
+    stmt = db.select(Adventure).options(*board_options(include_signups)).order_by(Adventure.date, Adventure.id)
+    if week_start and week_end:
+        stmt = stmt.where(Adventure.date >= week_start, Adventure.date <= week_end)
+    return db.session.scalars(stmt).all()
+
+def load_board_adventure(adventure_id, include_signups=True) -> list:
+    """The adventure with `adventure_id` as a list of zero or one adventures, loaded like the board."""
+    stmt = db.select(Adventure).options(*board_options(include_signups)).where(Adventure.id == adventure_id)
+    return db.session.scalars(stmt).all()
+
+
+BOARD_CACHE_SIZE = 64 # serialized boards kept per app
+
+class WeekBoardCache:
+    """
+    LRU cache of serialized boards by `(week_start, week_end, audience)`.
+
+    Every invalidation bumps a generation counter; a board built while an invalidation
+    happened is returned but not stored, so a read racing a write cannot cache stale data.
+    """
+    def __init__(self, size=BOARD_CACHE_SIZE):
+        self.size = size
+        self.boards = OrderedDict()
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, build):
+        with self.lock:
+            if key in self.boards:
+                self.boards.move_to_end(key)
+                return self.boards[key]
+            generation = self.generation
+        board = build()
+        with self.lock:
+            if generation == self.generation:
+                self.boards[key] = board
+                while len(self.boards) > self.size:
+                    self.boards.popitem(last=False)
+        return board
+
+    def invalidate(self, first=None, last=None, audience=None):
+        with self.lock:
+            self.generation += 1
+            for key in list(self.boards):
+                week_start, week_end, key_audience = key
+                if audience is not None and key_audience != audience:
+                    continue
+                if first is None or week_start is None or week_end is None or (
+                    week_start <= (last or first) and first <= week_end
+                ):
+                    del self.boards[key]
+
+def week_board_cache() -> WeekBoardCache:
+    return current_app.extensions.setdefault("week_board_cache", WeekBoardCache())
+
+def cached_week_board(week_start, week_end, audience, build):
+    """The serialized board of `(week_start, week_end)` for `audience`, built with `build()` on a miss."""
+    return week_board_cache().get((week_start, week_end, audience), build)
+
+def week_adventure_dates(week_start, week_end) -> dict:
+    """
+    `{adventure id: date}` of the adventures between `week_start` and `week_end`, cached with the
+    boards. Adventures only move with an invalidation of every audience, so the entry sits under
+    its own "dates" audience and survives admin-only invalidations.
+    """
+    def build():
+        stmt = db.select(Adventure.id, Adventure.date).where(Adventure.date >= week_start, Adventure.date <= week_end)
+        return dict(db.session.execute(stmt).all())
+    return cached_week_board(week_start, week_end, "dates", build)
+
+def invalidate_week_board(first=None, last=None, audience=None):
+    """
+    Drop the cached boards that show any day from `first` to `last` (just `first` if `last` is
+    not given; every board if neither is). With `audience` only that audience's boards are dropped.
+    """
+    week_board_cache().invalidate(first, last, audience)
+    bump_week_versions(first, last, (audience,) if audience else ("admin", "player"))
+    publish_board_changes(first, last) # the live summary has signup counts, so admin-only changes count too
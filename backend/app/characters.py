@@ -0,0 +1,154 @@
+"""
+Server-side cache of the users' D&D Beyond characters.
+
+`/api/characters/summary` serves the `character_summaries` table only, one row per
+`(User.dnd_beyond_name, User.dnd_beyond_campaign)`, so a page load never waits for D&D Beyond.
+Rows older than `CHARACTERS.max_age_minutes` are refreshed by the `refresh_characters` job
+every 30 minutes: a thread pool of `CHARACTERS.workers` threads, created with the app, fetches
+them from `CHARACTERS.source_url`, each request with a timeout of `CHARACTERS.timeout_seconds`.
+A failed refresh keeps the old characters and is retried after `CHARACTERS.retry_minutes`.
+
+The source is a JSON endpoint returning the list of character summaries (see
+`frontend/src/util/characters.ts`) of one account; `{account}` and `{campaign}` in the URL are
+replaced. Without a `source_url` nothing is fetched.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import quote
+import threading
+
+from flask import current_app
+import requests
+
+from .models import db, CharacterSummary, User
+from .versions import bump_version
+
+CHARACTER_DEFAULTS = {
+    "source_url": None,
+    "workers": 4,
+    "timeout_seconds": 10,
+    "max_age_minutes": 12 * 60,
+    "retry_minutes": 30,
+}
+
+
+def character_config(key):
+    return current_app.config.get("CHARACTERS", {}).get(key, CHARACTER_DEFAULTS[key])
+
+def character_accounts() -> set:
+    """`{(dnd_beyond_name, dnd_beyond_campaign)}` of the users with a D&D Beyond name."""
+    rows = db.session.execute(
+        db.select(User.dnd_beyond_name, User.dnd_beyond_campaign).where(User.dnd_beyond_name.is_not(None))
+    )
+    return {(name.strip(), campaign) for name, campaign in rows if name.strip()}
+
+def character_summary() -> dict:
+    """`{character id: character}` of the current users, from the cache only."""
+    accounts = character_accounts()
+    characters = {}
+    for row in db.session.execute(
+        db.select(CharacterSummary.dnd_beyond_name, CharacterSummary.dnd_beyond_campaign, CharacterSummary.characters)
+    ):
+        if (row.dnd_beyond_name, row.dnd_beyond_campaign) in accounts:
+            characters.update((character["id"], character) for character in row.characters)
+    return characters
+
+def stale_character_accounts(now=None) -> list:
+    """The accounts whose characters were not fetched within `max_age_minutes`, nor tried within `retry_minutes`."""
+    now = now or datetime.now()
+    cached = {
+        (row.dnd_beyond_name, row.dnd_beyond_campaign): row
+        for row in db.session.execute(
+            db.select(
+                CharacterSummary.dnd_beyond_name, CharacterSummary.dnd_beyond_campaign,
+                CharacterSummary.fetched_at, CharacterSummary.attempted_at,
+            )
+        )
+    }
+    max_age = timedelta(minutes=character_config("max_age_minutes"))
+    retry = timedelta(minutes=character_config("retry_minutes"))
+    stale = []
+    for account in sorted(character_accounts(), key=str):
+        row = cached.get(account)
+        if row is None or (
+            (row.fetched_at is None or row.fetched_at < now - max_age) and row.attempted_at < now - retry
+        ):
+            stale.append(account)
+    return stale
+
+def fetch_characters(name, campaign) -> list:
+    """The character summaries of the D&D Beyond account `name` from the configured source."""
+    url = character_config("source_url").format(account=quote(name), campaign="" if campaign is None else campaign)
+    response = requests.get(url, timeout=character_config("timeout_seconds"))
+    response.raise_for_status()
+    characters = response.json()
+    for character in characters:
+        character.setdefault("dndbeyond_account", name)
+        character.setdefault("campaign", "" if campaign is None else str(campaign))
+    return characters
+
+def refresh_character_summary(name, campaign):
+    """Fetch the characters of one account and store them; on failure only the attempt is stored."""
+    now = datetime.now()
+    try:
+        characters = fetch_characters(name, campaign)
+    except (requests.RequestException, ValueError, TypeError, AttributeError) as e:
+        current_app.logger.warning("Fetching the characters of %s failed: %s", name, e)
+        characters = None
+
+    try:
+        summary = db.session.scalar(
+            db.select(CharacterSummary).where(
+                CharacterSummary.dnd_beyond_name == name,
+                CharacterSummary.dnd_beyond_campaign.is_not_distinct_from(campaign),
+            )
+        )
+        if summary is None:
+            summary = CharacterSummary(dnd_beyond_name=name, dnd_beyond_campaign=campaign, characters=[])
+            db.session.add(summary)
+        summary.attempted_at = now
+        if characters is not None:
+            summary.characters = characters
+            summary.fetched_at = now
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+    if characters is not None:
+        bump_version("characters")
+
+
+class CharacterRefresher:
+    """Thread pool refreshing cache rows; an account is refreshed by at most one thread at a time."""
+    def __init__(self, workers):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="characters")
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def submit(self, app, accounts) -> list:
+        with self.lock:
+            accounts = [account for account in accounts if account not in self.pending]
+            self.pending.update(accounts)
+        return [self.pool.submit(self._refresh, app, account) for account in accounts]
+
+    def _refresh(self, app, account):
+        try:
+            with app.app_context():
+                try:
+                    refresh_character_summary(*account)
+                except Exception as e:
+                    app.logger.error("Refreshing the characters of %s failed: %s", account[0], e)
+                finally:
+                    db.session.remove()
+        finally:
+            with self.lock:
+                self.pending.discard(account)
+
+def character_refresher() -> CharacterRefresher:
+    return current_app.extensions["character_refresher"] # see `create_app`
+
+def refresh_stale_characters() -> list:
+    """Queue the refresh of every stale account in the background; the futures of the queued refreshes."""
+    if not character_config("source_url"):
+        return []
+    return character_refresher().submit(current_app._get_current_object(), stale_character_accounts())
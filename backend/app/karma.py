@@ -0,0 +1,240 @@
+"""
+Weekly karma settlement and the karma ledger.
+
+Every karma rule is one SELECT yielding `(user_id, rule, points)` rows for a week. The rules
+are combined with UNION ALL and summed per user and rule in the database, so evaluating a
+week is one aggregate query, whatever the size of the league.
+
+The results are kept in the `karma_events` ledger, one row per (user, week, rule).
+`User.karma` is a cache of `STARTING_KARMA` plus the user's events: it is only changed by the
+difference a ledger write makes, and `rebuild_karma` can recompute it from the ledger.
+"""
+from collections import defaultdict
+
+from sqlalchemy import bindparam, union_all
+
+from .models import db, User, Adventure, Assignment, KarmaEvent, KarmaRollup, STARTING_KARMA
+
+DM_BONUS = 500                  # per DM with an adventure this week
+NO_SHOW_PENALTY = -500          # per assignment the player did not appear for
+WAITING_LIST_ATTENDED = 200
+WAITING_LIST_MISSED = 180
+CHOICE_POINTS = {               # attended non-waiting-list sessions, by preference place
+    1: 100,
+    2: 120,
+    3: 140,
+    4: 150,  # assigned outside top three
+}
+
+
+def _rule(name, points, user_id, *where, distinct=True):
+    query = db.select(
+        user_id.label("user_id"),
+        db.literal(name).label("rule"),
+        db.literal(points).label("points"),
+    ).where(*where)
+    return query.distinct() if distinct else query
+
+def karma_rules(start_of_week, end_of_week):
+    """All karma rules of a week as one UNION ALL select of `(user_id, rule, points)`."""
+    in_week = (
+        Adventure.date >= start_of_week,
+        Adventure.date <= end_of_week,
+        Adventure.exclude_from_karma.is_(False),
+    )
+    assignments = (Assignment.adventure_id == Adventure.id, *in_week)
+    rules = [
+        # DM: once per week, however many adventures they run
+        _rule("dm", DM_BONUS, Adventure.user_id, Adventure.user_id.is_not(None), *in_week),
+        # Not attending (non-waiting list): once per missed session
+        _rule("no_show", NO_SHOW_PENALTY, Assignment.user_id, *assignments,
+              Assignment.appeared.is_(False), Adventure.is_waitinglist == 0, distinct=False),
+        # Waiting lists: the current one (1) and the ones `make_waiting_list` retired (2)
+        _rule("waiting_list_attended", WAITING_LIST_ATTENDED, Assignment.user_id, *assignments,
+              Assignment.appeared.is_(True), Adventure.is_waitinglist != 0),
+        _rule("waiting_list_missed", WAITING_LIST_MISSED, Assignment.user_id, *assignments,
+              Assignment.appeared.is_(False), Adventure.is_waitinglist != 0),
+    ]
+    rules += [
+        _rule(f"choice_{prio}", points, Assignment.user_id, *assignments,
+              Assignment.preference_place == prio, Assignment.appeared.is_(True), Adventure.is_waitinglist == 0)
+        for prio, points in CHOICE_POINTS.items()
+    ]
+    return union_all(*rules).subquery("karma_rules")
+
+SETTLEMENT_RULES = (
+    "dm", "no_show", "waiting_list_attended", "waiting_list_missed",
+    *(f"choice_{prio}" for prio in CHOICE_POINTS),
+)
+
+def evaluate_karma_rules(start_of_week, end_of_week) -> dict:
+    """Evaluate all rules of a week in one aggregate query. Returns `{(user_id, rule): points}`."""
+    rules = karma_rules(start_of_week, end_of_week)
+    return {
+        (user_id, rule): int(points)
+        for user_id, rule, points in db.session.execute(
+            db.select(rules.c.user_id, rules.c.rule, db.func.sum(rules.c.points))
+            .group_by(rules.c.user_id, rules.c.rule)
+        )
+    }
+
+def settle_week(start_of_week, end_of_week) -> dict:
+    """
+    Bring the ledger of a week in line with the rules and apply the difference to `User.karma`.
+    A week that was settled before only changes where the rules now give a different result
+    (e.g. corrected attendance), so settling twice is a no-op. Nothing is committed.
+    Returns the `{user_id: delta}` applied to the users' karma.
+    """
+    wanted = evaluate_karma_rules(start_of_week, end_of_week)
+    existing = {
+        (row.user_id, row.rule): row
+        for row in db.session.execute(
+            db.select(KarmaEvent.id, KarmaEvent.user_id, KarmaEvent.rule, KarmaEvent.points)
+            .where(KarmaEvent.week_start == start_of_week, KarmaEvent.rule.in_(SETTLEMENT_RULES))
+        )
+    }
+
+    deltas = defaultdict(int)
+    inserts, updates = [], []
+    for (user_id, rule), points in wanted.items():
+        event = existing.pop((user_id, rule), None)
+        if event is None:
+            inserts.append({"user_id": user_id, "week_start": start_of_week, "rule": rule, "points": points})
+        elif event.points != points:
+            updates.append({"id": event.id, "points": points})
+        else:
+            continue
+        deltas[user_id] += points - (event.points if event else 0)
+    for (user_id, _), event in existing.items(): # rules that no longer apply
+        deltas[user_id] -= event.points
+
+    if inserts:
+        db.session.execute(db.insert(KarmaEvent), inserts)
+    if updates:
+        db.session.execute(db.update(KarmaEvent), updates)
+    if existing:
+        db.session.execute(db.delete(KarmaEvent).where(KarmaEvent.id.in_([e.id for e in existing.values()])))
+    apply_karma_deltas(deltas)
+    refresh_karma_rollups(start_of_week, deltas)
+    return {user_id: delta for user_id, delta in deltas.items() if delta}
+
+def add_karma_event(user_id, week_start, rule, points):
+    """Add points to a user's (week, rule) ledger entry outside the weekly settlement. Nothing is committed."""
+    event = db.session.execute(
+        db.select(KarmaEvent).where(
+            KarmaEvent.user_id == user_id, KarmaEvent.week_start == week_start, KarmaEvent.rule == rule
+        )
+    ).scalar_one_or_none()
+    if event is None:
+        db.session.add(KarmaEvent(user_id=user_id, week_start=week_start, rule=rule, points=points))
+    else:
+        event.points += points
+    apply_karma_deltas({user_id: points})
+    refresh_karma_rollups(week_start, [user_id])
+
+def refresh_karma_rollups(week_start, user_ids):
+    """Rewrite the weekly rollups of `user_ids` for one week from the ledger. Nothing is committed."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    breakdowns = defaultdict(dict)
+    for user_id, rule, points in db.session.execute(
+        db.select(KarmaEvent.user_id, KarmaEvent.rule, KarmaEvent.points)
+        .where(KarmaEvent.week_start == week_start, KarmaEvent.user_id.in_(user_ids))
+    ):
+        breakdowns[user_id][rule] = points
+    db.session.execute(
+        db.delete(KarmaRollup).where(KarmaRollup.week_start == week_start, KarmaRollup.user_id.in_(user_ids))
+    )
+    if breakdowns:
+        db.session.execute(db.insert(KarmaRollup), [
+            {"user_id": user_id, "week_start": week_start, "points": sum(rules.values()), "breakdown": rules}
+            for user_id, rules in breakdowns.items()
+        ])
+
+def apply_karma_deltas(deltas):
+    """Add `{user_id: delta}` to the users' karma with one executemany UPDATE."""
+    params = [{"karma_user_id": user_id, "delta": delta} for user_id, delta in deltas.items() if delta]
+    if not params:
+        return
+    users = User.__table__
+    db.session.execute(
+        users.update()
+        .where(users.c.id == bindparam("karma_user_id"))
+        .values(karma=users.c.karma + bindparam("delta")),
+        params,
+    )
+
+def ledger_karma():
+    """`STARTING_KARMA` plus the sum of a user's karma events, as a correlated scalar subquery."""
+    return STARTING_KARMA + db.func.coalesce(
+        db.select(db.func.sum(KarmaEvent.points))
+        .where(KarmaEvent.user_id == User.id)
+        .correlate(User)
+        .scalar_subquery(),
+        0,
+    )
+
+def check_karma() -> list:
+    """Users whose cached karma differs from the ledger, as `(user_id, cached, ledger)`."""
+    ledger = ledger_karma()
+    return [
+        tuple(row) for row in db.session.execute(
+            db.select(User.id, User.karma, ledger).where(db.func.coalesce(User.karma, -1) != ledger)
+        )
+    ]
+
+def rebuild_karma():
+    """Recompute the karma of every user from the ledger with one UPDATE. Nothing is committed."""
+    db.session.execute(db.update(User).values(karma=ledger_karma()).execution_options(synchronize_session=False))
+
+def karma_rank(karma) -> int:
+    """Rank of a karma value on the leaderboard: one more than the number of users above it."""
+    if karma is None:
+        return None
+    return 1 + db.session.scalar(db.select(db.func.count()).select_from(User).where(User.karma > karma))
+
+def karma_history(user_id, limit) -> list:
+    """
+    The `limit` most recent weekly rollups of a user, newest first, with the balance after each
+    week counted back from the current karma.
+    """
+    karma = db.session.scalar(db.select(User.karma).where(User.id == user_id)) or 0
+    weeks = []
+    for rollup in db.session.execute(
+        db.select(KarmaRollup).where(KarmaRollup.user_id == user_id)
+        .order_by(KarmaRollup.week_start.desc()).limit(limit)
+    ).scalars():
+        weeks.append({
+            "week_start": rollup.week_start,
+            "points": rollup.points,
+            "balance": karma,
+            "breakdown": rollup.breakdown,
+        })
+        karma -= rollup.points
+    return weeks
+
+def leaderboard_page(limit, after=None) -> tuple:
+    """
+    One page of users by karma (highest first, ties by id), read with a keyset on the karma
+    index, so a page costs the same wherever it is. `after` is the `(karma, user_id, rank,
+    position)` of the last entry of the previous page, which lets ranks continue without
+    counting. Returns the entries and the cursor of the next page (None on the last page).
+    """
+    query = db.select(User.id, User.display_name, User.karma).where(User.karma.is_not(None))
+    if after is None:
+        rank, position, previous = 0, 0, None
+    else:
+        previous, after_id, rank, position = after
+        query = query.where((User.karma < previous) | ((User.karma == previous) & (User.id > after_id)))
+    rows = db.session.execute(query.order_by(User.karma.desc(), User.id).limit(limit + 1)).all()
+
+    entries = []
+    for user_id, display_name, karma in rows[:limit]:
+        position += 1
+        if karma != previous:
+            rank, previous = position, karma
+        entries.append({"rank": rank, "user_id": user_id, "display_name": display_name, "karma": karma})
+    last = entries[-1] if entries else None
+    next_cursor = (last["karma"], last["user_id"], last["rank"], position) if len(rows) > limit else None
+    return entries, next_cursor
@@ -0,0 +1,235 @@
+"""
+Replay of the karma rules over the whole assignment history, to see what the league's karma
+would look like today under a different rule set.
+
+The history is loaded once into columns (one list per field, one entry per assignment or
+adventure) and every rule is evaluated as a whole-column operation: a mask over the columns,
+the keys the rule is counted per and one aggregation. Nothing is evaluated per user or week in
+SQL, so years of history replay in about a second.
+"""
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime
+from itertools import compress
+import time
+
+from .karma import (
+    CHOICE_POINTS, DM_BONUS, NO_SHOW_PENALTY, SETTLEMENT_RULES, WAITING_LIST_ATTENDED, WAITING_LIST_MISSED,
+)
+from .models import db, Adventure, Assignment, KarmaEvent, User, STARTING_KARMA
+
+
+@dataclass(frozen=True)
+class KarmaRules:
+    """Point values of the weekly settlement; the defaults are the rules in force."""
+    dm_bonus: int = DM_BONUS
+    no_show_penalty: int = NO_SHOW_PENALTY
+    waiting_list_attended: int = WAITING_LIST_ATTENDED
+    waiting_list_missed: int = WAITING_LIST_MISSED
+    choice_points: dict = field(default_factory=lambda: dict(CHOICE_POINTS))
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        if "choice_points" in data:
+            data["choice_points"] = {int(place): points for place, points in data["choice_points"].items()}
+        return cls(**data)
+
+@dataclass
+class KarmaHistory:
+    """Columnar copy of everything the rules look at. Weeks are ordinals of their Monday."""
+    # one entry per assignment
+    user: list
+    week: list
+    preference_place: list
+    appeared: list
+    is_waitinglist: list
+    excluded: list
+    # one entry per adventure
+    creator: list
+    adventure_week: list
+    adventure_excluded: list
+
+
+def _columns(rows, width):
+    return [list(column) for column in zip(*rows)] or [[] for _ in range(width)]
+
+def _week_ordinals(dates):
+    ordinals = [d.toordinal() for d in dates]
+    return [o - (o + 6) % 7 for o in ordinals] # date.weekday() is (toordinal() + 6) % 7
+
+def load_karma_history() -> KarmaHistory:
+    """Load the assignment and adventure history in two queries."""
+    assignments = db.session.execute(
+        db.select(
+            Assignment.user_id,
+            Adventure.date,
+            Assignment.preference_place,
+            Assignment.appeared,
+            Adventure.is_waitinglist,
+            Adventure.exclude_from_karma,
+        ).join(Assignment.adventure)
+    ).all()
+    adventures = db.session.execute(
+        db.select(Adventure.user_id, Adventure.date, Adventure.exclude_from_karma)
+    ).all()
+    user, dates, place, appeared, waiting, excluded = _columns(assignments, 6)
+    creator, adventure_dates, adventure_excluded = _columns(adventures, 3)
+    return KarmaHistory(
+        user=user,
+        week=_week_ordinals(dates),
+        preference_place=place,
+        appeared=[bool(a) for a in appeared],
+        is_waitinglist=waiting,
+        excluded=[bool(e) for e in excluded],
+        creator=creator,
+        adventure_week=_week_ordinals(adventure_dates),
+        adventure_excluded=[bool(e) for e in adventure_excluded],
+    )
+
+def replay_karma(history: KarmaHistory, rules: KarmaRules, weeks) -> dict:
+    """
+    Evaluate `rules` on the given weeks (ordinals of their Monday) of the history.
+    Counting follows the settlement: the DM bonus once per DM and week, the no-show penalty
+    per missed session and the other rules once per user and week (and preference place).
+    Returns `{(user_id, week): points}`.
+    """
+    weeks = set(weeks)
+    points = Counter()
+
+    # DM bonus: distinct (creator, week)
+    counted = [
+        c is not None and w in weeks and not e
+        for c, w, e in zip(history.creator, history.adventure_week, history.adventure_excluded)
+    ]
+    for key in set(compress(zip(history.creator, history.adventure_week), counted)):
+        points[key] += rules.dm_bonus
+
+    counted = [w in weeks and not e for w, e in zip(history.week, history.excluded)]
+    keys = list(zip(history.user, history.week))
+    playing = [c and w == 0 for c, w in zip(counted, history.is_waitinglist)]
+    waiting = [c and w != 0 for c, w in zip(counted, history.is_waitinglist)] # retired waiting lists are 2
+    missed = [not a for a in history.appeared]
+
+    # No-shows: every missed session
+    for key, count in Counter(compress(keys, [p and m for p, m in zip(playing, missed)])).items():
+        points[key] += rules.no_show_penalty * count
+    # Waiting list: distinct (user, week)
+    for key in set(compress(keys, [w and not m for w, m in zip(waiting, missed)])):
+        points[key] += rules.waiting_list_attended
+    for key in set(compress(keys, [w and m for w, m in zip(waiting, missed)])):
+        points[key] += rules.waiting_list_missed
+    # Choice points: distinct (user, week, place) of attended sessions
+    attended = [p and not m for p, m in zip(playing, missed)]
+    for user_id, week, place in set(compress(zip(history.user, history.week, history.preference_place), attended)):
+        points[user_id, week] += rules.choice_points.get(place, 0)
+    return points
+
+def karma_replay_report(rules: KarmaRules, since: date | None = None, top=20, trajectories=False, full_history=False) -> dict:
+    """
+    Replay the settled weeks (since `since`) under `rules` and compare with the current karma.
+
+    By default only weeks found in the karma ledger are replayed: for each user the settled
+    points of those weeks are replaced by the replayed ones, everything else (opening balance,
+    weeks before `since`, manual events) is kept. The weeks before the ledger were folded into
+    one opening balance, so they are not replayed; the report's `meta.warning` says when the
+    history starts before the ledger. With `full_history` every week with assignments or
+    adventures is replayed from `STARTING_KARMA` instead, dropping the opening balances and
+    manual events (`since` does not apply).
+
+    Returns a JSON-serialisable report with a summary, the `top` users with the largest
+    difference and, with `trajectories`, every user's weekly karma.
+    """
+    if full_history and since is not None:
+        raise ValueError("A full history replay starts at the first week, it cannot have `since`.")
+
+    started = time.perf_counter()
+    history = load_karma_history()
+    history_weeks = sorted(set(history.week) | set(history.adventure_week))
+
+    settled_points = Counter()
+    warning = None
+    if full_history:
+        weeks = history_weeks
+    else:
+        settled = db.select(KarmaEvent.user_id, KarmaEvent.week_start, db.func.sum(KarmaEvent.points)).where(
+            KarmaEvent.rule.in_(SETTLEMENT_RULES)
+        )
+        if since is not None:
+            settled = settled.where(KarmaEvent.week_start >= since)
+        for user_id, week_start, points in db.session.execute(
+            settled.group_by(KarmaEvent.user_id, KarmaEvent.week_start)
+        ):
+            settled_points[user_id, week_start.toordinal()] += int(points)
+        weeks = sorted({week for _, week in settled_points})
+
+        first_week = since.toordinal() if since is not None else None
+        unreplayed = [
+            week for week in history_weeks
+            if (first_week is None or week >= first_week) and (not weeks or week < weeks[0])
+        ]
+        if unreplayed:
+            warning = (
+                f"{len(unreplayed)} weeks of history from {date.fromordinal(unreplayed[0]).isoformat()} on are "
+                "before the karma ledger and not replayed; use --full-history to include them."
+            )
+
+    replayed_points = replay_karma(history, rules, weeks)
+    elapsed = time.perf_counter() - started
+
+    settled_totals, replayed_totals = Counter(), Counter()
+    for (user_id, _), points in settled_points.items():
+        settled_totals[user_id] += points
+    for (user_id, _), points in replayed_points.items():
+        replayed_totals[user_id] += points
+
+    users = []
+    for user_id, karma, display_name in db.session.execute(db.select(User.id, User.karma, User.display_name)):
+        # a full replay is the whole balance, otherwise the replayed weeks replace the settled ones
+        kept = STARTING_KARMA if full_history else (karma or 0) - settled_totals[user_id]
+        replayed = kept + replayed_totals[user_id]
+        users.append({
+            "user_id": user_id,
+            "display_name": display_name,
+            "current": karma,
+            "replayed": replayed,
+            "difference": replayed - (karma or 0),
+        })
+    users.sort(key=lambda user: (-abs(user["difference"]), user["user_id"]))
+    differences = [user["difference"] for user in users]
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "rules": asdict(rules),
+            "since": since.isoformat() if since else None,
+            "full_history": full_history,
+            "weeks": len(weeks),
+            "warning": warning,
+            "assignments": len(history.user),
+            "replay_s": round(elapsed, 4),
+        },
+        "summary": {
+            "users": len(users),
+            "changed": sum(1 for d in differences if d),
+            "total_difference": sum(differences),
+            "max_gain": max(differences, default=0),
+            "max_loss": min(differences, default=0),
+        },
+        "top": users[:top],
+    }
+    if trajectories:
+        report["trajectories"] = karma_trajectories(users, replayed_points, weeks)
+    return report
+
+def karma_trajectories(users, replayed_points, weeks) -> dict:
+    """Replayed karma of every user after each replayed week, counting back from today's balance."""
+    trajectories = {}
+    for user in users:
+        user_id = user["user_id"]
+        balance = user["replayed"] - sum(replayed_points.get((user_id, week), 0) for week in weeks)
+        trajectory = []
+        for week in weeks:
+            balance += replayed_points.get((user_id, week), 0)
+            trajectory.append([date.fromordinal(week).isoformat(), balance])
+        trajectories[str(user_id)] = trajectory
+    return trajectories
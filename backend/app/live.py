@@ -0,0 +1,240 @@
+"""
+Live board updates over Server-Sent Events.
+
+Clients of `GET /api/stream/week/<week>` subscribe to one week and audience. On connect they
+get a `snapshot` of the week's summary: per adventure its title, seats, room, signup count
+and, where the audience may see it, its roster. Every write path that changes the board calls
+`app.board.invalidate_week_board` after its commit, which marks the subscribed weeks it
+touched; the publisher thread then rebuilds their summaries and pushes what changed as a
+`delta` event, so writes never wait for the summary queries.
+
+The publisher lives in the app process, which is the only process serving requests (see
+`app.versions`). Each stream holds a worker thread, so the number of subscribers is capped
+(`LIVE.max_subscribers`) and every stream ends after `LIVE.stream_seconds`; browsers reconnect
+on their own and get a fresh snapshot. A subscriber that falls behind by more than
+`MAX_QUEUED_EVENTS` is disconnected the same way.
+"""
+from collections import defaultdict
+from datetime import timedelta
+import queue
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import func
+
+from .models import db, Adventure, Assignment, Signup, User
+from .serializers import dumps
+
+MAX_QUEUED_EVENTS = 32 # events buffered per subscriber before it is disconnected
+LIVE_DEFAULTS = {"max_subscribers": 48, "keepalive_seconds": 15, "stream_seconds": 300, "retry_ms": 3000}
+
+
+def live_config(key):
+    return current_app.config.get("LIVE", {}).get(key, LIVE_DEFAULTS[key])
+
+def load_week_summary(week_start) -> dict:
+    """
+    `{audience: {adventure id: entry}}` of the week starting on `week_start`. Players see the
+    rosters once the last adventure of the week is released, like on the board.
+    """
+    week_end = week_start + timedelta(days=6)
+    adventures = db.session.execute(
+        db.select(
+            Adventure.id, Adventure.date, Adventure.title, Adventure.max_players,
+            Adventure.requested_room, Adventure.release_assignments,
+        )
+        .where(Adventure.date >= week_start, Adventure.date <= week_end)
+        .order_by(Adventure.date, Adventure.id)
+    ).all()
+    ids = [row.id for row in adventures]
+    signups = dict(db.session.execute(
+        db.select(Signup.adventure_id, func.count()).where(Signup.adventure_id.in_(ids)).group_by(Signup.adventure_id)
+    ).all())
+    players = defaultdict(list)
+    for adventure_id, user_id, display_name in db.session.execute(
+        db.select(Assignment.adventure_id, User.id, User.display_name)
+        .join(User, User.id == Assignment.user_id)
+        .where(Assignment.adventure_id.in_(ids))
+        .order_by(Assignment.adventure_id, User.id)
+    ):
+        players[adventure_id].append({"id": user_id, "display_name": display_name})
+
+    released = bool(adventures) and adventures[-1].release_assignments # see `check_release`
+    summary = {"admin": {}, "player": {}}
+    for row in adventures:
+        entry = {
+            "id": row.id,
+            "date": row.date,
+            "title": row.title,
+            "max_players": row.max_players,
+            "requested_room": row.requested_room,
+            "release_assignments": row.release_assignments,
+            "signups": signups.get(row.id, 0),
+        }
+        summary["admin"][row.id] = {**entry, "players": players[row.id]}
+        summary["player"][row.id] = {**entry, "players": players[row.id]} if released else entry
+    return summary
+
+def sse_event(kind, data) -> bytes:
+    return b"event: " + kind.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+class Subscriber:
+    def __init__(self, week_start, audience):
+        self.week_start = week_start
+        self.audience = audience
+        self.events = queue.Queue(maxsize=MAX_QUEUED_EVENTS)
+        self.closed = False
+
+    def push(self, event):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.close()
+
+    def close(self):
+        self.closed = True
+        try:
+            self.events.put_nowait(None)
+        except queue.Full:
+            pass # the stream sees `closed` on its next event
+
+
+class BoardPublisher:
+    """
+    Subscribers by `(week_start, audience)` and the last summary sent to them. Writes only mark
+    the subscribed weeks they touched; one publisher thread, running while there are
+    subscribers, builds and diffs their summaries and pushes the deltas in commit order. It also
+    sends the snapshots of new subscribers, so no delta can reach a subscriber before its snapshot.
+    """
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.summaries = {}
+        self.dirty = set() # weeks changed since their summary was built
+        self.joining = set() # subscribers still waiting for their snapshot
+        self.changed = threading.Condition()
+        self.thread = None
+
+    def subscribe(self, week_start, audience, max_subscribers):
+        """A new `Subscriber`, whose first event is the snapshot of its week, or None if there are too many subscribers."""
+        with self.changed:
+            if sum(len(subscribers) for subscribers in self.subscribers.values()) >= max_subscribers:
+                return None
+            subscriber = Subscriber(week_start, audience)
+            self.subscribers[week_start, audience].add(subscriber)
+            self.joining.add(subscriber)
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, args=(current_app._get_current_object(),), name="board-publisher", daemon=True,
+                )
+                self.thread.start()
+            self.changed.notify()
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.changed:
+            key = (subscriber.week_start, subscriber.audience)
+            self.joining.discard(subscriber)
+            self.subscribers[key].discard(subscriber)
+            if not self.subscribers[key]:
+                del self.subscribers[key]
+            if not self.subscribed(subscriber.week_start):
+                self.summaries.pop(subscriber.week_start, None)
+            self.changed.notify()
+
+    def subscribed(self, week_start) -> bool:
+        return any(subscriber_week == week_start for subscriber_week, _ in self.subscribers)
+
+    def publish(self, first=None, last=None):
+        """Mark the subscribed weeks that overlap `first` to `last` (every week if not given) for the publisher thread."""
+        with self.changed:
+            weeks = {
+                week_start for week_start, _ in self.subscribers
+                if first is None or (week_start <= (last or first) and first <= week_start + timedelta(days=6))
+            }
+            if weeks:
+                self.dirty |= weeks
+                self.changed.notify()
+
+    def _run(self, app):
+        while True:
+            with self.changed:
+                while self.subscribers and not self.dirty and not self.joining:
+                    self.changed.wait()
+                if not self.subscribers:
+                    self.thread = None
+                    return
+                weeks, self.dirty = self.dirty, set()
+                weeks |= {subscriber.week_start for subscriber in self.joining if subscriber.week_start not in self.summaries}
+
+            summaries = {}
+            with app.app_context():
+                try:
+                    for week_start in weeks:
+                        try:
+                            summaries[week_start] = load_week_summary(week_start)
+                        except Exception as e:
+                            app.logger.warning("Dropping live subscribers of %s: %s", week_start, e)
+                            summaries[week_start] = None
+                finally:
+                    db.session.remove()
+
+            with self.changed:
+                for week_start, summary in summaries.items():
+                    if self.subscribed(week_start):
+                        self._deliver(week_start, summary)
+                for subscriber in [subscriber for subscriber in self.joining if subscriber.week_start in self.summaries]:
+                    self.joining.discard(subscriber)
+                    adventures = list(self.summaries[subscriber.week_start][subscriber.audience].values())
+                    subscriber.push(sse_event("snapshot", {"week": subscriber.week_start, "adventures": adventures}))
+
+    def _deliver(self, week_start, summary):
+        """Store the new summary of `week_start` and push its delta to the subscribers that have their snapshot."""
+        if summary is None:
+            self.summaries.pop(week_start, None)
+            for (subscriber_week, _), subscribers in self.subscribers.items():
+                if subscriber_week == week_start:
+                    for subscriber in subscribers:
+                        self.joining.discard(subscriber)
+                        subscriber.close()
+            return
+        previous, self.summaries[week_start] = self.summaries.get(week_start), summary
+        if previous is None:
+            return
+        for audience, entries in summary.items():
+            changed = [entry for key, entry in entries.items() if previous[audience].get(key) != entry]
+            removed = [key for key in previous[audience] if key not in entries]
+            if not changed and not removed:
+                continue
+            event = sse_event("delta", {"week": week_start, "changed": changed, "removed": removed})
+            for subscriber in self.subscribers.get((week_start, audience), ()):
+                if subscriber not in self.joining:
+                    subscriber.push(event)
+
+def board_publisher() -> BoardPublisher:
+    return current_app.extensions.setdefault("board_publisher", BoardPublisher())
+
+def publish_board_changes(first=None, last=None):
+    """Queue the changes between `first` and `last` (see `app.board.invalidate_week_board`) for the live subscribers."""
+    board_publisher().publish(first, last)
+
+def stream_week(publisher, subscriber, keepalive_seconds, stream_seconds, retry_ms):
+    """The SSE body of one subscriber: its snapshot, then its deltas, with keepalive comments while idle."""
+    deadline = time.monotonic() + stream_seconds
+    retry = b"retry: %d\n" % retry_ms # sent with the first chunk
+    try:
+        while not subscriber.closed:
+            timeout = min(keepalive_seconds, deadline - time.monotonic())
+            if timeout <= 0:
+                return
+            try:
+                event = subscriber.events.get(timeout=timeout)
+            except queue.Empty:
+                event = b": keepalive\n\n"
+            if event is None or subscriber.closed:
+                return
+            yield retry + event
+            retry = b""
+    finally:
+        publisher.unsubscribe(subscriber)
@@ -1,9 +1,14 @@
+from collections import defaultdict
 from datetime import datetime, timedelta
 from flask_login import UserMixin, AnonymousUserMixin
-from sqlalchemy import func
+from sqlalchemy import bindparam, event, func, inspect
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import Session
 
 from .provider import db
 
+STARTING_KARMA = 1000 # karma of a new user; `User.karma` is this plus the user's karma events
+
 def custom_name_resolver(schema):
     """Return a unique schema name by appending parent class context if needed."""
     name = schema.__class__.__name__
@@ -31,6 +36,9 @@ class FCMToken(db.Model):
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_karma_id', 'karma', 'id'), # leaderboard order and rank lookups
+    )
 
     id                  = db.Column(db.Integer, autoincrement=True, primary_key=True)
     google_id           = db.Column(db.String(100), nullable=False, unique=True)
@@ -43,7 +51,7 @@ class User(UserMixin, db.Model):
     personal_room       = db.Column(db.String(16), nullable=True)
     email               = db.Column(db.String(255), nullable=True)
     profile_pic         = db.Column(db.Text, nullable=True)
-    karma               = db.Column(db.Integer, default=1000)
+    karma               = db.Column(db.Integer, default=STARTING_KARMA) # cached sum of the karma_events ledger
     story_player        = db.Column(db.Boolean, nullable=False, default=False)
 
     adventures_created  = db.relationship('Adventure', back_populates='creator', lazy='dynamic')
@@ -131,6 +139,7 @@ class Adventure(db.Model):
     is_waitinglist      = db.Column(db.Integer, nullable=False, default=0) # 0 = no, 1 = yes, 2 = was waitinglist
     exclude_from_karma  = db.Column(db.Boolean, nullable=False, default=False)
     is_story_adventure  = db.Column(db.Boolean, nullable=False, default=False)
+    assigned_count      = db.Column(db.Integer, nullable=False, default=0, server_default="0") # number of assignments, see `adjust_assigned_counts`
 
     predecessor     = db.relationship('Adventure', remote_side=[id], foreign_keys=[predecessor_id])
     creator         = db.relationship('User', back_populates='adventures_created')
@@ -140,6 +149,15 @@ class Adventure(db.Model):
 
     def __repr__(self):
         return f"<Adventure(id={self.id}, title='{self.title}')>"
+
+    @hybrid_property
+    def open_seats(self) -> int:
+        return max(self.max_players - (self.assigned_count or 0), 0)
+
+    @open_seats.inplace.expression
+    @classmethod
+    def _open_seats_expression(cls):
+        return db.case((cls.max_players > cls.assigned_count, cls.max_players - cls.assigned_count), else_=0)
     
     @classmethod
     def create(cls, commit=True, **kwargs) -> "Adventure":
@@ -194,6 +212,46 @@ class Assignment(db.Model):
     def __repr__(self):
         return f"<Assignment(user_id={self.user_id}, adventure_id={self.adventure_id}, appeared={self.appeared}, preference_place={self.preference_place}, creation_date={self.creation_date})>"
 
+def adjust_assigned_counts(deltas, connection=None):
+    """
+    Add `{adventure_id: delta}` to `Adventure.assigned_count` with one executemany UPDATE.
+    Relative updates keep the counters right under concurrent transactions.
+    ORM adds, deletes and moves of `Assignment` objects are counted automatically on flush;
+    bulk statements on the assignments table have to call this themselves.
+    """
+    params = [
+        {"counted_adventure_id": adventure_id, "delta": delta}
+        for adventure_id, delta in deltas.items()
+        if adventure_id is not None and delta
+    ]
+    if not params:
+        return
+    adventures = Adventure.__table__
+    statement = (
+        adventures.update()
+        .where(adventures.c.id == bindparam("counted_adventure_id"))
+        .values(assigned_count=adventures.c.assigned_count + bindparam("delta"))
+    )
+    (connection or db.session).execute(statement, params)
+
+@event.listens_for(Session, "after_flush")
+def _count_flushed_assignments(session, flush_context):
+    deltas = defaultdict(int)
+    for obj in session.new:
+        if isinstance(obj, Assignment):
+            deltas[obj.adventure_id] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Assignment):
+            deltas[obj.adventure_id] -= 1
+    for obj in session.dirty:
+        if isinstance(obj, Assignment):
+            history = inspect(obj).attrs.adventure_id.history # a move changes the primary key
+            for adventure_id in history.deleted:
+                deltas[adventure_id] -= 1
+            for adventure_id in history.added:
+                deltas[adventure_id] += 1
+    adjust_assigned_counts(deltas, session.connection())
+
 class Signup(db.Model):
     __tablename__ = 'signups'
     __table_args__ = (
@@ -230,4 +288,79 @@ class AdventureRequestedPlayer(db.Model):
     user = db.relationship('User')
 
     def __repr__(self):
-        return f"<AdventureRequestedPlayer(adventure_id={self.adventure_id}, user_id={self.user_id})>"
\ No newline at end of file
+        return f"<AdventureRequestedPlayer(adventure_id={self.adventure_id}, user_id={self.user_id})>"
+
+class AssignmentRun(db.Model):
+    """Audit record of one committed weekly assignment, written once together with its assignments.
+    Decisions are stored as ids only, names are resolved when the run is read."""
+    __tablename__ = 'assignment_runs'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    week_start = db.Column(db.Date, nullable=False, index=True)
+    mode = db.Column(db.String(16), nullable=False)
+    seed = db.Column(db.BigInteger, nullable=False)
+    inputs_hash = db.Column(db.String(64), nullable=False)
+    statistics = db.Column(db.JSON, nullable=False)
+    decisions = db.Column(db.JSON, nullable=False) # per round: [[user_id, adventure_id, preference_place], ...]
+    timings = db.Column(db.JSON, nullable=False)   # seconds per step
+
+    def __repr__(self):
+        return f"<AssignmentRun(id={self.id}, week_start={self.week_start}, mode='{self.mode}', seed={self.seed})>"
+
+
+class KarmaEvent(db.Model):
+    """One entry of the karma ledger: the points a rule gave a user in one week.
+    The key (user, week, rule) is unique, so settling a week twice cannot count twice."""
+    __tablename__ = 'karma_events'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'week_start', 'rule', name='unique_user_week_rule'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    week_start = db.Column(db.Date, nullable=False, index=True)
+    rule = db.Column(db.String(32), nullable=False)
+    points = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    user = db.relationship('User')
+
+    def __repr__(self):
+        return f"<KarmaEvent(user_id={self.user_id}, week_start={self.week_start}, rule='{self.rule}', points={self.points})>"
+
+
+class KarmaRollup(db.Model):
+    """Karma of one user in one week, summed from the ledger when the week is settled.
+    Serves the karma history without touching assignments or the ledger."""
+    __tablename__ = 'karma_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'week_start', name='unique_user_week'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    week_start = db.Column(db.Date, nullable=False)
+    points = db.Column(db.Integer, nullable=False)
+    breakdown = db.Column(db.JSON, nullable=False) # rule -> points
+
+    def __repr__(self):
+        return f"<KarmaRollup(user_id={self.user_id}, week_start={self.week_start}, points={self.points})>"
+
+class CharacterSummary(db.Model):
+    """The D&D Beyond characters of one account in one campaign, as last fetched.
+    Serves `/api/characters/summary` without calling D&D Beyond, see `app.characters`."""
+    __tablename__ = 'character_summaries'
+    __table_args__ = (
+        db.UniqueConstraint('dnd_beyond_name', 'dnd_beyond_campaign', name='unique_account_campaign'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    dnd_beyond_name = db.Column(db.String(255), nullable=False)
+    dnd_beyond_campaign = db.Column(db.Integer, nullable=True)
+    characters = db.Column(db.JSON, nullable=False, default=list) # character summaries as fetched
+    fetched_at = db.Column(db.DateTime, nullable=True) # last successful refresh
+    attempted_at = db.Column(db.DateTime, nullable=False) # last refresh, successful or not
+
+    def __repr__(self):
+        return f"<CharacterSummary(dnd_beyond_name='{self.dnd_beyond_name}', dnd_beyond_campaign={self.dnd_beyond_campaign}, fetched_at={self.fetched_at})>"
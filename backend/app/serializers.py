@@ -0,0 +1,195 @@
+"""
+Precompiled serializers for the hottest read endpoints.
+
+Dumping the week board through `AdventureSchema` builds ORM objects for every adventure,
+assignment, signup and user and then walks every field of every object through
+marshmallow. Here the schemas are compiled once, per visibility class, into the columns
+they dump: rows are selected as plain tuples, zipped into dicts and encoded in one go.
+The output is the same JSON the schemas produce (keys sorted, like Flask's own provider).
+
+The field lists come from the marshmallow schemas, so a field added to a schema shows up
+here without further changes. Only column fields and nested schemas are supported;
+properties used as fields need an SQL expression (e.g. `Adventure.open_seats`).
+
+orjson is used for encoding when installed (`pip install adventureboard[speed]`),
+otherwise the standard library.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+import json
+
+from marshmallow import fields
+
+from .models import db, Adventure, Assignment, Signup, User
+
+try:
+    import orjson
+except ImportError: # optional dependency
+    orjson = None
+
+
+def dumps(data) -> bytes:
+    """Encode `data` as JSON with sorted keys; dates and datetimes in ISO format."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(data, sort_keys=True, default=lambda value: value.isoformat()).encode()
+
+
+@dataclass(frozen=True)
+class RowSerializer:
+    """The plain (non-nested) fields of a schema: the keys and the columns to select for them."""
+    keys: tuple
+    columns: tuple
+
+    def dict(self, values) -> dict:
+        return dict(zip(self.keys, values))
+
+def compile_rows(schema, model) -> RowSerializer:
+    keys, columns = [], []
+    for key, field in schema.dump_fields.items():
+        if isinstance(field, (fields.Nested, fields.List)):
+            continue
+        keys.append(key)
+        columns.append(getattr(model, field.attribute or key))
+    return RowSerializer(tuple(keys), tuple(columns))
+
+def nested_schema(schema, name):
+    """The schema of a `Nested` or `List(Nested)` field of `schema`, None if the field is excluded."""
+    field = schema.dump_fields.get(name)
+    if field is None:
+        return None
+    return field.inner.schema if isinstance(field, fields.List) else field.schema
+
+@dataclass(frozen=True)
+class ChildSerializer:
+    """A list field of child rows (assignments, signups), each with one nested parent object."""
+    rows: RowSerializer
+    nested_key: str
+    nested: RowSerializer | None
+
+def compile_children(schema, model, nested_key, nested_model) -> ChildSerializer | None:
+    if schema is None:
+        return None
+    nested = nested_schema(schema, nested_key)
+    return ChildSerializer(
+        compile_rows(schema, model), nested_key, compile_rows(nested, nested_model) if nested is not None else None,
+    )
+
+def load_children(serializer: ChildSerializer, parent_column, nested_id, join_on, where) -> dict:
+    """`{parent id: [child dict]}` for the children matching `where`, with their nested object."""
+    columns = [parent_column, *serializer.rows.columns]
+    if serializer.nested is not None:
+        columns += [nested_id, *serializer.nested.columns]
+    stmt = db.select(*columns).where(where)
+    if serializer.nested is not None:
+        stmt = stmt.outerjoin(nested_id.table, join_on)
+
+    width = len(serializer.rows.columns)
+    children = defaultdict(list)
+    for row in db.session.execute(stmt):
+        child = serializer.rows.dict(row[1:1 + width])
+        if serializer.nested is not None:
+            child[serializer.nested_key] = serializer.nested.dict(row[2 + width:]) if row[1 + width] is not None else None
+        children[row[0]].append(child)
+    return children
+
+
+class BoardSerializer:
+    """`AdventureSchema` with one set of excludes, i.e. one visibility class of the week board."""
+    def __init__(self, schema):
+        self.adventure = compile_rows(schema, Adventure)
+        creator = nested_schema(schema, "creator")
+        self.creator = compile_rows(creator, User) if creator is not None else None
+        self.assignments = compile_children(nested_schema(schema, "assignments"), Assignment, "user", User)
+        self.signups = compile_children(nested_schema(schema, "signups"), Signup, "user", User)
+
+    def dump(self, adventure_rows) -> list:
+        """Board entries of `adventure_rows`, which are `(id, user_id, *self.adventure.columns)`."""
+        ids = [row[0] for row in adventure_rows]
+        board = [self.adventure.dict(row[2:]) for row in adventure_rows]
+        if self.creator is not None:
+            creators = {
+                row[0]: self.creator.dict(row[1:])
+                for row in db.session.execute(
+                    db.select(User.id, *self.creator.columns)
+                    .where(User.id.in_({row[1] for row in adventure_rows if row[1] is not None}))
+                )
+            }
+            for entry, row in zip(board, adventure_rows):
+                entry["creator"] = creators.get(row[1])
+        for key, serializer, model in (("assignments", self.assignments, Assignment), ("signups", self.signups, Signup)):
+            if serializer is None:
+                continue
+            children = load_children(
+                serializer, model.adventure_id, User.id, User.id == model.user_id, model.adventure_id.in_(ids),
+            )
+            for entry, adventure_id in zip(board, ids):
+                entry[key] = children.get(adventure_id, [])
+        return board
+
+def render_week_board(serializers, week_start, week_end, user_is_admin) -> bytes:
+    """
+    The JSON week board from `serializers`, a `{"admin", "released", "unreleased"}` mapping of
+    `BoardSerializer`s that differ in nested fields only. Players see the assignments once the
+    last adventure is released.
+    """
+    columns = serializers["admin"].adventure.columns
+    stmt = db.select(Adventure.id, Adventure.user_id, Adventure.release_assignments, *columns)
+    if week_start and week_end:
+        stmt = stmt.where(Adventure.date >= week_start, Adventure.date <= week_end)
+    rows = db.session.execute(stmt.order_by(Adventure.date, Adventure.id)).all()
+
+    if user_is_admin:
+        visibility = "admin"
+    else:
+        visibility = "released" if rows and rows[-1][2] else "unreleased" # see `check_release`
+    return dumps(serializers[visibility].dump([(row[0], row[1], *row[3:]) for row in rows]))
+
+
+STREAM_CHUNK = 500 # users encoded per chunk of a streamed response
+
+class UserSignupsSerializer:
+    """`UserWithSignupsSchema` with one set of excludes, for the users with signups in one week."""
+    def __init__(self, schema):
+        self.user = compile_rows(schema, User)
+        self.signups = compile_children(nested_schema(schema, "signups"), Signup, "adventure", Adventure)
+
+    def stream(self, start_of_week, end_of_week, chunk_size=STREAM_CHUNK):
+        """
+        The JSON array of the users with signups in the week, ordered by id, as an iterator of
+        chunks of `chunk_size` users. The signups of the week are loaded with their adventures in
+        one query, and the first chunk of users, before this returns, so their errors reach the
+        endpoint. Every chunk is fetched in full with a keyset query and the connection is handed
+        back before it is sent, so a slow client does not hold a cursor or connection open.
+        """
+        in_week = Signup.adventure_date.between(start_of_week, end_of_week)
+        signups = None
+        if self.signups is not None:
+            signups = load_children(self.signups, Signup.user_id, Adventure.id, Adventure.id == Signup.adventure_id, in_week)
+        stmt = (
+            db.select(User.id, *self.user.columns)
+            .where(User.id.in_(db.select(Signup.user_id).where(in_week)))
+            .order_by(User.id)
+            .limit(chunk_size)
+        )
+        rows = db.session.execute(stmt).all()
+        db.session.rollback() # release the connection while the client reads
+        return self._chunks(stmt, rows, signups, chunk_size)
+
+    def _chunks(self, stmt, rows, signups, chunk_size):
+        yield b"["
+        separator = b""
+        while rows:
+            users = [self.user.dict(row[1:]) for row in rows]
+            if signups is not None:
+                for user, row in zip(users, rows):
+                    user["signups"] = signups.get(row[0], [])
+            yield separator + dumps(users)[1:-1]
+            separator = b","
+            if len(rows) < chunk_size:
+                break
+            try:
+                rows = db.session.execute(stmt.where(User.id > rows[-1][0])).all()
+            finally:
+                db.session.rollback()
+        yield b"]"
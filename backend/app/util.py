@@ -1,10 +1,18 @@
-from datetime import datetime, timedelta, date
+from datetime import timedelta, date
 from flask import current_app
-from collections import defaultdict
-from sqlalchemy.orm import joinedload
+from collections import Counter, defaultdict
 import calendar
+import time
 
 from .models import *
+from .assignment import (
+    load_room_requests, load_week_snapshot, persist_plan, plan_rooms, plan_statistics, room_capacities, solve_greedy,
+    search_seeds, week_seed, SOLVERS,
+    apply_promotions, claim_promotion, load_open_places, load_waiting_players, plan_promotions,
+    rank_waiting_players, Promotion, OUTSIDE_TOP_THREE,
+)
+from .board import invalidate_week_board
+from .karma import add_karma_event, settle_week
 from .email import notify_user, notifications_enabled
 from firebase_admin import messaging
 
@@ -81,6 +89,7 @@ def release_assignments(today=None):
 
         # Commit the update before notifications
         db.session.commit()
+        invalidate_week_board(start_of_week, end_of_week)
         current_app.logger.info(
             f"Releasing assignments for adventures between {start_of_week} and {end_of_week}: #{len(adventures)}: {[adventure.title for adventure in adventures]}"
         )
@@ -128,6 +137,7 @@ def reset_release(today=None):
         db.session.execute(stmt)
         current_app.logger.info(f"Reset release for adventures between {start_of_week} and {end_of_week}")
         db.session.commit()
+        invalidate_week_board(start_of_week, end_of_week)
     except Exception as e:
         db.session.rollback()
         raise e  
@@ -167,88 +177,107 @@ def make_waiting_list(today=None) -> Adventure:
     return waiting_list
     
 
-def assign_rooms_to_adventures(today=None):
+def plan_week_rooms(today=None, seed=None, players=None):
+    """
+    Compute the rooms of the upcoming week's adventures without writing anything.
+    Rooms and their capacities come from `ROOMS` in the config (see `room_capacities`);
+    `players` overrides the table sizes (see `load_room_requests`).
+    Returns the room requests of the week and the `RoomPlan`.
+    """
+    today = today or date.today()
+    start_of_week, end_of_week = get_upcoming_week(today)
+    seed = week_seed(start_of_week) if seed is None else seed
+    capacities = room_capacities(current_app.config.get("ROOMS", ["A", "B", "C", "D", "E", "Comp", "Hall"]))
+    room_requests = load_room_requests(start_of_week, end_of_week, players)
+    return room_requests, plan_rooms(room_requests, capacities, seed)
+
+def assign_rooms_to_adventures(today=None, seed=None):
+    """
+    Store the planned room of every adventure of the upcoming week. Adventures without a room
+    have their requested room cleared and are logged. Returns the `RoomPlan`.
+    """
     today = today or date.today()
     start_of_week, end_of_week = get_upcoming_week(today)
-    possible_rooms = current_app.config.get("ROOMS", ["A", "B", "C", "D", "E", "Comp", "Hall"])
     try:
-        this_weeks_adventures = (
+        room_requests, plan = plan_week_rooms(today, seed)
+        rooms = {**dict.fromkeys(plan.unroomed), **plan.rooms}
+        if rooms:
             db.session.execute(
-                db.select(Adventure)
-                .filter(
-                    Adventure.date >= start_of_week,
-                    Adventure.date <= end_of_week,
-                    Adventure.is_waitinglist == 0,  # Exclude waiting list
-                )
-                .order_by(
-                    func.random(), # Shuffle
-                )
-            ).scalars().all()
-        )
-        assigned_adventures = []
-        # First, handle personal rooms
-        for adventure in this_weeks_adventures:
-            if adventure.creator.personal_room is not None:
-                adventure.requested_room = adventure.creator.personal_room
-                assigned_adventures.append(adventure)
-                try:
-                    possible_rooms.remove(adventure.requested_room)
-                except ValueError:
-                    pass  # Room wasn’t in pool, ignore
-
-        # Assign remaining rooms to adventures without personal rooms
-        unassigned_adventures = [
-            adv for adv in this_weeks_adventures if adv not in assigned_adventures
-        ]
-        for adventure in unassigned_adventures:
-            if possible_rooms:
-                adventure.requested_room = possible_rooms.pop()
-            assigned_adventures.append(adventure)
-
-        # Flush changes so they're tracked before logging
-        db.session.flush()
+                db.update(Adventure),
+                [{"id": adventure_id, "requested_room": room} for adventure_id, room in rooms.items()],
+            )
 
         current_app.logger.info(
-            f"Assigned rooms to adventures between {start_of_week} and {end_of_week}: "
-            f"#{len(assigned_adventures)}: "
-            f"{[{adv.title, adv.requested_room} for adv in assigned_adventures]}"
+            "Assigned rooms to adventures between %s and %s: #%d: %s",
+            start_of_week, end_of_week, len(room_requests),
+            [(request.title, plan.rooms.get(request.id)) for request in room_requests],
         )
+        titles = {request.id: request.title for request in room_requests}
+        for adventure_id, reason in plan.unroomed.items():
+            current_app.logger.warning("No room for adventure %r (%d): %s", titles[adventure_id], adventure_id, reason)
 
         db.session.commit()
+        invalidate_week_board(start_of_week, end_of_week)
+        return plan
     except Exception as e:
         db.session.rollback()
         raise e
-    
-def try_to_signup_user_for_adventure(taken_places, players_signedup_not_assigned, adventure, user, assignment_map, preference_place=None):
-    """
-    Attempts to sign up a user for an adventure.
-
-    Modifies:
-      - taken_places (dict): increments the count for this adventure.
-      - players_signedup_not_assigned (list): removes the user if successfully assigned.
-      - assignment_map (dict): traces assignment in a human readable map. Provide None to disable this logging.
-    """
-    # Check if there is still room
-    if taken_places.get(adventure.id, 0) < adventure.max_players:
-        # Create an assignment (assuming this persists automatically)
-        assignment = Assignment(user=user, adventure=adventure, preference_place=preference_place)  # type: ignore
-        db.session.add(assignment)
-        if assignment_map is not None: # For human readability
-            assignment_map.setdefault(adventure.title, []).append(user.display_name)
-        db.session.flush()
-
-        # Increment the number of taken places
-        taken_places[adventure.id] = taken_places.get(adventure.id, 0) + 1
-        
-        # Remove the player from the not-assigned list (if present)
-        if user in players_signedup_not_assigned:
-            players_signedup_not_assigned.remove(user)
-        
-        return True  # Success
-    return False  # No slot available
 
+_planned_weeks = {} # (inputs hash, mode, seed, candidates) -> (plan, statistics) of recent plans
+PLAN_CACHE_SIZE = 16
 
-def assign_players_to_adventures(today=None):
+def plan_week_assignments(today=None, mode=None, seed=None, candidates=None):
+    """
+    Load the upcoming week into a snapshot and compute the assignment plan without writing anything.
+
+    `mode` selects the solver: "greedy" (default) or "optimal", which solves round 3 as a
+    min-cost flow. The default can be changed with `ASSIGNMENT.mode` in the config.
+    `seed` drives all tie-breaks (default: derived from the week), so the same inputs and seed
+    always give the same plan. With `candidates` > 1 (default: `ASSIGNMENT.candidates`) the
+    seeds `seed`, `seed + 1`, ... are solved in parallel (`ASSIGNMENT.workers` processes) and
+    the fairest plan (see `score_plan`) is returned together with the score of every candidate.
+    Recent plans are kept by inputs hash, which lets a previewed plan be stored without
+    solving it again.
+    Returns the snapshot, the plan and its preference statistics; in optimal mode the statistics
+    also contain those the greedy engine would have reached on the same snapshot. The time
+    spent loading and solving is returned under `timings`.
+    """
+    today = today or date.today()
+    config = current_app.config.get("ASSIGNMENT", {})
+    mode = mode or config.get("mode", "greedy")
+    if mode not in SOLVERS:
+        raise ValueError(f"Unknown assignment mode: {mode}")
+    candidates = candidates or config.get("candidates", 1)
+    start_of_week, end_of_week = get_upcoming_week(today)
+    start_of_month, end_of_month = get_this_month(today)
+    seed = week_seed(start_of_week) if seed is None else seed
+
+    started = time.perf_counter()
+    snapshot = load_week_snapshot(start_of_week, end_of_week, start_of_month, end_of_month)
+    key = (snapshot.fingerprint(), mode, seed, candidates)
+    loaded = time.perf_counter()
+    if key not in _planned_weeks:
+        seeds = [seed + offset for offset in range(candidates)]
+        best_seed, plan, scores = search_seeds(snapshot, mode, seeds, config.get("workers"))
+        statistics = {"mode": mode, "seed": best_seed, "inputs_hash": key[0], **plan_statistics(plan)}
+        if candidates > 1:
+            statistics["candidates"] = [
+                {"seed": candidate, "first_choice": score[0], "outside_top_three": -score[1], "waiting_list": -score[2]}
+                for candidate, score in scores.items()
+            ]
+        if mode != "greedy":
+            statistics["greedy"] = plan_statistics(solve_greedy(snapshot, best_seed))
+        if len(_planned_weeks) >= PLAN_CACHE_SIZE:
+            _planned_weeks.clear()
+        _planned_weeks[key] = (plan, statistics)
+    plan, statistics = _planned_weeks[key]
+    statistics = dict(statistics, timings={
+        "load_s": round(loaded - started, 4),
+        "solve_s": round(time.perf_counter() - loaded, 4), # ~0 if the plan was cached by a preview
+    })
+    return snapshot, plan, statistics
+
+def assign_players_to_adventures(today=None, mode=None, seed=None, candidates=None):
     """
     Creates assignments for players that signed up this week. Working in 6 rounds:
     0. Assign DM-requested players who have signed up for the adventure (highest priority)
@@ -258,310 +287,239 @@ def assign_players_to_adventures(today=None):
     4. Signup all remaining players ranked by their karma to any available adventure. Sorted by random.
     5. Signup the rest of the players to the waiting list.
     This means that a player with more karma will always be preferred also if the adventure was a lower priority of his.
+
+    The week is loaded into a snapshot with a fixed number of queries, the rounds run in memory
+    (see `app.assignment`) and the result is stored with a single bulk insert.
+    Every decision is recorded in an `AssignmentRun` written in the same transaction, so the
+    log only gets a summary line; see `get_assignment_run` for the details.
+    Returns the statistics of `plan_week_assignments` with the id of the run record.
     """
     today = today or date.today()
     start_of_week, end_of_week = get_upcoming_week(today)
-    start_of_month, end_of_month = get_this_month(today)
-    current_app.logger.info(f" >--- Assigning players from waiting list for week {start_of_week} to {end_of_week} ---< ")
-    # create a placeholder that will track how many places are already taken per adventure
-    taken_places = defaultdict(int)
-    assignment_map = defaultdict(list) # trace assignments in moa for human readability.
-
-
-    # Query old assignments per adventure in the date window to check for taken places
-    already_taken = (
-        db.session.execute(
-            db.select(
-                Assignment.adventure_id,
-                func.count(Assignment.user_id)
-            )
-            .join(Assignment.adventure)
-            .filter(
-                Adventure.date >= start_of_week,
-                Adventure.date <= end_of_week,
-            )
-            .group_by(Assignment.adventure_id)
-        ).all()
-    )
-    for adventure_id, count in already_taken:
-        taken_places[adventure_id] = count
-
-    # Subquery: get all assigned user ids this week
-    assigned_ids_subq = (
-        db.select(User.id)
-        .join(User.assignments)
-        .join(Assignment.adventure)
-        .filter(Adventure.date >= start_of_week, Adventure.date <= end_of_week)
-    )
+    current_app.logger.info(" >--- Assigning players to adventures for week %s to %s ---< ", start_of_week, end_of_week)
 
-    # Subquery: get number of signups per user this month
-    monthly_signup_count = (
-        db.select(func.count(Signup.id))
-        .join(Signup.adventure)
-        .filter(
-            Signup.user_id == User.id,  # correlate to outer User
-            Adventure.date >= start_of_month,
-            Adventure.date <= end_of_month,
-        )
-        .correlate(User)
-        .scalar_subquery()
+    snapshot, plan, statistics = plan_week_assignments(today, mode, seed, candidates)
+    waiting_list = make_waiting_list(today)
+    try:
+        started = time.perf_counter()
+        overflow = persist_plan(plan, waiting_list)
+        for user_id in overflow:
+            current_app.logger.error("Failed to assign player %s to waiting list!", user_id)
+        timings = dict(statistics.pop("timings"), persist_s=round(time.perf_counter() - started, 4))
+        run = record_assignment_run(start_of_week, plan, statistics, timings, waiting_list.id, overflow)
+        db.session.commit()
+        invalidate_week_board(start_of_week, end_of_week)
+    except Exception as e:
+        db.session.rollback()
+        raise e
+    current_app.logger.info(
+        "Assignment run %s: %s players, %s assigned, %s on the waiting list",
+        run.id, len(snapshot.players), len(plan.assignments), len(plan.waiting_list),
     )
+    statistics["run_id"] = run.id
+    return statistics
 
-    # Main query: players signed up this week but NOT in assigned_ids_subq
-    players_signedup_not_assigned = list(
-        db.session.execute(
-            db.select(User)
-            .join(User.signups)
-            .join(Signup.adventure)
-            .filter(
-                Adventure.date >= start_of_week,
-                Adventure.date <= end_of_week,
-                ~User.id.in_(assigned_ids_subq)   # exclude already assigned player
-            )
-            .options(
-                db.contains_eager(User.signups).contains_eager(Signup.adventure)
-            )
-            .order_by(
-                User.karma.desc(),              # 3. Karma
-                monthly_signup_count.desc(),    # 2. This month's signups number
-                func.random(),                  # 1. Random                
-            )
-        )
-        .unique()   # ensures deduplication when eager-loading collections
-        .scalars()
-        .all()
-    )
-    current_app.logger.info(f"Players signed up for the week {start_of_week} to {end_of_week}:   #{len(players_signedup_not_assigned)}: {[dict({user: user.signups}) for user in players_signedup_not_assigned]} ")
-    MAX_PRIORITY = 3
-    
-    # -- Round 0: Assign DM-requested players who have signed up --
-    # Get all adventures with requested players this week
-    adventures_with_requests = (
-        db.session.execute(
-            db.select(Adventure)
-            .join(AdventureRequestedPlayer)
-            .filter(
-                Adventure.date >= start_of_week,
-                Adventure.date <= end_of_week,
-                Adventure.is_waitinglist == 0  # Exclude waiting list
-            )
-            .distinct()
-        )
-        .scalars()
-        .all()
-    )
-    
-    round_ = []
-    for adventure in adventures_with_requests:
-        # Get requested players for this adventure
-        requested_player_ids = [
-            rp.user_id for rp in adventure.requested_players
-        ]
-        
-        # Find requested players who have signed up for this adventure and are not yet assigned
-        for user in list(players_signedup_not_assigned):
-            if user.id in requested_player_ids:
-                # Check if they signed up for this specific adventure
-                signup = next(
-                    (s for s in user.signups if s.adventure_id == adventure.id),
-                    None
-                )
-                if signup:
-                    # They signed up for this adventure - assign them with their priority
-                    prio = signup.priority
-                    if try_to_signup_user_for_adventure(taken_places, players_signedup_not_assigned, adventure, user, assignment_map, preference_place=prio):
-                        round_.append(user.display_name)
-                        current_app.logger.info(f"Assigned DM-requested player {user.display_name} to {adventure.title}")
-    
-    current_app.logger.info(f"- Players assigned in round 0 (DM-requested): #{len(round_)}: {round_} => {dict(taken_places)}")
-    
-    # -- First round of assigning players --
-    # Assign all players that already played last week.
-    round_ = []
-    
-    # go through priorities one by one
-    for prio in range(1, MAX_PRIORITY + 1):
-        for user in list(players_signedup_not_assigned):
-            # For the current signup per player check if the player was already assigned for the predecessor of this adventure
-            for signup in [s for s in user.signups if s.priority == prio]:
-                pre = signup.adventure.predecessor
-                if pre and any(a.user_id == user.id for a in pre.assignments):
-                    adventure = signup.adventure
-                    if try_to_signup_user_for_adventure(taken_places, players_signedup_not_assigned, adventure, user, assignment_map, preference_place=prio): 
-                        round_.append(user.display_name)
-                        break
-    current_app.logger.info(f"- Players assigned in round 1: #{len(round_)}: {round_} => {dict(taken_places)}")
-
-    # -- Second round of assigning players --
-    # Assign all story players sorted by karma, but only on story adventures.
-    round_ = []
-    # go through priorities one by one
-    for prio in range(1, MAX_PRIORITY + 1):
-        for user in list(players_signedup_not_assigned):
-            # For every player check if that player is story player, if not continue
-            if not user.story_player:
-                continue
-            for signup in [s for s in user.signups if s.priority == prio]:
-                adventure = signup.adventure
-                # Only prefer story players on story adventures
-                if not adventure.is_story_adventure:
-                    continue
-                if try_to_signup_user_for_adventure(taken_places, players_signedup_not_assigned, adventure, user, assignment_map, preference_place=prio): 
-                    round_.append(user.display_name)
-                    break
-    current_app.logger.info(f"- Players assigned in round 2: #{len(round_)}: {round_} => {dict(taken_places)}")
-
-    # -- Third round of assigning players --
-    # Assign all players ranked by their karma to the first available adventure in there signups. 
-    round_ = []
-    for prio in range(1, MAX_PRIORITY + 1):
-        for user in list(players_signedup_not_assigned):
-            for signup in [s for s in user.signups if s.priority == prio]:
-                adventure = signup.adventure
-                if try_to_signup_user_for_adventure(taken_places, players_signedup_not_assigned, adventure, user, assignment_map, preference_place=prio): 
-                    round_.append(user.display_name)
-                    break
-    current_app.logger.info(f"- Players assigned in round 3: #{len(round_)}: {round_} => {dict(taken_places)}")
-
-    adventures_this_week = (
-        db.session.execute(
-            db.select(Adventure)
-            .filter(Adventure.date >= start_of_week, Adventure.date <= end_of_week)
-            .order_by(func.random())
-            .distinct()
-        )
-        .scalars()
-        .all()
+def record_assignment_run(start_of_week, plan, statistics, timings, waiting_list_id=None, overflow=()):
+    """
+    Add the audit record of a plan to the session; the caller commits it with the assignments.
+    Players of the waiting-list round are recorded on `waiting_list_id`, or without an
+    adventure if they did not fit on it (`overflow`).
+    """
+    places = {a.user_id: (a.adventure_id, a.preference_place) for a in plan.assignments}
+    places.update({user_id: (waiting_list_id, None) for user_id in plan.waiting_list})
+    places.update({user_id: (None, None) for user_id in overflow})
+    decisions = [[[user_id, *places[user_id]] for user_id in user_ids] for user_ids in plan.rounds]
+    run = AssignmentRun(
+        week_start=start_of_week,
+        mode=statistics["mode"],
+        seed=statistics["seed"],
+        inputs_hash=statistics["inputs_hash"],
+        statistics=statistics,
+        decisions=decisions,
+        timings=timings,
     )
+    db.session.add(run)
+    db.session.flush()
+    return run
+
+def get_assignment_run(run_id):
+    """
+    Return an assignment run in readable form, with the names of players and adventures
+    resolved at read time, or None if there is no such run.
+    """
+    run = db.session.get(AssignmentRun, run_id)
+    if run is None:
+        return None
+    user_ids = {decision[0] for decisions in run.decisions for decision in decisions}
+    adventure_ids = {decision[1] for decisions in run.decisions for decision in decisions}
+    names = dict(db.session.execute(
+        db.select(User.id, User.display_name).where(User.id.in_(user_ids))
+    ).all()) if user_ids else {}
+    titles = dict(db.session.execute(
+        db.select(Adventure.id, Adventure.title).where(Adventure.id.in_(adventure_ids))
+    ).all()) if adventure_ids else {}
+    return {
+        "id": run.id,
+        "created_at": run.created_at,
+        "week_start": run.week_start,
+        "mode": run.mode,
+        "seed": run.seed,
+        "inputs_hash": run.inputs_hash,
+        "statistics": run.statistics,
+        "timings": run.timings,
+        "rounds": [
+            {
+                "round": round_no,
+                "decisions": [
+                    {
+                        "user_id": user_id,
+                        "display_name": names.get(user_id),
+                        "adventure_id": adventure_id,
+                        "adventure_title": titles.get(adventure_id),
+                        "preference_place": preference_place,
+                    }
+                    for user_id, adventure_id, preference_place in decisions
+                ],
+            }
+            for round_no, decisions in enumerate(run.decisions)
+        ],
+    }
+
+def preview_assignments(today=None, mode=None, seed=None, candidates=None):
+    """
+    Dry run of the `assign` admin action: plan rooms and players for the upcoming week
+    on a read-only snapshot and return the proposed rosters, rooms and per-round statistics.
+    Nothing is written, so it can be run as often as needed before the real assignment.
+    """
+    today = today or date.today()
+    start_of_week, end_of_week = get_upcoming_week(today)
+    snapshot, plan, statistics = plan_week_assignments(today, mode, seed, candidates)
+    planned = Counter(assignment.adventure_id for assignment in plan.assignments)
+    room_requests, rooms = plan_week_rooms(today, seed, {
+        adventure.id: snapshot.taken.get(adventure.id, 0) + planned[adventure.id]
+        for adventure in snapshot.playable_adventures()
+    })
+
+    names = {player.id: player.display_name for player in snapshot.players}
+    rosters = defaultdict(list)
+    for assignment in plan.assignments:
+        rosters[assignment.adventure_id].append({
+            "id": assignment.user_id,
+            "display_name": names[assignment.user_id],
+            "preference_place": assignment.preference_place,
+        })
+    return {
+        "week_start": start_of_week,
+        "week_end": end_of_week,
+        "statistics": statistics,
+        "rounds": [
+            {"round": round_no, "assigned": len(user_ids), "players": [names[uid] for uid in user_ids]}
+            for round_no, user_ids in enumerate(plan.rounds)
+        ],
+        "adventures": [
+            {
+                "id": adventure.id,
+                "title": adventure.title,
+                "room": rooms.rooms.get(adventure.id),
+                "max_players": adventure.max_players,
+                "already_assigned": snapshot.taken.get(adventure.id, 0),
+                "players": rosters[adventure.id],
+            }
+            for adventure in snapshot.playable_adventures()
+        ],
+        "waiting_list": [
+            {"id": user_id, "display_name": names[user_id], "preference_place": None}
+            for user_id in plan.waiting_list
+        ],
+        "unroomed": [
+            {"id": request.id, "title": request.title, "players": request.players, "reason": rooms.unroomed[request.id]}
+            for request in room_requests if request.id in rooms.unroomed
+        ],
+    }
 
-    # -- Fourth round of assigning players --
-    # Assign all players ranked by their karma to the first available adventure independent of any signups. 
-    round_ = []
-    for user in list(players_signedup_not_assigned):
-        for adventure in adventures_this_week:
-            # Check if player still fits into the adventure
-            if taken_places[adventure.id] < adventure.max_players:
-                # Assigned outside top 3 preferences
-                if try_to_signup_user_for_adventure(taken_places, players_signedup_not_assigned, adventure, user, assignment_map, preference_place=4): 
-                    round_.append(user.display_name)
-                    break
-    current_app.logger.info(f"- Players assigned in round 4: #{len(round_)}: {round_} => {dict(taken_places)}")
-
-
-    # -- Fifth round of assigning players --
-    # Assign all players not assigned yet to the waiting list.
-    round_ = []
-    waiting_list = make_waiting_list()
-    current_app.logger.info(f"Waiting-list adventure: {waiting_list}")
-    for user in list(players_signedup_not_assigned):
-        # For waiting list, no specific preference_place
-        if not try_to_signup_user_for_adventure(taken_places, players_signedup_not_assigned, waiting_list, user, assignment_map, preference_place=None):
-            current_app.logger.error(f"Failed to assign player {user.display_name} to waiting list!")
-    current_app.logger.info(f"- Players assigned in round 5: #{len(round_)}: {round_} => {dict(taken_places)}")
-
-    current_app.logger.info(f"Assigned players to adventures: {dict(assignment_map)}")
-    db.session.commit()
-
-def reassign_players_from_waiting_list(today=None):
+def reassign_players_from_waiting_list(today=None, seed=None):
     """
     Reassign players from the waiting list to newly opened slots in adventures this week.
+    The open places and the waiting players with their signups are loaded once, promotions are
+    planned in memory in karma order (see `plan_promotions`) and written with one bulk update.
+    Ties between adventures are broken by `seed` (default: derived from the week).
+    Returns the promotions.
     """
     today = today or date.today()
     start_of_week, end_of_week = get_upcoming_week(today)
-    current_app.logger.info(f" <--- Reassigning players from waiting list for week {start_of_week} to {end_of_week} ---> ")
+    seed = week_seed(start_of_week) if seed is None else seed
+    current_app.logger.info(" <--- Reassigning players from waiting list for week %s to %s ---> ", start_of_week, end_of_week)
 
     # Get the waiting list adventure
-    waiting_list = db.session.execute(
-        db.select(Adventure).where(Adventure.is_waitinglist == 1)
+    waiting_list_id = db.session.execute(
+        db.select(Adventure.id).where(Adventure.is_waitinglist == 1)
     ).scalars().first()
-    if not waiting_list:
+    if not waiting_list_id:
         current_app.logger.info("No waiting list adventure found. Skipping reassignment.")
-        return
-
-    # Get all assignments on the waiting list
-    waiting_list_assignments = db.session.execute(
-        db.select(Assignment)
-        .join(Assignment.user)
-        .where(Assignment.adventure_id == waiting_list.id)
-        .options(db.contains_eager(Assignment.user))
-        .order_by(User.karma.desc())  # Prioritize by karma
-    ).scalars().all()
-
-    if not waiting_list_assignments:
-        current_app.logger.info("No players on the waiting list. Skipping reassignment.")
-        return
+        return []
 
-    # Track reassigned users for logging
-    reassigned_users = []
-
-    for assignment in waiting_list_assignments:
-        user = assignment.user
-        assigned = False
+    waiting_players = load_waiting_players(waiting_list_id, start_of_week, end_of_week)
+    if not waiting_players:
+        current_app.logger.info("No players on the waiting list. Skipping reassignment.")
+        return []
+
+    promotions = plan_promotions(waiting_players, load_open_places(start_of_week, end_of_week), seed)
+    if promotions:
+        try:
+            apply_promotions(promotions, waiting_list_id)
+            db.session.commit()
+            invalidate_week_board(start_of_week, end_of_week)
+        except Exception as e:
+            db.session.rollback()
+            raise e
+        current_app.logger.info("Reassigned users from waiting list: %s", promotions)
+    return promotions
+
+def backfill_freed_seats(adventure_id, seed=None):
+    """
+    Promote the best waiting-list players (same order as `reassign_players_from_waiting_list`)
+    into the free places of one adventure, e.g. right after a cancellation.
+    Only the rows of this adventure and the waiting list are touched.
+
+    The adventure row is locked while its places are counted and each promotion claims the
+    player's waiting-list row with a conditional update, so concurrent cancellations can
+    neither overfill the adventure nor promote the same player twice.
+    Returns the promotions.
+    """
+    waiting_list = db.session.execute(
+        db.select(Adventure.id, Adventure.date).where(Adventure.is_waitinglist == 1)
+    ).first()
+    adventure = db.session.execute(
+        db.select(Adventure).where(Adventure.id == adventure_id)
+        .with_for_update().execution_options(populate_existing=True)
+    ).scalar_one_or_none()
+    if waiting_list is None or adventure is None or adventure.is_waitinglist:
+        db.session.rollback()
+        return []
+    start_of_week, end_of_week = get_this_week(waiting_list.date)
+    if not start_of_week <= adventure.date <= end_of_week:
+        db.session.rollback()
+        return [] # the waiting list belongs to another week
+    seed = week_seed(start_of_week) if seed is None else seed
 
-        # Find adventures this week that the user signed up for and have available slots
-        available_adventures = db.session.execute(
-            db.select(Adventure)
-            .outerjoin(Assignment, Assignment.adventure_id == Adventure.id)
-            .join(Signup, (Signup.adventure_id == Adventure.id) & (Signup.user_id == user.id))
-            .where(
-                Adventure.date >= start_of_week,
-                Adventure.date <= end_of_week,
-                Adventure.is_waitinglist == 0,  # Exclude waiting list
-            )
-            .group_by(Adventure.id)
-            .having(func.count(Assignment.user_id) < Adventure.max_players)
-            .order_by(
-                Signup.priority.asc(),  # 2. User's priority
-                func.random()           # 1. Random
-            ) 
-        ).scalars().all()
-
-        for adventure in available_adventures:
-            # Assign to the first available adventure
-            prio = db.session.execute(
-                db.select(Signup.priority)
-                .where(Signup.user_id == user.id, Signup.adventure_id == adventure.id)
-            ).scalar()
-            if prio is None:
-                prio = 4  # outside top three
-            new_assignment = Assignment(user=user, adventure=adventure, preference_place=prio)  # type: ignore
-            db.session.add(new_assignment)
-
-            # Remove from waiting list
-            db.session.delete(assignment)
-
-            reassigned_users.append((user.display_name, adventure.title))
-            assigned = True
-            break
-
-        if assigned:
-            continue
-
-        # If no signed-up adventures are available, assign to any open adventure
-        fallback_adventures = db.session.execute(
-            db.select(Adventure)
-            .outerjoin(Assignment, Assignment.adventure_id == Adventure.id)
-            .where(
-                Adventure.date >= start_of_week,
-                Adventure.date <= end_of_week,
-                Adventure.is_waitinglist == 0,  # Exclude waiting list
-            )
-            .group_by(Adventure.id)
-            .having(func.count(Assignment.user_id) < Adventure.max_players)
-            .order_by(func.random())
-        ).scalars().all()
-
-        for adventure in fallback_adventures:
-            # Assigned outside top three preferences (no signup)
-            new_assignment = Assignment(user=user, adventure=adventure, preference_place=4)  # type: ignore
-            db.session.add(new_assignment)
-            db.session.delete(assignment)
-            reassigned_users.append((user.display_name, adventure.title))
-            break
-
-    if reassigned_users:
-        current_app.logger.info(f"Reassigned users from waiting list: {reassigned_users}")
+    free_places = adventure.max_players - adventure.assigned_count
+    promotions = []
+    try:
+        if free_places > 0:
+            for player in rank_waiting_players(load_waiting_players(waiting_list.id, start_of_week, end_of_week), seed):
+                promotion = Promotion(player.id, adventure_id, dict(player.signups).get(adventure_id, OUTSIDE_TOP_THREE))
+                if claim_promotion(promotion, waiting_list.id):
+                    promotions.append(promotion)
+                    if len(promotions) == free_places:
+                        break
         db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+    if promotions:
+        invalidate_week_board(start_of_week, end_of_week)
+        current_app.logger.info("Backfilled adventure %s from waiting list: %s", adventure_id, promotions)
+    return promotions
 
 
 def has_no_empty_params(rule):
@@ -574,113 +532,57 @@ def get_google():
 
 
 def reassign_karma(today=None):
+    """
+    Settle the karma of this week (see `app.karma` for the rules). The results are written to
+    the karma ledger, one event per user and rule, and only the difference to what was already
+    settled for this week is applied to the users' karma, so running it twice changes nothing.
+    Returns the number of users whose karma changed.
+    """
     today = today or date.today()
     start_of_current_week, end_of_current_week = get_this_week(today)
-    current_app.logger.info(f"Reassigning karma for week {start_of_current_week} to {end_of_current_week}")
-
-    # DM: +500 karma for creating an adventure this week
-    creators = db.session.execute(
-        db.select(User)
-        .join(Adventure)
-        .where(
-            Adventure.date >= start_of_current_week,
-            Adventure.date <= end_of_current_week,
-            Adventure.exclude_from_karma.is_(False),
-        )
-        .distinct()
-    ).scalars().all()
-    for user in creators:
-        user.karma += 500
-    current_app.logger.info(f" - Assigned +500 karma to DMs: #{len(creators)}: {[user.display_name for user in creators]}")
-
-    # Not attending (non-waiting list): -500 karma
-    non_appearances = db.session.execute(
-        db.select(User)
-        .join(Assignment)
-        .join(Adventure)
-        .where(
-            Assignment.appeared.is_(False),
-            Adventure.is_waitinglist == 0,  # Ignore waiting list
-            Adventure.exclude_from_karma.is_(False),
-            Adventure.date >= start_of_current_week,
-            Adventure.date <= end_of_current_week
-        )
-    ).scalars().all()
-    for user in non_appearances:
-        user.karma -= 500
-    current_app.logger.info(f" - Assigned -500 karma to players who did not attend: #{len(non_appearances)}: {[user.display_name for user in non_appearances]}")
-
-    # Waiting list attending: +200 karma
-    waiting_attending = db.session.execute(
-        db.select(User)
-        .join(Assignment)
-        .join(Adventure)
-        .where(
-            Adventure.is_waitinglist == 1,
-            Assignment.appeared.is_(True),
-            Adventure.exclude_from_karma.is_(False),
-            Adventure.date >= start_of_current_week,
-            Adventure.date <= end_of_current_week
-        )
-        .distinct()
-    ).scalars().all()
-    for user in waiting_attending:
-        user.karma += 200
-    current_app.logger.info(f" - Assigned +200 karma to waiting-list attendees: #{len(waiting_attending)}: {[user.display_name for user in waiting_attending]}")
-
-    # Waiting list not attending: +180 karma
-    waiting_not_attending = db.session.execute(
-        db.select(User)
-        .join(Assignment)
-        .join(Adventure)
-        .where(
-            Adventure.is_waitinglist == 1,
-            Assignment.appeared.is_(False),
-            Adventure.exclude_from_karma.is_(False),
-            Adventure.date >= start_of_current_week,
-            Adventure.date <= end_of_current_week
+    current_app.logger.info("Reassigning karma for week %s to %s", start_of_current_week, end_of_current_week)
+
+    try:
+        deltas = settle_week(start_of_current_week, end_of_current_week)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+    if deltas:
+        invalidate_week_board(audience="admin") # admins see the karma of players on every board
+    current_app.logger.info(" - Karma changed for %s users", len(deltas))
+    return len(deltas)
+
+def check_assigned_counts(repair=False):
+    """
+    Compare `Adventure.assigned_count` with the actual number of assignments of every adventure.
+    Returns the mismatches as `(adventure_id, stored, actual)`; with `repair` they are corrected.
+    """
+    actual = func.count(Assignment.user_id)
+    mismatches = [
+        tuple(row) for row in db.session.execute(
+            db.select(Adventure.id, Adventure.assigned_count, actual)
+            .outerjoin(Assignment, Assignment.adventure_id == Adventure.id)
+            .group_by(Adventure.id, Adventure.assigned_count)
+            .having(Adventure.assigned_count != actual)
         )
-        .distinct()
-    ).scalars().all()
-    for user in waiting_not_attending:
-        user.karma += 180
-    current_app.logger.info(f" - Assigned +180 karma to waiting-list non-attendees: #{len(waiting_not_attending)}: {[user.display_name for user in waiting_not_attending]}")
-
-    # Choice-based points for players who attended non-waiting-list sessions
-    choice_points = {
-        1: 100,
-        2: 120,
-        3: 140,
-        4: 150,  # assigned outside top three
-    }
-    for prio, pts in choice_points.items():
-        users_for_prio = db.session.execute(
-            db.select(User)
-            .join(Assignment)
-            .join(Adventure)
-            .where(
-                Assignment.preference_place == prio,
-                Assignment.appeared.is_(True),
-                Adventure.is_waitinglist == 0,
-                Adventure.exclude_from_karma.is_(False),
-                Adventure.date >= start_of_current_week,
-                Adventure.date <= end_of_current_week,
+    ]
+    if repair and mismatches:
+        try:
+            db.session.execute(
+                db.update(Adventure),
+                [{"id": adventure_id, "assigned_count": count} for adventure_id, _, count in mismatches],
             )
-            .distinct()
-        ).scalars().all()
-        for user in users_for_prio:
-            user.karma += pts
-        current_app.logger.info(
-            f" - Assigned +{pts} karma to attendees with choice {prio}: #{len(users_for_prio)}: {[user.display_name for user in users_for_prio]}"
-        )
-    db.session.commit()
+            db.session.commit()
+            invalidate_week_board()
+        except Exception as e:
+            db.session.rollback()
+            raise e
+    return mismatches
 
 def last_minute_cancel_punish(user_id: int):
-    db.session.execute(
-        db.update(User)
-        .where(User.id == user_id)
-        .values(karma=User.karma - 300)
-    )
+    start_of_week, _ = get_this_week()
+    add_karma_event(user_id, start_of_week, "late_cancel", -300)
 
 def send_fcm_notification(user, title, body, category=None, link="OPEN_APP"):
     """Sends a push notification to all devices registered by a specific user."""
@@ -0,0 +1,95 @@
+"""
+Version stamps for conditional GETs.
+
+Every write path bumps a counter for what it changed: one per table ("users", "signups") and
+one per week of adventures and audience (see `app.board.invalidate_week_board`). A read
+endpoint derives its ETag from the counters of what it shows, so a client's `If-None-Match`
+can be answered with 304 before anything is loaded or dumped.
+
+A stamp must not be older than the data served under it. On MySQL's REPEATABLE READ a
+transaction sees the database as of its first query, which is usually the loading of
+`current_user`, before the stamp is read; `end_read_snapshot` ends that transaction so the
+response is built from a snapshot taken after the stamp.
+
+The counters live in the app process, which is the only process serving requests and running
+the scheduled jobs. A random epoch per process is part of every tag, so tags handed out
+before a restart never match again.
+"""
+from collections import Counter
+from datetime import timedelta
+import secrets
+import threading
+
+from flask import current_app, request
+from werkzeug.http import quote_etag
+
+from .provider import db
+
+MAX_STAMPED_WEEKS = 60 # longer ranges use the stamp of all weeks
+
+
+class VersionStamps:
+    def __init__(self):
+        self.epoch = secrets.token_hex(4)
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    def bump(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.counters[key] += 1
+
+    def stamp(self, *keys) -> str:
+        with self.lock:
+            return ".".join(str(self.counters[key]) for key in keys)
+
+def version_stamps() -> VersionStamps:
+    return current_app.extensions.setdefault("version_stamps", VersionStamps())
+
+def _mondays(first, last):
+    monday = first - timedelta(days=first.weekday())
+    while monday <= last:
+        yield monday
+        monday += timedelta(weeks=1)
+
+def bump_version(*tables):
+    """Mark `tables` (e.g. "users") as changed."""
+    version_stamps().bump(*tables)
+
+def bump_week_versions(first=None, last=None, audiences=("admin", "player")):
+    """Mark the weeks from `first` to `last` (every week if not given) as changed for `audiences`."""
+    keys = []
+    for audience in audiences:
+        keys.append(("any week", audience))
+        if first is None:
+            keys.append(("all weeks", audience))
+        else:
+            keys += [("week", monday, audience) for monday in _mondays(first, last or first)]
+    version_stamps().bump(*keys)
+
+def week_version(week_start, week_end, audience) -> str:
+    """Version of what a board of `week_start` to `week_end` shows to `audience`."""
+    if week_start is None or week_end is None or (week_end - week_start).days > 7 * MAX_STAMPED_WEEKS:
+        return version_stamps().stamp(("any week", audience))
+    return version_stamps().stamp(
+        ("all weeks", audience), *(("week", monday, audience) for monday in _mondays(week_start, week_end))
+    )
+
+def make_etag(*parts) -> str:
+    """A strong ETag of `parts`, prefixed with the process epoch."""
+    return "-".join(str(part) for part in (version_stamps().epoch, *parts))
+
+def not_modified(etag):
+    """A 304 response if the request's `If-None-Match` has `etag`, otherwise None."""
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def end_read_snapshot():
+    """End the request's read transaction, if any, so the next query sees every commit made up to now."""
+    db.session.rollback() # a no-op without a transaction
+
+def etag_header(etag) -> dict:
+    return {"ETag": quote_etag(etag)}
@@ -0,0 +1,281 @@
+"""
+Benchmark of the weekly assignment and karma engines on synthetic leagues.
+
+Every league is generated in a fresh SQLite database and then runs through one
+week: assignment, a round of cancellations, waiting-list reassignment, room
+assignment and karma settlement. Wall time, number of SQL statements and peak
+python memory of every step are written to a JSON file, so runs of different
+versions can be compared.
+
+Run from the backend directory:
+    uv run python -m benchmarks.league --sizes 100:10 1000:50 10000:200 --output bench.json
+"""
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from flask import Flask
+from sqlalchemy import event
+import sqlalchemy
+
+from app.models import adjust_assigned_counts, Adventure, AdventureRequestedPlayer, Assignment, Signup, User
+from app.provider import db
+from app.util import (
+    assign_players_to_adventures,
+    assign_rooms_to_adventures,
+    get_upcoming_week,
+    reassign_karma,
+    reassign_players_from_waiting_list,
+)
+
+TODAY = date(2024, 6, 18) # Tuesday: the upcoming week is also the week karma is settled for
+DEFAULT_SIZES = ["100:10", "1000:50", "5000:200"]
+CHAIN_SHARE = 0.3           # adventures continuing an adventure of last week
+STORY_ADVENTURE_SHARE = 0.1
+STORY_PLAYER_SHARE = 0.1
+REQUESTED_SHARE = 0.1       # adventures with DM-requested players
+SIGNUP_SHARE = 0.8          # players signing up this week
+CANCEL_SHARE = 0.1          # assignments cancelled before the waiting list is reassigned
+
+
+def make_app(database_uri):
+    """A bare app with only the database configured, enough to run the engines."""
+    app = Flask("benchmark")
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_uri
+    app.logger.setLevel(logging.CRITICAL) # messages are still formatted, just not printed
+    db.init_app(app)
+    return app
+
+
+@contextmanager
+def measure(step, results):
+    """Record wall time, executed statements and peak traced memory of the block."""
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall_time = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        event.remove(db.engine, "before_cursor_execute", count)
+        results.append({
+            "step": step,
+            "wall_time_s": round(wall_time, 4),
+            "queries": len(statements),
+            "peak_memory_kib": round(peak / 1024, 1),
+        })
+
+
+def generate_league(num_users, num_adventures, seed=0, today=TODAY):
+    """
+    Fill the database with a league of `num_users` users (the first `num_adventures`
+    of them are DMs) and `num_adventures` adventures in the upcoming week.
+    A share of the adventures continue an adventure of last week whose players sign up
+    again, some are story adventures and some have DM-requested players.
+    """
+    rng = random.Random(seed)
+    start_of_week, _ = get_upcoming_week(today)
+    wednesday = start_of_week + timedelta(days=2)
+
+    db.session.execute(db.insert(User), [
+        {
+            "id": user_id,
+            "google_id": f"bench-{user_id}",
+            "name": f"Player {user_id}",
+            "display_name": f"Player {user_id}",
+            "karma": rng.randint(0, 3000),
+            "story_player": rng.random() < STORY_PLAYER_SHARE,
+            "personal_room": "Hall" if user_id == 1 else None,
+            "dnd_beyond_campaign": user_id % 6 + 1,
+        }
+        for user_id in range(1, num_users + 1)
+    ])
+    dms = list(range(1, num_adventures + 1))
+    players = list(range(num_adventures + 1, num_users + 1)) or dms
+
+    adventures, predecessors, assignments = [], [], []
+    for index, dm in enumerate(dms):
+        adventure_id = index + 1
+        max_players = rng.randint(4, 6)
+        predecessor_id = None
+        if rng.random() < CHAIN_SHARE:
+            predecessor_id = num_adventures + adventure_id
+            predecessors.append({
+                "id": predecessor_id,
+                "title": f"Adventure {adventure_id} part 1",
+                "short_description": "",
+                "user_id": dm,
+                "max_players": max_players,
+                "date": wednesday - timedelta(days=7),
+                "num_sessions": 2,
+            })
+            for user_id in rng.sample(players, min(max_players, len(players))):
+                assignments.append({"user_id": user_id, "adventure_id": predecessor_id, "preference_place": 1})
+        adventures.append({
+            "id": adventure_id,
+            "title": f"Adventure {adventure_id}",
+            "short_description": "",
+            "user_id": dm,
+            "max_players": max_players,
+            "date": wednesday,
+            "predecessor_id": predecessor_id,
+            "is_story_adventure": rng.random() < STORY_ADVENTURE_SHARE,
+        })
+    if predecessors:
+        db.session.execute(db.insert(Adventure), predecessors)
+    db.session.execute(db.insert(Adventure), adventures)
+    if assignments:
+        db.session.execute(db.insert(Assignment), assignments)
+        adjust_assigned_counts(Counter(a["adventure_id"] for a in assignments))
+
+    # Popular adventures attract more signups; continuing players sign up for their sequel first
+    popularity = [rng.random() ** 2 + 0.05 for _ in adventures]
+    continuing = {a["user_id"]: a["adventure_id"] - num_adventures for a in assignments}
+    signups, wanted = [], {}
+    for user_id in players:
+        if rng.random() >= SIGNUP_SHARE:
+            continue
+        choices = [continuing[user_id]] if user_id in continuing else []
+        while len(choices) < min(3, len(adventures)):
+            adventure_id = rng.choices(adventures, weights=popularity)[0]["id"]
+            if adventure_id not in choices:
+                choices.append(adventure_id)
+        for priority, adventure_id in enumerate(choices, start=1):
+            signups.append({
+                "user_id": user_id,
+                "adventure_id": adventure_id,
+                "priority": priority,
+                "adventure_date": wednesday,
+            })
+            wanted.setdefault(adventure_id, []).append(user_id)
+    if signups:
+        db.session.execute(db.insert(Signup), signups)
+
+    requested = [
+        {"adventure_id": adventure["id"], "user_id": user_id}
+        for adventure in adventures
+        if rng.random() < REQUESTED_SHARE and wanted.get(adventure["id"])
+        for user_id in rng.sample(wanted[adventure["id"]], min(2, len(wanted[adventure["id"]])))
+    ]
+    if requested:
+        db.session.execute(db.insert(AdventureRequestedPlayer), requested)
+    db.session.commit()
+
+
+def cancel_assignments(share, seed=0, today=TODAY):
+    """Delete a random share of this week's assignments to open places for the waiting list."""
+    rng = random.Random(seed)
+    start_of_week, end_of_week = get_upcoming_week(today)
+    taken = db.session.execute(
+        db.select(Assignment.user_id, Assignment.adventure_id)
+        .join(Assignment.adventure)
+        .where(Adventure.date >= start_of_week, Adventure.date <= end_of_week, Adventure.is_waitinglist == 0)
+    ).all()
+    cancelled = rng.sample(taken, int(len(taken) * share))
+    for user_id, adventure_id in cancelled:
+        db.session.execute(
+            db.delete(Assignment).where(Assignment.user_id == user_id, Assignment.adventure_id == adventure_id)
+        )
+    adjust_assigned_counts({
+        adventure_id: -count for adventure_id, count in Counter(adventure_id for _, adventure_id in cancelled).items()
+    })
+    db.session.commit()
+
+
+def run_league(num_users, num_adventures, mode=None, seed=0):
+    """Generate one league in a temporary database and measure one week of it."""
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(f"sqlite:///{os.path.join(directory, 'league.db')}")
+        with app.app_context():
+            db.create_all()
+            generate_league(num_users, num_adventures, seed=seed)
+
+            with measure("assign_players_to_adventures", results):
+                assign_players_to_adventures(TODAY, mode=mode)
+            cancel_assignments(CANCEL_SHARE, seed=seed)
+            with measure("reassign_players_from_waiting_list", results):
+                reassign_players_from_waiting_list(TODAY)
+            with measure("assign_rooms_to_adventures", results):
+                assign_rooms_to_adventures(TODAY)
+            with measure("reassign_karma", results):
+                reassign_karma(TODAY)
+
+            db.session.remove()
+            db.engine.dispose()
+    for result in results:
+        result.update(users=num_users, adventures=num_adventures)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(sizes, mode=None, seed=0):
+    """Run every `(users, adventures)` size and return the JSON-serialisable report."""
+    results = []
+    for num_users, num_adventures in sizes:
+        results += run_league(num_users, num_adventures, mode=mode, seed=seed)
+    return {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "mode": mode or "greedy",
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def parse_size(size):
+    users, adventures = size.split(":")
+    return int(users), int(adventures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, metavar="USERS:ADVENTURES",
+                        help="league sizes to benchmark, e.g. 100:10 50000:500")
+    parser.add_argument("--mode", default=None, help="assignment solver mode (greedy or optimal)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    report = run_benchmark([parse_size(size) for size in args.sizes], mode=args.mode, seed=args.seed)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    for result in report["results"]:
+        print(
+            f"{result['users']:>6} users {result['adventures']:>4} adventures  {result['step']:<36}"
+            f"{result['wall_time_s']:>9.3f}s {result['queries']:>7} queries {result['peak_memory_kib']:>10.1f} KiB"
+        )
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
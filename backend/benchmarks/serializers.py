@@ -0,0 +1,136 @@
+"""
+Benchmark of the precompiled serializers against the marshmallow schemas they replace.
+
+A synthetic league (see `benchmarks.league`) is generated and assigned, then the week board
+and the users' signups of the week are rendered both ways, admin and player view, a number
+of times. The median wall time of each and the speed-up are written to a JSON file.
+
+Run from the backend directory:
+    uv run python -m benchmarks.serializers --users 1500 --adventures 200 --output serializers.json
+"""
+from datetime import datetime
+import argparse
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+
+import sqlalchemy
+
+from app.api import (
+    AdventureSchema, BOARD_SERIALIZERS, PLAYER_BOARD_EXCLUDE, USER_SIGNUPS_SERIALIZERS, UserWithSignupsSchema,
+)
+from app.board import load_week_board
+from app.models import Signup, User
+from app.provider import db
+from app.serializers import dumps, orjson, render_week_board
+from app.util import assign_players_to_adventures, get_upcoming_week
+from benchmarks.league import TODAY, generate_league, git_revision, make_app
+
+
+def median_time(render, repeat):
+    """Median wall time of `repeat` calls of `render`, each with a fresh session."""
+    times = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        render()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def marshmallow_board(start, end, exclude):
+    adventures = load_week_board(start, end, include_signups="signups" not in exclude)
+    return dumps(AdventureSchema(many=True, exclude=exclude).dump(adventures))
+
+
+def marshmallow_user_signups(start, end, exclude):
+    in_week = Signup.adventure_date.between(start, end)
+    users = db.session.execute(
+        db.select(User).where(User.signups.any(in_week)).order_by(User.id).options(
+            sqlalchemy.orm.selectinload(User.signups).selectinload(Signup.adventure),
+            db.with_loader_criteria(Signup, in_week, include_aliases=True),
+        )
+    ).scalars().all()
+    return dumps(UserWithSignupsSchema(many=True, exclude=exclude).dump(users))
+
+
+def run_serializers(num_users, num_adventures, repeat=5, seed=0):
+    """Generate one league in a temporary database and time both serializers on its week."""
+    start, end = get_upcoming_week(TODAY)
+    player_signups = ["privilege_level", "email", "signups", "karma"]
+    cases = [
+        ("board_admin",
+         lambda: marshmallow_board(start, end, []),
+         lambda: render_week_board(BOARD_SERIALIZERS, start, end, True)),
+        ("board_player",
+         lambda: marshmallow_board(start, end, PLAYER_BOARD_EXCLUDE + ["assignments"]),
+         lambda: render_week_board(BOARD_SERIALIZERS, start, end, False)),
+        ("user_signups_admin",
+         lambda: marshmallow_user_signups(start, end, []),
+         lambda: b"".join(USER_SIGNUPS_SERIALIZERS["admin"].stream(start, end))),
+        ("user_signups_player",
+         lambda: marshmallow_user_signups(start, end, player_signups),
+         lambda: b"".join(USER_SIGNUPS_SERIALIZERS["player"].stream(start, end))),
+    ]
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(f"sqlite:///{os.path.join(directory, 'league.db')}")
+        with app.app_context():
+            db.create_all()
+            generate_league(num_users, num_adventures, seed=seed)
+            assign_players_to_adventures(TODAY)
+
+            for name, marshmallow, precompiled in cases:
+                marshmallow_s = median_time(marshmallow, repeat)
+                precompiled_s = median_time(precompiled, repeat)
+                results.append({
+                    "case": name,
+                    "users": num_users,
+                    "adventures": num_adventures,
+                    "marshmallow_s": round(marshmallow_s, 4),
+                    "precompiled_s": round(precompiled_s, 4),
+                    "speedup": round(marshmallow_s / precompiled_s, 1) if precompiled_s else None,
+                    "bytes": len(precompiled()),
+                })
+
+            db.session.remove()
+            db.engine.dispose()
+    return {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "orjson": orjson.__version__ if orjson is not None else None,
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1500)
+    parser.add_argument("--adventures", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="serializer_results.json")
+    args = parser.parse_args()
+
+    report = run_serializers(args.users, args.adventures, repeat=args.repeat, seed=args.seed)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    for result in report["results"]:
+        print(
+            f"{result['case']:<22}{result['marshmallow_s']:>9.4f}s marshmallow {result['precompiled_s']:>9.4f}s precompiled"
+            f"{result['speedup']:>7}x {result['bytes']:>10} bytes"
+        )
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
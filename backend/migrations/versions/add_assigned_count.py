@@ -0,0 +1,38 @@
+"""add adventures.assigned_count seat counter
+
+Revision ID: add_assigned_count
+Revises: add_assignment_runs
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "add_assigned_count"
+down_revision = "add_assignment_runs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    columns = [col["name"] for col in inspector.get_columns("adventures")]
+    if "assigned_count" not in columns:
+        with op.batch_alter_table("adventures", schema=None) as batch_op:
+            batch_op.add_column(
+                sa.Column("assigned_count", sa.Integer(), nullable=False, server_default="0")
+            )
+
+    # Initialise the counters from the existing assignments
+    op.execute(
+        "UPDATE adventures SET assigned_count = "
+        "(SELECT COUNT(*) FROM assignments WHERE assignments.adventure_id = adventures.id)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("adventures", schema=None) as batch_op:
+        batch_op.drop_column("assigned_count")
@@ -0,0 +1,44 @@
+"""add assignment_runs table
+
+Revision ID: add_assignment_runs
+Revises: add_notif_fcm
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "add_assignment_runs"
+down_revision = "add_notif_fcm"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table("assignment_runs"):
+        op.create_table(
+            "assignment_runs",
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.Column("week_start", sa.Date(), nullable=False),
+            sa.Column("mode", sa.String(length=16), nullable=False),
+            sa.Column("seed", sa.BigInteger(), nullable=False),
+            sa.Column("inputs_hash", sa.String(length=64), nullable=False),
+            sa.Column("statistics", sa.JSON(), nullable=False),
+            sa.Column("decisions", sa.JSON(), nullable=False),
+            sa.Column("timings", sa.JSON(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_assignment_runs_week_start", "assignment_runs", ["week_start"])
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if inspector.has_table("assignment_runs"):
+        op.drop_index("ix_assignment_runs_week_start", table_name="assignment_runs")
+        op.drop_table("assignment_runs")
@@ -0,0 +1,40 @@
+"""add character_summaries
+
+Revision ID: add_character_summaries
+Revises: add_karma_rollups
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "add_character_summaries"
+down_revision = "add_karma_rollups"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table("character_summaries"):
+        op.create_table(
+            "character_summaries",
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("dnd_beyond_name", sa.String(length=255), nullable=False),
+            sa.Column("dnd_beyond_campaign", sa.Integer(), nullable=True),
+            sa.Column("characters", sa.JSON(), nullable=False),
+            sa.Column("fetched_at", sa.DateTime(), nullable=True),
+            sa.Column("attempted_at", sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("dnd_beyond_name", "dnd_beyond_campaign", name="unique_account_campaign"),
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if inspector.has_table("character_summaries"):
+        op.drop_table("character_summaries")
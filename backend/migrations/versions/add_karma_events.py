@@ -0,0 +1,63 @@
+"""add karma_events ledger
+
+Revision ID: add_karma_events
+Revises: add_assigned_count
+Create Date: 2026-10-18
+
+"""
+from datetime import date, datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "add_karma_events"
+down_revision = "add_assigned_count"
+branch_labels = None
+depends_on = None
+
+STARTING_KARMA = 1000
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if inspector.has_table("karma_events"):
+        return
+    op.create_table(
+        "karma_events",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("week_start", sa.Date(), nullable=False),
+        sa.Column("rule", sa.String(length=32), nullable=False),
+        sa.Column("points", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user_id", "week_start", "rule", name="unique_user_week_rule"),
+    )
+    op.create_index("ix_karma_events_week_start", "karma_events", ["week_start"])
+
+    # Karma earned before the ledger existed becomes one opening balance per user
+    today = date.today()
+    bind.execute(
+        sa.text(
+            "INSERT INTO karma_events (user_id, week_start, rule, points, created_at) "
+            "SELECT id, :week_start, 'opening_balance', karma - :starting_karma, :created_at "
+            "FROM users WHERE karma IS NOT NULL AND karma != :starting_karma"
+        ),
+        {
+            "week_start": today - timedelta(days=today.weekday()),
+            "starting_karma": STARTING_KARMA,
+            "created_at": datetime.now(),
+        },
+    )
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if inspector.has_table("karma_events"):
+        op.drop_index("ix_karma_events_week_start", table_name="karma_events")
+        op.drop_table("karma_events")
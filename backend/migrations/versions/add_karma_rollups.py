@@ -0,0 +1,58 @@
+"""add karma_rollups and an index on users.karma
+
+Revision ID: add_karma_rollups
+Revises: add_karma_events
+Create Date: 2026-10-18
+
+"""
+from collections import defaultdict
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "add_karma_rollups"
+down_revision = "add_karma_events"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table("karma_rollups"):
+        rollups = op.create_table(
+            "karma_rollups",
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("week_start", sa.Date(), nullable=False),
+            sa.Column("points", sa.Integer(), nullable=False),
+            sa.Column("breakdown", sa.JSON(), nullable=False),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("user_id", "week_start", name="unique_user_week"),
+        )
+
+        # Roll up the ledger written so far
+        breakdowns = defaultdict(dict)
+        for user_id, week_start, rule, points in bind.execute(
+            sa.text("SELECT user_id, week_start, rule, points FROM karma_events")
+        ):
+            breakdowns[user_id, week_start][rule] = points
+        if breakdowns:
+            op.bulk_insert(rollups, [
+                {"user_id": user_id, "week_start": week_start, "points": sum(rules.values()), "breakdown": rules}
+                for (user_id, week_start), rules in breakdowns.items()
+            ])
+
+    if "ix_users_karma_id" not in [index["name"] for index in inspector.get_indexes("users")]:
+        op.create_index("ix_users_karma_id", "users", ["karma", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_users_karma_id", table_name="users")
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if inspector.has_table("karma_rollups"):
+        op.drop_table("karma_rollups")
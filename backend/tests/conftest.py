@@ -1,8 +1,10 @@
+from contextlib import contextmanager
 from pathlib import Path
 import json
 import sys
 
 import pytest
+from sqlalchemy import event
 
 BACKEND_DIR = Path(__file__).resolve().parents[1]
 if str(BACKEND_DIR) not in sys.path:
@@ -92,6 +94,21 @@ def login(client, user_id: int):
         session["_fresh"] = True
 
 
+@contextmanager
+def count_statements():
+    """Collect the SQL statements executed inside the block; needs an app context."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+
+
 @pytest.fixture()
 def admin_user_id(app):
     with app.app_context():
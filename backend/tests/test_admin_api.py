@@ -1,6 +1,11 @@
+from datetime import date, timedelta
+
 import pytest
 
-from tests.conftest import login
+from app.models import Adventure, Assignment, Signup, User
+from app.provider import db
+from app.util import make_waiting_list
+from tests.conftest import count_statements, login
 
 
 @pytest.mark.parametrize("action", ["assign", "reassign", "release", "reset"])
@@ -16,6 +21,19 @@ def test_admin_actions_execute_for_admin(client, admin_user_id, action):
     assert response.status_code == 200
 
 
+@pytest.mark.parametrize("mode,status", [("greedy", 200), ("optimal", 200), ("unknown", 422)])
+def test_assign_action_accepts_solver_mode(client, admin_user_id, mode, status):
+    login(client, admin_user_id)
+
+    response = client.put(
+        "/api/player-assignments",
+        json={"action": "assign", "mode": mode},
+        base_url="https://localhost",
+    )
+
+    assert response.status_code == status
+
+
 def test_update_karma_executes_for_admin(client, admin_user_id):
     login(client, admin_user_id)
 
@@ -43,3 +61,175 @@ def test_update_karma_rejects_non_admin(client, normal_user_id):
     response = client.post("/api/update-karma", json={}, base_url="https://localhost")
 
     assert response.status_code == 401
+
+
+def test_assignment_preview_does_not_write(client, app, admin_user_id):
+    today = date(2024, 6, 18)  # Tuesday
+    with app.app_context():
+        player = User.create(google_id="player", name="Player")
+        adventure = Adventure.create(
+            title="Preview Adventure",
+            short_description="A test",
+            user_id=admin_user_id,
+            date=today + timedelta(days=1),
+            max_players=3,
+        )
+        db.session.add(Signup(user_id=player.id, adventure_id=adventure.id, priority=1, adventure_date=adventure.date))
+        db.session.commit()
+        adventure_id, player_id = adventure.id, player.id
+    login(client, admin_user_id)
+
+    response = client.get(
+        "/api/player-assignments/preview",
+        query_string={"date": today.isoformat(), "mode": "optimal"},
+        base_url="https://localhost",
+    )
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["statistics"]["first_choice"] == 1
+    assert data["rounds"][3]["players"] == ["Player"]
+    [proposed] = data["adventures"]
+    assert proposed["id"] == adventure_id
+    assert proposed["room"] is not None
+    assert proposed["players"] == [{"id": player_id, "display_name": "Player", "preference_place": 1}]
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count()).select_from(Assignment)) == 0
+        assert db.session.scalar(db.select(db.func.count()).select_from(Adventure)) == 1
+        assert db.session.get(Adventure, adventure_id).requested_room is None
+
+
+def test_assignment_preview_rejects_non_admin(client, normal_user_id):
+    login(client, normal_user_id)
+
+    response = client.get("/api/player-assignments/preview", base_url="https://localhost")
+
+    assert response.status_code == 401
+
+
+def test_assign_action_records_a_run(client, app, admin_user_id):
+    today = date(2024, 6, 18)  # Tuesday
+    with app.app_context():
+        player = User.create(google_id="player", name="Player")
+        adventure = Adventure.create(
+            title="Audited Adventure",
+            short_description="A test",
+            user_id=admin_user_id,
+            date=today + timedelta(days=1),
+            max_players=3,
+        )
+        db.session.add(Signup(user_id=player.id, adventure_id=adventure.id, priority=1, adventure_date=adventure.date))
+        db.session.commit()
+        adventure_id, player_id = adventure.id, player.id
+    login(client, admin_user_id)
+
+    response = client.put(
+        "/api/player-assignments",
+        json={"action": "assign", "date": today.isoformat(), "seed": 3},
+        base_url="https://localhost",
+    )
+    assert response.status_code == 200
+
+    runs = client.get("/api/player-assignments/runs", base_url="https://localhost").get_json()
+    [run] = runs
+    assert run["seed"] == 3
+    assert run["statistics"]["first_choice"] == 1
+    assert set(run["timings"]) == {"load_s", "solve_s", "persist_s"}
+
+    detail = client.get(f"/api/player-assignments/runs/{run['id']}", base_url="https://localhost").get_json()
+    assert detail["rounds"][3]["decisions"] == [{
+        "user_id": player_id,
+        "display_name": "Player",
+        "adventure_id": adventure_id,
+        "adventure_title": "Audited Adventure",
+        "preference_place": 1,
+    }]
+    missing = client.get("/api/player-assignments/runs/999", base_url="https://localhost")
+    assert missing.status_code == 404
+
+
+def test_cancellation_backfills_from_the_waiting_list(client, app, admin_user_id):
+    with app.app_context():
+        today = date.today()
+        waiting_list = make_waiting_list(today)
+        leaving = User.create(google_id="leaving", name="Leaving")
+        waiting = User.create(google_id="waiting", name="Waiting")
+        adventure = Adventure.create(
+            title="Popular Adventure",
+            short_description="A test",
+            user_id=admin_user_id,
+            date=waiting_list.date,
+            max_players=1,
+        )
+        db.session.add(Assignment(user_id=leaving.id, adventure_id=adventure.id, preference_place=1))
+        db.session.add(Assignment(user_id=waiting.id, adventure_id=waiting_list.id))
+        db.session.commit()
+        adventure_id, leaving_id, waiting_id = adventure.id, leaving.id, waiting.id
+    login(client, admin_user_id)
+
+    response = client.delete(
+        "/api/player-assignments",
+        json={"adventure_id": adventure_id, "user_id": leaving_id},
+        base_url="https://localhost",
+    )
+
+    assert response.status_code == 200
+    with app.app_context():
+        assert db.session.scalars(
+            db.select(Assignment.user_id).where(Assignment.adventure_id == adventure_id)
+        ).all() == [waiting_id]
+
+
+def test_attendance_sheet_is_applied_in_one_update(client, app, admin_user_id):
+    with app.app_context():
+        dm = User.create(google_id="dm", name="DM")
+        players = [User.create(google_id=f"p{i}", name=f"Player {i}").id for i in range(3)]
+        first, second = (
+            Adventure.create(title=title, short_description="", user_id=dm.id, date=date(2024, 6, 19)).id
+            for title in ("First", "Second")
+        )
+        db.session.add_all([
+            Assignment(user_id=players[0], adventure_id=first),
+            Assignment(user_id=players[1], adventure_id=first),
+            Assignment(user_id=players[2], adventure_id=second),
+        ])
+        db.session.commit()
+
+        login(client, admin_user_id)
+        with count_statements() as statements:
+            response = client.post(
+                "/api/player-assignments/attendance",
+                json={"adventures": [
+                    {"adventure_id": first, "players": [
+                        {"user_id": players[0], "appeared": False}, {"user_id": players[1], "appeared": True},
+                    ]},
+                    {"adventure_id": second, "players": [{"user_id": players[2], "appeared": False}]},
+                ]},
+                base_url="https://localhost",
+            )
+
+        assert response.status_code == 200
+        assert [statement.split()[0] for statement in statements].count("UPDATE") == 1
+        appeared = db.session.execute(db.select(Assignment.user_id, Assignment.appeared).order_by(Assignment.user_id)).all()
+        assert appeared == [(players[0], False), (players[1], True), (players[2], False)]
+
+
+def test_attendance_sheet_is_all_or_nothing(client, app, admin_user_id, normal_user_id):
+    with app.app_context():
+        dm = User.create(google_id="dm", name="DM")
+        adventure = Adventure.create(title="Adventure", short_description="", user_id=dm.id, date=date(2024, 6, 19)).id
+        db.session.add(Assignment(user_id=normal_user_id, adventure_id=adventure))
+        db.session.commit()
+        dm_id = dm.id
+
+    sheet = {"adventures": [{"adventure_id": adventure, "players": [
+        {"user_id": normal_user_id, "appeared": False}, {"user_id": dm_id, "appeared": False},
+    ]}]}
+
+    login(client, normal_user_id)
+    assert client.post("/api/player-assignments/attendance", json=sheet, base_url="https://localhost").status_code == 401
+
+    login(client, admin_user_id)
+    assert client.post("/api/player-assignments/attendance", json=sheet, base_url="https://localhost").status_code == 404
+    with app.app_context():
+        assert db.session.scalar(db.select(Assignment.appeared)) is True
@@ -1,5 +1,15 @@
-from app.models import User
+from datetime import date
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from app.board import invalidate_week_board
+from app.models import Adventure, Assignment, Signup, User
 from app.provider import db
+from app.versions import version_stamps
+from tests.conftest import count_statements, login
+
+WEDNESDAY = date(2024, 6, 19)
 
 
 def test_alive_endpoint_reports_status(client):
@@ -44,3 +54,325 @@ def test_user_detail_and_patch(client, app):
     assert patch_response.status_code == 200
     patch_data = patch_response.get_json()
     assert patch_data["display_name"] == "Updated Name"
+
+
+def _board_query_count(client, app, admin_user_id, num_adventures, players_per_adventure):
+    with app.app_context():
+        dm = User.create(google_id=f"dm-{num_adventures}", name="DM")
+        for i in range(num_adventures):
+            adventure = Adventure.create(title=f"Adventure {i}", short_description="", user_id=dm.id, date=WEDNESDAY)
+            for j in range(players_per_adventure):
+                player = User.create(google_id=f"p-{num_adventures}-{i}-{j}", name="Player")
+                db.session.add(Assignment(user_id=player.id, adventure_id=adventure.id))
+                db.session.add(Signup(user_id=player.id, adventure_id=adventure.id, priority=1, adventure_date=WEDNESDAY))
+        db.session.commit()
+
+        login(client, admin_user_id)
+        with count_statements() as statements:
+            response = client.get(
+                "/api/adventures",
+                query_string={"week_start": WEDNESDAY.isoformat(), "week_end": WEDNESDAY.isoformat()},
+                base_url="https://localhost",
+            )
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert len(data) == num_adventures
+        assert all(len(adventure["assignments"]) == players_per_adventure for adventure in data)
+        assert all(len(adventure["signups"]) == players_per_adventure for adventure in data)
+        assert all(adventure["creator"]["id"] == dm.id for adventure in data)
+        return len(statements)
+
+
+def test_week_board_query_count_is_constant(client, app, admin_user_id):
+    """The week board loads creators, assignments and signups with their users in a fixed number of queries."""
+    small = _board_query_count(client, app, admin_user_id, 1, 1)
+    with app.app_context():
+        for table in (Signup, Assignment, Adventure):
+            db.session.execute(db.delete(table))
+        db.session.commit()
+        invalidate_week_board() # the deletes above bypass the write paths
+    large = _board_query_count(client, app, admin_user_id, 8, 5)
+
+    assert small == large
+
+
+def test_single_adventure_loads_its_players(client, app):
+    with app.app_context():
+        dm = User.create(google_id="dm", name="DM")
+        player = User.create(google_id="player", name="Player")
+        adventure = Adventure.create(title="Adventure", short_description="", user_id=dm.id, date=WEDNESDAY)
+        adventure.release_assignments = True
+        db.session.add(Assignment(user_id=player.id, adventure_id=adventure.id))
+        db.session.commit()
+        adventure_id, player_id = adventure.id, player.id
+
+    response = client.get(f"/api/adventures/{adventure_id}", base_url="https://localhost")
+
+    assert response.status_code == 200
+    [data] = response.get_json()
+    assert [assignment["user"]["id"] for assignment in data["assignments"]] == [player_id]
+    assert "signups" not in data
+
+
+def test_week_board_is_cached_until_a_write_touches_the_week(client, app, admin_user_id):
+    with app.app_context():
+        dm = User.create(google_id="dm", name="DM")
+        player = User.create(google_id="player", name="Player")
+        adventure = Adventure.create(title="Adventure", short_description="", user_id=dm.id, date=WEDNESDAY)
+        db.session.add(Assignment(user_id=player.id, adventure_id=adventure.id))
+        db.session.commit()
+
+    week = {"week_start": "2024-06-17", "week_end": "2024-06-23"}
+    assert "assignments" not in client.get("/api/adventures", query_string=week, base_url="https://localhost").get_json()[0]
+
+    with app.app_context():
+        with count_statements() as statements:
+            client.get("/api/adventures", query_string=week, base_url="https://localhost")
+        assert statements == []
+
+    login(client, admin_user_id)
+    response = client.put(
+        "/api/player-assignments", json={"action": "release", "date": "2024-06-16"}, base_url="https://localhost",
+    )
+    assert response.status_code == 200
+    with client.session_transaction() as session:
+        session.clear()
+
+    [board] = client.get("/api/adventures", query_string=week, base_url="https://localhost").get_json()
+    assert [assignment["user"]["display_name"] for assignment in board["assignments"]] == ["Player"]
+
+
+def test_conditional_get_answers_304_without_queries(client, app):
+    with app.app_context():
+        dm = User.create(google_id="dm", name="DM")
+        Adventure.create(title="Adventure", short_description="", user_id=dm.id, date=WEDNESDAY)
+
+    week = {"week_start": "2024-06-17", "week_end": "2024-06-23"}
+    first = client.get("/api/adventures", query_string=week, base_url="https://localhost")
+    users = client.get("/api/users", base_url="https://localhost")
+    assert first.headers["ETag"] and users.headers["ETag"]
+
+    with app.app_context():
+        with count_statements() as statements:
+            board = client.get(
+                "/api/adventures", query_string=week, headers={"If-None-Match": first.headers["ETag"]},
+                base_url="https://localhost",
+            )
+            listed = client.get("/api/users", headers={"If-None-Match": users.headers["ETag"]}, base_url="https://localhost")
+        assert (board.status_code, listed.status_code) == (304, 304)
+        assert board.headers["ETag"] == first.headers["ETag"]
+        assert statements == []
+
+
+def test_board_is_built_in_a_transaction_begun_after_its_stamp(client, app, admin_user_id, monkeypatch):
+    """Loading `current_user` opens the request's transaction; the board must not be built from that snapshot."""
+    with app.app_context():
+        dm = User.create(google_id="dm", name="DM")
+        Adventure.create(title="Adventure", short_description="", user_id=dm.id, date=WEDNESDAY)
+        stamps = version_stamps()
+    log = []
+    stamp = stamps.stamp
+    monkeypatch.setattr(stamps, "stamp", lambda *keys: log.append("stamp") or stamp(*keys))
+
+    def begin(conn):
+        log.append("begin")
+
+    login(client, admin_user_id)
+    week = {"week_start": "2024-06-17", "week_end": "2024-06-23"}
+    with app.app_context():
+        event.listen(db.engine, "begin", begin)
+        try:
+            with count_statements() as statements:
+                response = client.get("/api/adventures", query_string=week, base_url="https://localhost")
+        finally:
+            event.remove(db.engine, "begin", begin)
+
+    assert response.status_code == 200
+    assert log.index("stamp") < len(log) - 1 - log[::-1].index("begin")
+    assert any("FROM adventures" in statement for statement in statements)
+
+
+def test_writes_change_the_etag_of_what_they_touch(client, app, admin_user_id):
+    with app.app_context():
+        dm = User.create(google_id="dm", name="DM")
+        adventure = Adventure.create(title="Adventure", short_description="", user_id=dm.id, date=WEDNESDAY)
+        adventure_id = adventure.id
+
+    def etag(path, **kwargs):
+        return client.get(path, base_url="https://localhost", **kwargs).headers["ETag"]
+
+    week = {"week_start": "2024-06-17", "week_end": "2024-06-23"}
+    next_week = {"week_start": "2024-06-24", "week_end": "2024-06-30"}
+    login(client, admin_user_id)
+    board, other_board, users, signups = (
+        etag("/api/adventures", query_string=week),
+        etag("/api/adventures", query_string=next_week),
+        etag("/api/users"),
+        etag("/api/signups"),
+    )
+
+    response = client.post(
+        "/api/signups", json={"adventure_id": adventure_id, "priority": 1}, base_url="https://localhost",
+    )
+    assert response.status_code == 200
+
+    assert etag("/api/adventures", query_string=week) != board
+    assert etag("/api/adventures", query_string=next_week) == other_board
+    assert etag("/api/users") == users
+    assert etag("/api/signups") != signups
+
+
+def test_deleting_an_adventure_changes_the_etag_of_its_successors_week(client, app, admin_user_id):
+    with app.app_context():
+        dm = User.create(google_id="dm", name="DM")
+        first = Adventure.create(title="Part 1", short_description="", user_id=dm.id, date=WEDNESDAY).id
+        Adventure.create(
+            title="Part 2", short_description="", user_id=dm.id, date=date(2024, 6, 26), predecessor_id=first,
+        )
+
+    next_week = {"week_start": "2024-06-24", "week_end": "2024-06-30"}
+    login(client, admin_user_id)
+    board = client.get("/api/adventures", query_string=next_week, base_url="https://localhost")
+    assert board.get_json()[0]["predecessor_id"] == first
+
+    assert client.delete(f"/api/adventures/{first}", base_url="https://localhost").status_code == 200
+
+    after = client.get(
+        "/api/adventures", query_string=next_week, headers={"If-None-Match": board.headers["ETag"]},
+        base_url="https://localhost",
+    )
+    assert after.status_code == 200
+    assert after.get_json()[0]["predecessor_id"] is None
+
+
+def test_signups_etag_changes_when_their_user_is_renamed(client, app, normal_user_id):
+    with app.app_context():
+        dm = User.create(google_id="dm", name="DM")
+        adventure = Adventure.create(title="Adventure", short_description="", user_id=dm.id, date=WEDNESDAY)
+        db.session.add(Signup(user_id=normal_user_id, adventure_id=adventure.id, priority=1, adventure_date=WEDNESDAY))
+        db.session.commit()
+
+    login(client, normal_user_id)
+    first = client.get("/api/signups", base_url="https://localhost")
+    response = client.patch(f"/api/users/{normal_user_id}", json={"display_name": "Renamed"}, base_url="https://localhost")
+    assert response.status_code == 200
+
+    second = client.get("/api/signups", headers={"If-None-Match": first.headers["ETag"]}, base_url="https://localhost")
+    assert second.status_code == 200
+    assert [signup["user"]["display_name"] for signup in second.get_json()] == ["Renamed"]
+
+def test_users_list_pages_with_a_cursor(client, app):
+    with app.app_context():
+        ids = [User.create(google_id=f"u{i}", name=f"User {i}").id for i in range(5)]
+
+    first = client.get("/api/users", query_string={"limit": 2}, base_url="https://localhost")
+    assert [user["id"] for user in first.get_json()] == ids[:2]
+    assert first.headers["X-Next-Cursor"] == str(ids[1])
+
+    last = client.get(
+        "/api/users", query_string={"limit": 3, "after": first.headers["X-Next-Cursor"]}, base_url="https://localhost",
+    )
+    assert [user["id"] for user in last.get_json()] == ids[2:]
+    assert "X-Next-Cursor" not in last.headers
+
+
+def test_users_list_selects_fields_and_ids(client, app):
+    with app.app_context():
+        ids = [User.create(google_id=f"u{i}", name=f"User {i}", display_name=f"Name {i}").id for i in range(3)]
+
+    response = client.get(
+        "/api/users", query_string={"fields": "id,display_name", "ids": f"{ids[2]},{ids[0]}"}, base_url="https://localhost",
+    )
+    assert response.get_json() == [
+        {"id": ids[0], "display_name": "Name 0"},
+        {"id": ids[2], "display_name": "Name 2"},
+    ]
+
+    for fields in ("karma", "email", "nonsense"):
+        response = client.get("/api/users", query_string={"fields": fields}, base_url="https://localhost")
+        assert response.status_code == 422
+
+
+def test_user_signups_streams_only_the_users_of_the_week(client, app):
+    with app.app_context():
+        dm = User.create(google_id="dm", name="DM")
+        player = User.create(google_id="player", name="Player")
+        User.create(google_id="idle", name="Idle")
+        adventure = Adventure.create(title="Adventure", short_description="", user_id=dm.id, date=WEDNESDAY)
+        db.session.add(Signup(user_id=player.id, adventure_id=adventure.id, priority=1, adventure_date=WEDNESDAY))
+        db.session.commit()
+
+    response = client.get(f"/api/users/signups/{WEDNESDAY.isoformat()}", base_url="https://localhost")
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert [user["display_name"] for user in response.get_json()] == ["Player"]
+    assert "signups" not in response.get_json()[0]
+
+    empty = client.get("/api/users/signups/2024-06-26", base_url="https://localhost")
+    assert empty.get_json() == []
+
+
+def test_user_signups_stream_fails_before_sending_when_the_query_fails(client, app, monkeypatch):
+    def failing_execute(*args, **kwargs):
+        raise OperationalError("SELECT", {}, Exception("gone away"))
+    monkeypatch.setattr(db.session, "execute", failing_execute)
+
+    response = client.get(f"/api/users/signups/{WEDNESDAY.isoformat()}", base_url="https://localhost")
+
+    assert response.status_code == 500
+
+
+def test_week_signups_are_replaced_in_one_diff(client, app, normal_user_id):
+    with app.app_context():
+        dm = User.create(google_id="dm", name="DM")
+        monday, kept, dropped = (
+            Adventure.create(title=title, short_description="", user_id=dm.id, date=day).id
+            for title, day in (("Monday", date(2024, 6, 17)), ("Kept", WEDNESDAY), ("Dropped", WEDNESDAY))
+        )
+        other_week = Adventure.create(title="Other", short_description="", user_id=dm.id, date=date(2024, 6, 26))
+        db.session.add_all([
+            Signup(user_id=normal_user_id, adventure_id=kept, priority=1, adventure_date=WEDNESDAY),
+            Signup(user_id=normal_user_id, adventure_id=dropped, priority=2, adventure_date=WEDNESDAY),
+            Signup(user_id=normal_user_id, adventure_id=other_week.id, priority=1, adventure_date=other_week.date),
+        ])
+        db.session.commit()
+
+        login(client, normal_user_id)
+        with count_statements() as statements:
+            response = client.put(
+                "/api/signups/week/2024-06-19",
+                json={"signups": [{"adventure_id": kept, "priority": 1}, {"adventure_id": monday, "priority": 1}]},
+                base_url="https://localhost",
+            )
+
+        assert response.status_code == 200
+        assert response.get_json() == [{"adventure_id": monday, "priority": 1}, {"adventure_id": kept, "priority": 1}]
+        kinds = [statement.split()[0] for statement in statements]
+        assert kinds.count("DELETE") == 1 and kinds.count("INSERT") == 1
+        signups = db.session.execute(
+            db.select(Signup.adventure_id, Signup.priority).where(Signup.user_id == normal_user_id).order_by(Signup.adventure_id)
+        ).all()
+        assert signups == [(monday, 1), (kept, 1), (other_week.id, 1)]
+
+
+def test_week_signups_are_validated(client, app, normal_user_id):
+    with app.app_context():
+        dm = User.create(google_id="dm", name="DM")
+        first, second = (
+            Adventure.create(title=title, short_description="", user_id=dm.id, date=WEDNESDAY).id for title in ("A", "B")
+        )
+        other_week = Adventure.create(title="Other", short_description="", user_id=dm.id, date=date(2024, 6, 26)).id
+
+    login(client, normal_user_id)
+    for signups, status in (
+        ([{"adventure_id": other_week, "priority": 1}], 400),
+        ([{"adventure_id": first, "priority": 2}, {"adventure_id": second, "priority": 2}], 400),
+        ([{"adventure_id": first, "priority": 1}, {"adventure_id": first, "priority": 2}], 422),
+        ([{"adventure_id": first, "priority": 4}], 422),
+    ):
+        response = client.put("/api/signups/week/2024-06-19", json={"signups": signups}, base_url="https://localhost")
+        assert response.status_code == status
+
+    with app.app_context():
+        assert db.session.scalars(db.select(Signup)).all() == []
@@ -0,0 +1,376 @@
+"""Tests for the weekly player assignment."""
+from datetime import date, timedelta
+
+from app import assignment
+from app.assignment import claim_promotion, plan_rooms, Promotion, RoomRequest, OUTSIDE_TOP_THREE
+from app.models import Adventure, AdventureRequestedPlayer, Assignment, Signup, User
+from app.provider import db
+from app.util import (
+    assign_players_to_adventures, assign_rooms_to_adventures, backfill_freed_seats, check_assigned_counts, get_upcoming_week, make_waiting_list,
+    plan_week_assignments, reassign_players_from_waiting_list,
+)
+from tests.conftest import count_statements
+
+TODAY = date(2024, 6, 18)  # Tuesday
+START_OF_WEEK, _ = get_upcoming_week(TODAY)
+WEDNESDAY = START_OF_WEEK + timedelta(days=2)
+
+
+def make_adventure(title, max_players=5, **kwargs):
+    return Adventure.create(
+        title=title,
+        short_description="A test",
+        date=kwargs.pop("date", WEDNESDAY),
+        max_players=max_players,
+        **kwargs,
+    )
+
+
+def signup(user, adventure, priority):
+    db.session.add(Signup(user_id=user.id, adventure_id=adventure.id, priority=priority, adventure_date=adventure.date))
+
+
+def assignments_of(adventure_id):
+    return set(
+        db.session.scalars(db.select(Assignment.user_id).where(Assignment.adventure_id == adventure_id)).all()
+    )
+
+
+def test_higher_karma_gets_contested_first_choice(app):
+    with app.app_context():
+        rich = User.create(google_id="rich", name="Rich", karma=2000)
+        poor = User.create(google_id="poor", name="Poor", karma=500)
+        small = make_adventure("Small", max_players=1)
+        other = make_adventure("Other", max_players=1)
+        signup(rich, small, 1)
+        signup(poor, small, 1)
+        signup(poor, other, 2)
+        db.session.commit()
+
+        assign_players_to_adventures(TODAY)
+
+        assert assignments_of(small.id) == {rich.id}
+        assert assignments_of(other.id) == {poor.id}
+        preference = db.session.scalar(
+            db.select(Assignment.preference_place).where(Assignment.user_id == poor.id)
+        )
+        assert preference == 2
+
+
+def test_requested_and_continuing_players_are_preferred(app):
+    with app.app_context():
+        rich = User.create(google_id="rich", name="Rich", karma=5000)
+        requested = User.create(google_id="req", name="Requested", karma=0)
+        veteran = User.create(google_id="vet", name="Veteran", karma=0)
+
+        first, second = make_adventure("Chain", max_players=2, num_sessions=2, date=WEDNESDAY - timedelta(days=7))
+        db.session.add(Assignment(user_id=veteran.id, adventure_id=first.id, preference_place=1))
+        db.session.add(AdventureRequestedPlayer(adventure_id=second.id, user_id=requested.id))
+        for user in (rich, requested, veteran):
+            signup(user, second, 1)
+        db.session.commit()
+
+        assign_players_to_adventures(TODAY)
+
+        assert assignments_of(second.id) == {requested.id, veteran.id}
+        waiting_list = db.session.scalar(db.select(Adventure).where(Adventure.is_waitinglist == 1))
+        assert assignments_of(waiting_list.id) == {rich.id}
+
+
+def test_players_fill_free_places_outside_their_signups(app):
+    with app.app_context():
+        players = [User.create(google_id=f"p{i}", name=f"P{i}", karma=1000 - i) for i in range(3)]
+        wanted = make_adventure("Wanted", max_players=1)
+        spare = make_adventure("Spare", max_players=1)
+        for player in players:
+            signup(player, wanted, 1)
+        db.session.commit()
+
+        assign_players_to_adventures(TODAY)
+
+        assert assignments_of(wanted.id) == {players[0].id}
+        assert assignments_of(spare.id) == {players[1].id}
+        assert db.session.scalar(
+            db.select(Assignment.preference_place).where(Assignment.user_id == players[1].id)
+        ) == 4
+        waiting_list = db.session.scalar(db.select(Adventure).where(Adventure.is_waitinglist == 1))
+        assert assignments_of(waiting_list.id) == {players[2].id}
+
+
+def make_league(num_players, num_adventures):
+    adventures = [make_adventure(f"Adventure {i}", max_players=4) for i in range(num_adventures)]
+    for i in range(num_players):
+        user = User.create(google_id=f"league-{num_players}-{i}", name=f"Player {i}", karma=1000 + i, commit=False)
+        db.session.flush()
+        for prio in range(1, 4):
+            signup(user, adventures[(i + prio) % num_adventures], prio)
+    db.session.commit()
+
+
+def test_assignment_query_count_is_independent_of_league_size(app):
+    with app.app_context():
+        make_waiting_list(TODAY)
+        make_league(num_players=6, num_adventures=3)
+        with count_statements() as small_league:
+            assign_players_to_adventures(TODAY)
+        db.session.execute(db.delete(Assignment))
+        db.session.execute(db.delete(Signup))
+        db.session.commit()
+        check_assigned_counts(repair=True) # bulk deletes bypass the counters
+
+        make_league(num_players=60, num_adventures=12)
+        with count_statements() as large_league:
+            assign_players_to_adventures(TODAY)
+
+        assert db.session.scalar(db.select(db.func.count()).select_from(Assignment)) == 60
+        assert len(large_league) == len(small_league)
+
+
+def test_optimal_mode_avoids_wasting_contested_places(app):
+    with app.app_context():
+        flexible = User.create(google_id="flex", name="Flexible", karma=2000)
+        picky = User.create(google_id="picky", name="Picky", karma=500)
+        contested = make_adventure("Contested", max_players=1)
+        alternative = make_adventure("Alternative", max_players=1)
+        signup(flexible, contested, 1)
+        signup(flexible, alternative, 2)
+        signup(picky, contested, 1)
+        db.session.commit()
+
+        statistics = assign_players_to_adventures(TODAY, mode="optimal")
+
+        assert assignments_of(contested.id) == {picky.id}
+        assert assignments_of(alternative.id) == {flexible.id}
+        assert statistics["satisfaction"] == 5
+        assert statistics["greedy"]["satisfaction"] == 3
+        assert statistics["greedy"]["outside_top_three"] == 1
+
+
+def test_same_seed_gives_the_same_plan(app):
+    with app.app_context():
+        players = [User.create(google_id=f"tie{i}", name=f"Tie {i}", karma=1000) for i in range(8)]
+        adventures = [make_adventure(f"Tied {i}", max_players=2) for i in range(4)]
+        for player in players:
+            signup(player, adventures[0], 1)
+        db.session.commit()
+
+        def plan(seed):
+            _, plan, statistics = plan_week_assignments(TODAY, seed=seed)
+            statistics.pop("timings")
+            return sorted(plan.assignments, key=lambda a: a.user_id), statistics
+
+        first, statistics = plan(7)
+        assert plan(7) == (first, statistics)
+        assert statistics["seed"] == 7
+        assert len(statistics["inputs_hash"]) == 64
+        # Equal karma and signups: who gets the first choice only depends on the seed
+        winners = {frozenset(a.user_id for a in plan(seed)[0] if a.preference_place == 1) for seed in range(10)}
+        assert len(winners) > 1
+
+
+def test_seed_search_commits_the_fairest_candidate(app):
+    with app.app_context():
+        app.config["ASSIGNMENT"] = {"workers": 2}
+        players = [User.create(google_id=f"search{i}", name=f"Search {i}", karma=1000) for i in range(6)]
+        first, second, third = (make_adventure(f"Search {i}", max_players=2) for i in range(3))
+        for i, player in enumerate(players):
+            signup(player, first, 1)
+            signup(player, second if i % 2 else third, 2)
+        db.session.commit()
+
+        statistics = assign_players_to_adventures(TODAY, seed=100, candidates=4)
+
+        assert [candidate["seed"] for candidate in statistics["candidates"]] == [100, 101, 102, 103]
+        best = max(
+            statistics["candidates"],
+            key=lambda c: (c["first_choice"], -c["outside_top_three"], -c["waiting_list"]),
+        )
+        assert statistics["seed"] == best["seed"]
+        assert statistics["first_choice"] == best["first_choice"]
+        assert len(assignments_of(first.id)) == 2
+
+
+def test_seed_search_spawns_its_pool_and_runs_inline_without_workers(app, monkeypatch):
+    contexts = []
+
+    class RecordingPool(assignment.ProcessPoolExecutor):
+        def __init__(self, *args, mp_context=None, **kwargs):
+            contexts.append(mp_context.get_start_method())
+            super().__init__(*args, mp_context=mp_context, **kwargs)
+
+    monkeypatch.setattr(assignment, "ProcessPoolExecutor", RecordingPool)
+    with app.app_context():
+        players = [User.create(google_id=f"pool{i}", name=f"Pool {i}") for i in range(4)]
+        adventure = make_adventure("Pool", max_players=2)
+        for player in players:
+            signup(player, adventure, 1)
+        db.session.commit()
+
+        app.config["ASSIGNMENT"] = {"workers": 0}
+        plan_week_assignments(TODAY, seed=1, candidates=3)
+        assert contexts == []
+
+        app.config["ASSIGNMENT"] = {"workers": 2}
+        plan_week_assignments(TODAY, seed=10, candidates=3) # another seed, not the cached plan
+        assert contexts == ["spawn"]
+
+def test_waiting_list_promotion_follows_karma_and_priority(app):
+    with app.app_context():
+        waiting_list = make_waiting_list(TODAY)
+        rich = User.create(google_id="rich", name="Rich", karma=3000)
+        middle = User.create(google_id="middle", name="Middle", karma=2000)
+        poor = User.create(google_id="poor", name="Poor", karma=1000)
+        stuck = User.create(google_id="stuck", name="Stuck", karma=0)
+        first = make_adventure("First", max_players=1)
+        second = make_adventure("Second", max_players=1)
+        spare = make_adventure("Spare", max_players=1)
+        for user in (rich, middle, poor, stuck):
+            db.session.add(Assignment(user_id=user.id, adventure_id=waiting_list.id))
+        signup(rich, second, 2)
+        signup(rich, first, 1)
+        signup(middle, first, 1)
+        signup(middle, second, 2)
+        signup(poor, first, 1)
+        db.session.commit()
+
+        with count_statements() as statements:
+            reassign_players_from_waiting_list(TODAY)
+
+        assert assignments_of(first.id) == {rich.id}
+        assert assignments_of(second.id) == {middle.id}
+        assert assignments_of(spare.id) == {poor.id}
+        assert assignments_of(waiting_list.id) == {stuck.id}
+        places = dict(db.session.execute(db.select(Assignment.user_id, Assignment.preference_place)).all())
+        assert (places[rich.id], places[middle.id], places[poor.id]) == (1, 2, 4)
+        assert len([s for s in statements if s.lstrip().upper().startswith("SELECT")]) == 3
+
+
+def test_backfill_fills_only_the_freed_seat(app):
+    with app.app_context():
+        waiting_list = make_waiting_list(TODAY)
+        leaving = User.create(google_id="leaving", name="Leaving", karma=0)
+        first = User.create(google_id="first", name="First", karma=3000)
+        second = User.create(google_id="second", name="Second", karma=2000)
+        full = make_adventure("Full", max_players=1)
+        other = make_adventure("Other", max_players=3)
+        db.session.add(Assignment(user_id=leaving.id, adventure_id=full.id, preference_place=1))
+        for user in (first, second):
+            db.session.add(Assignment(user_id=user.id, adventure_id=waiting_list.id))
+        signup(second, full, 1)
+        db.session.commit()
+
+        db.session.delete(db.session.get(Assignment, (leaving.id, full.id)))
+        db.session.commit()
+        [promotion] = backfill_freed_seats(full.id)
+
+        assert promotion == Promotion(first.id, full.id, OUTSIDE_TOP_THREE)
+        assert assignments_of(full.id) == {first.id}
+        assert assignments_of(other.id) == set()
+        assert assignments_of(waiting_list.id) == {second.id}
+        assert backfill_freed_seats(full.id) == []
+
+
+def test_a_waiting_player_can_only_be_claimed_once(app):
+    with app.app_context():
+        waiting_list = make_waiting_list(TODAY)
+        player = User.create(google_id="player", name="Player")
+        first, second = make_adventure("First"), make_adventure("Second")
+        db.session.add(Assignment(user_id=player.id, adventure_id=waiting_list.id))
+        db.session.commit()
+
+        assert claim_promotion(Promotion(player.id, first.id, 1), waiting_list.id)
+        assert not claim_promotion(Promotion(player.id, second.id, 1), waiting_list.id)
+        db.session.commit()
+        assert assignments_of(first.id) == {player.id}
+        assert assignments_of(second.id) == set()
+
+
+def test_seat_counters_follow_every_assignment_change(app):
+    with app.app_context():
+        waiting_list = make_waiting_list(TODAY)
+        players = [User.create(google_id=f"count{i}", name=f"Count {i}", karma=1000 - i) for i in range(4)]
+        first = make_adventure("First", max_players=2)
+        second = make_adventure("Second", max_players=1)
+        for player in players:
+            signup(player, first, 1)
+        db.session.commit()
+
+        assign_players_to_adventures(TODAY)                         # bulk insert
+        assert check_assigned_counts() == []
+        assert db.session.get(Adventure, first.id).open_seats == 0
+
+        moved = db.session.get(Assignment, (players[0].id, first.id))
+        moved.adventure_id = waiting_list.id                         # move
+        db.session.delete(db.session.get(Assignment, (players[1].id, first.id)))  # delete
+        db.session.commit()
+        assert check_assigned_counts() == []
+
+        reassign_players_from_waiting_list(TODAY)                  # bulk promotion
+        backfill_freed_seats(first.id)                               # claimed promotion
+        assert check_assigned_counts() == []
+        assert db.session.get(Adventure, first.id).open_seats == 0
+
+
+def test_check_seat_counts_command_repairs_counters(app):
+    with app.app_context():
+        adventure = make_adventure("Drifted")
+        db.session.execute(db.update(Adventure).where(Adventure.id == adventure.id).values(assigned_count=3))
+        db.session.commit()
+
+    runner = app.test_cli_runner()
+    assert runner.invoke(args=["check-seat-counts"]).exit_code == 1
+    assert runner.invoke(args=["check-seat-counts", "--repair"]).exit_code == 0
+    result = runner.invoke(args=["check-seat-counts"])
+    assert result.exit_code == 0
+    assert "0 mismatching adventures" in result.output
+
+
+def room_request(adventure_id, players, personal_room=None, preferred_room=None, day=WEDNESDAY):
+    return RoomRequest(adventure_id, f"Adventure {adventure_id}", day, players, personal_room, preferred_room)
+
+
+def test_large_tables_get_large_rooms():
+    capacities = {"Small": 4, "Hall": 12, "Medium": 6}
+    plan = plan_rooms([room_request(1, 3), room_request(2, 10), room_request(3, 5)], capacities)
+
+    assert plan.rooms == {1: "Small", 2: "Hall", 3: "Medium"}
+    assert plan.unroomed == {}
+
+
+def test_personal_and_preferred_rooms_come_first():
+    capacities = {"Small": 4, "Hall": 12, "Medium": 6}
+    plan = plan_rooms([
+        room_request(1, 10),
+        room_request(2, 3, personal_room="Hall"),
+        room_request(3, 5, preferred_room="Small"),   # too small, not granted
+        room_request(4, 2, preferred_room="Medium"),
+    ], capacities)
+
+    assert plan.rooms == {2: "Hall", 4: "Medium"}
+    assert plan.unroomed[3] == "no free room seats 5 players"   # preferred Small seats 4
+    assert plan.unroomed[1] == "no free room seats 10 players"
+
+
+def test_rooms_are_allocated_per_day():
+    capacities = {"Hall": 12}
+    thursday = WEDNESDAY + timedelta(days=1)
+    plan = plan_rooms([room_request(1, 5), room_request(2, 5, day=thursday), room_request(3, 5)], capacities)
+
+    assert plan.rooms[2] == "Hall"
+    assert len([a for a in (1, 3) if plan.rooms.get(a) == "Hall"]) == 1
+    assert list(plan.unroomed.values()) == ["no free room left"]
+
+
+def test_assign_rooms_reports_and_clears_unroomed_adventures(app):
+    with app.app_context():
+        app.config["ROOMS"] = {"Small": 4, "Hall": 12}
+        big = make_adventure("Big", max_players=10)
+        small = make_adventure("Small", max_players=3)
+        extra = make_adventure("Extra", max_players=6, requested_room="Small")
+        db.session.commit()
+
+        plan = assign_rooms_to_adventures(TODAY)
+
+        rooms = dict(db.session.execute(db.select(Adventure.id, Adventure.requested_room)).all())
+        assert rooms == {big.id: "Hall", small.id: "Small", extra.id: None}
+        assert plan.unroomed == {extra.id: "no free room seats 6 players"}
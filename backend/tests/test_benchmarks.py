@@ -0,0 +1,46 @@
+"""Smoke tests for the benchmarks."""
+import json
+
+from benchmarks.league import main, run_benchmark
+from benchmarks.serializers import run_serializers
+
+STEPS = [
+    "assign_players_to_adventures",
+    "reassign_players_from_waiting_list",
+    "assign_rooms_to_adventures",
+    "reassign_karma",
+]
+
+
+def test_benchmark_reports_every_step():
+    report = run_benchmark([(40, 5)], mode="optimal")
+
+    assert report["meta"]["mode"] == "optimal"
+    assert [result["step"] for result in report["results"]] == STEPS
+    for result in report["results"]:
+        assert result["users"] == 40
+        assert result["adventures"] == 5
+        assert result["queries"] > 0
+        assert result["wall_time_s"] >= 0
+        assert result["peak_memory_kib"] > 0
+
+
+def test_benchmark_writes_json(tmp_path, monkeypatch):
+    output = tmp_path / "bench.json"
+    monkeypatch.setattr("sys.argv", ["league", "--sizes", "20:3", "--output", str(output)])
+
+    main()
+
+    report = json.loads(output.read_text())
+    assert len(report["results"]) == len(STEPS)
+
+
+def test_serializer_benchmark_compares_both_serializers():
+    report = run_serializers(40, 5, repeat=1)
+
+    assert [result["case"] for result in report["results"]] == [
+        "board_admin", "board_player", "user_signups_admin", "user_signups_player",
+    ]
+    for result in report["results"]:
+        assert result["marshmallow_s"] > 0 and result["precompiled_s"] > 0
+        assert result["bytes"] > 0
@@ -0,0 +1,100 @@
+from concurrent.futures import wait
+from datetime import datetime, timedelta
+
+import requests
+
+from app import characters
+from app.characters import refresh_character_summary, refresh_stale_characters, stale_character_accounts
+from app.models import CharacterSummary, User
+from app.provider import db
+from tests.conftest import count_statements
+
+SOURCE = "https://characters.test/summary?account={account}&campaign={campaign}"
+
+
+def stub_source(monkeypatch, fail=False):
+    """Stand-in for the character source: one character per account, named after it."""
+    calls = []
+
+    def fake_get(url, timeout=None):
+        calls.append((url, timeout))
+        if fail:
+            raise requests.Timeout("no answer")
+
+        class StubResponse:
+            def raise_for_status(self):
+                pass
+
+            def json(self):
+                account = url.split("account=")[1].split("&")[0]
+                return [{"id": len(calls), "name": f"Hero of {account}"}]
+
+        return StubResponse()
+
+    monkeypatch.setattr(characters.requests, "get", fake_get)
+    return calls
+
+
+def test_summary_is_served_from_the_cache_and_refreshed_in_the_background(client, app, monkeypatch):
+    calls = stub_source(monkeypatch)
+    app.config["CHARACTERS"] = {"source_url": SOURCE, "timeout_seconds": 3}
+    with app.app_context():
+        User.create(google_id="u1", name="Alice", dnd_beyond_name="alice")
+        User.create(google_id="u2", name="Bob")
+
+    first = client.get("/api/characters/summary", base_url="https://localhost")
+    assert first.status_code == 200
+    assert first.get_json() == {} # nothing cached yet
+    assert calls == [] # requests never fetch
+
+    with app.app_context():
+        wait(refresh_stale_characters())
+    assert calls == [("https://characters.test/summary?account=alice&campaign=1", 3)]
+    second = client.get("/api/characters/summary", base_url="https://localhost")
+    assert second.get_json() == {
+        "1": {"id": 1, "name": "Hero of alice", "dndbeyond_account": "alice", "campaign": "1"},
+    }
+    assert second.headers["ETag"] != first.headers["ETag"]
+
+    cached = client.get(
+        "/api/characters/summary", headers={"If-None-Match": second.headers["ETag"]}, base_url="https://localhost",
+    )
+    assert cached.status_code == 304
+
+    with app.app_context():
+        assert refresh_stale_characters() == []
+    assert len(calls) == 1 # fresh entries are not fetched again
+
+
+def test_revalidating_the_summary_does_not_scan_the_cache(client, app, monkeypatch):
+    stub_source(monkeypatch)
+    app.config["CHARACTERS"] = {"source_url": SOURCE}
+    with app.app_context():
+        User.create(google_id="u1", name="Alice", dnd_beyond_name="alice")
+    etag = client.get("/api/characters/summary", base_url="https://localhost").headers["ETag"]
+
+    with app.app_context(), count_statements() as statements:
+        cached = client.get("/api/characters/summary", headers={"If-None-Match": etag}, base_url="https://localhost")
+
+    assert cached.status_code == 304
+    assert not any("character_summaries" in statement for statement in statements)
+    assert not app.extensions["character_refresher"].pending
+
+
+def test_failed_refresh_keeps_the_characters_and_waits_to_retry(app, monkeypatch):
+    app.config["CHARACTERS"] = {"source_url": SOURCE, "max_age_minutes": 60, "retry_minutes": 10}
+    with app.app_context():
+        User.create(google_id="u1", name="Alice", dnd_beyond_name="alice")
+        stub_source(monkeypatch)
+        refresh_character_summary("alice", 1)
+
+        later = datetime.now() + timedelta(minutes=90)
+        assert stale_character_accounts(later) == [("alice", 1)]
+
+        stub_source(monkeypatch, fail=True)
+        refresh_character_summary("alice", 1)
+        summary = db.session.scalar(db.select(CharacterSummary))
+        assert [character["name"] for character in summary.characters] == ["Hero of alice"]
+        assert summary.attempted_at > summary.fetched_at
+        assert stale_character_accounts(summary.attempted_at + timedelta(minutes=5)) == []
+        assert stale_character_accounts(summary.attempted_at + timedelta(minutes=90)) == [("alice", 1)]
@@ -1,11 +1,15 @@
 """Tests for the reassign_karma function."""
 from datetime import date, timedelta
+import json
 
 import pytest
+from tests.conftest import count_statements, login
 
-from app.models import Adventure, Assignment, User
+from app.karma_replay import KarmaRules, karma_replay_report
+from app.models import Adventure, Assignment, KarmaEvent, KarmaRollup, User, STARTING_KARMA
 from app.provider import db
-from app.util import reassign_karma, get_this_week
+from app.karma import add_karma_event, check_karma, rebuild_karma
+from app.util import assign_players_to_adventures, reassign_karma, get_this_week
 
 
 @pytest.fixture()
@@ -297,8 +301,8 @@ def test_karma_only_assigned_for_specified_week(app, users):
         assert player.karma == initial_karma + 100  # First choice bonus
 
 
-def test_karma_is_cumulative_when_run_multiple_times(app, users):
-    """Running karma multiple times should apply changes cumulatively (known issue)."""
+def test_karma_is_idempotent_when_run_multiple_times(app, users):
+    """Running karma multiple times for the same week should apply the changes only once."""
     today = date.today()
     start_of_week, _ = get_this_week(today)
 
@@ -329,5 +333,279 @@ def test_karma_is_cumulative_when_run_multiple_times(app, users):
         reassign_karma(today)
 
         player = db.session.get(User, users["player1"])
-        # Karma is applied twice (this is the current behavior, documented as warning)
-        assert player.karma == initial_karma + 100 + 100
+        assert player.karma == initial_karma + 100
+        assert db.session.scalar(db.select(db.func.count()).select_from(KarmaEvent)) == 2  # DM and choice 1
+
+
+def test_resettlement_after_the_assignment_keeps_waiting_list_karma(app, users):
+    """The Sunday job settles and then assigns, which retires the week's waiting list; settling again changes nothing."""
+    sunday = date(2024, 6, 16)
+    start_of_week, _ = get_this_week(sunday)
+
+    with app.app_context():
+        waiting_list = Adventure.create(
+            title="Waiting List",
+            short_description="A waiting list",
+            user_id=users["dm"],
+            date=start_of_week + timedelta(days=2),
+            is_waitinglist=1,
+        )
+        db.session.add(Assignment(user_id=users["player1"], adventure_id=waiting_list.id, appeared=True))
+        db.session.add(Assignment(user_id=users["player2"], adventure_id=waiting_list.id, appeared=False))
+        db.session.commit()
+
+        reassign_karma(sunday)
+        settled = dict(db.session.execute(db.select(User.id, User.karma)).all())
+        assert settled[users["player1"]] == 1000 + 200
+
+        assign_players_to_adventures(sunday)
+        assert db.session.get(Adventure, waiting_list.id).is_waitinglist == 2
+
+        assert reassign_karma(sunday) == 0
+        assert dict(db.session.execute(db.select(User.id, User.karma)).all()) == settled
+
+
+def test_settlement_runs_a_fixed_number_of_statements(app, users):
+    """All rules are summed in one query and written with one bulk insert and one bulk update,
+    then the changed users' rollups are rewritten with one select, delete and insert."""
+    today = date.today()
+    start_of_week, _ = get_this_week(today)
+
+    with app.app_context():
+        first, second = (
+            Adventure.create(
+                title=f"Adventure {i}",
+                short_description="A test",
+                user_id=users["dm"],
+                date=start_of_week + timedelta(days=i),
+            )
+            for i in (1, 2)
+        )
+        for adventure in (first, second):
+            db.session.add(Assignment(user_id=users["player1"], adventure_id=adventure.id, appeared=False, preference_place=1))
+            db.session.add(Assignment(user_id=users["player2"], adventure_id=adventure.id, appeared=True, preference_place=1))
+        db.session.commit()
+
+        with count_statements() as statements:
+            changed = reassign_karma(today)
+
+        karma = dict(db.session.execute(db.select(User.id, User.karma)).all())
+        assert karma[users["dm"]] == 1000 + 500         # once, however many adventures
+        assert karma[users["player1"]] == 1000 - 1000   # once per missed session
+        assert karma[users["player2"]] == 1000 + 100    # once per preference place
+        assert changed == 3
+        assert [s.split()[0].upper() for s in statements] == [
+            "SELECT", "SELECT", "INSERT", "UPDATE", "SELECT", "DELETE", "INSERT",
+        ]
+
+
+def test_resettlement_applies_only_corrections(app, users):
+    """A corrected attendance changes karma by the difference, and the ledger rebuilds the same karma."""
+    today = date.today()
+    start_of_week, _ = get_this_week(today)
+
+    with app.app_context():
+        adventure = Adventure.create(
+            title="Test Adventure",
+            short_description="A test",
+            user_id=users["dm"],
+            date=start_of_week + timedelta(days=2),
+        )
+        db.session.add(Assignment(user_id=users["player1"], adventure_id=adventure.id, appeared=False, preference_place=2))
+        db.session.commit()
+        reassign_karma(today)
+        assert db.session.get(User, users["player1"]).karma == 1000 - 500
+
+        assignment = db.session.get(Assignment, (users["player1"], adventure.id))
+        assignment.appeared = True
+        db.session.commit()
+        reassign_karma(today)
+
+        assert db.session.get(User, users["player1"]).karma == 1000 + 120
+        rules = db.session.scalars(db.select(KarmaEvent.rule).where(KarmaEvent.user_id == users["player1"])).all()
+        assert rules == ["choice_2"]
+        assert check_karma() == []
+
+        db.session.execute(db.update(User).where(User.id == users["player1"]).values(karma=0))
+        assert check_karma() == [(users["player1"], 0, 1120)]
+        rebuild_karma()
+        db.session.commit()
+        assert db.session.get(User, users["player1"]).karma == 1120
+
+
+def test_replay_compares_alternative_rules_with_current_karma(app, users):
+    """Replaying the settled weeks under changed rules reports the difference per user."""
+    today = date.today()
+    start_of_week, _ = get_this_week(today)
+
+    with app.app_context():
+        for weeks_ago in (0, 1):
+            adventure = Adventure.create(
+                title=f"Adventure {weeks_ago}",
+                short_description="A test",
+                user_id=users["dm"],
+                date=start_of_week - timedelta(weeks=weeks_ago, days=-2),
+            )
+            db.session.add(Assignment(user_id=users["player1"], adventure_id=adventure.id, appeared=True, preference_place=1))
+            db.session.add(Assignment(user_id=users["player2"], adventure_id=adventure.id, appeared=False, preference_place=2))
+            db.session.commit()
+            reassign_karma(today - timedelta(weeks=weeks_ago))
+
+        unchanged = karma_replay_report(KarmaRules())
+        assert unchanged["summary"]["changed"] == 0
+        assert unchanged["meta"]["weeks"] == 2
+
+        report = karma_replay_report(
+            KarmaRules.from_dict({"no_show_penalty": -300, "choice_points": {"1": 50}}), trajectories=True
+        )
+        differences = {user["user_id"]: user["difference"] for user in report["top"]}
+        assert differences[users["player1"]] == 2 * (50 - 100)
+        assert differences[users["player2"]] == 2 * (-300 + 500)
+        assert differences[users["dm"]] == 0
+        assert report["trajectories"][str(users["player1"])][-1][1] == 1000 + 2 * 50
+
+
+def test_replay_counts_retired_waiting_lists(app, users):
+    """Past waiting lists have `is_waitinglist == 2`; replaying them with unchanged rules changes nothing."""
+    sunday = date(2024, 6, 16)
+    start_of_week, _ = get_this_week(sunday)
+
+    with app.app_context():
+        waiting_list = Adventure.create(
+            title="Waiting List",
+            short_description="A waiting list",
+            user_id=users["dm"],
+            date=start_of_week + timedelta(days=2),
+            is_waitinglist=1,
+        )
+        db.session.add(Assignment(user_id=users["player1"], adventure_id=waiting_list.id, appeared=True))
+        db.session.add(Assignment(user_id=users["player2"], adventure_id=waiting_list.id, appeared=False))
+        db.session.commit()
+        reassign_karma(sunday)
+        waiting_list.is_waitinglist = 2
+        db.session.commit()
+
+        report = karma_replay_report(KarmaRules())
+        assert report["summary"]["changed"] == 0
+        assert all(user["difference"] == 0 for user in report["top"])
+
+
+def test_replay_warns_about_weeks_before_the_ledger_and_can_replay_them(app, users):
+    """Weeks before the ledger are only replayed with `full_history`, starting from STARTING_KARMA."""
+    today = date.today()
+    start_of_week, _ = get_this_week(today)
+
+    with app.app_context():
+        for weeks_ago in (3, 0): # only the current week gets settled
+            adventure = Adventure.create(
+                title=f"Adventure {weeks_ago}",
+                short_description="A test",
+                user_id=users["dm"],
+                date=start_of_week - timedelta(weeks=weeks_ago, days=-2),
+            )
+            db.session.add(Assignment(user_id=users["player1"], adventure_id=adventure.id, appeared=True, preference_place=1))
+            db.session.commit()
+        reassign_karma(today)
+
+        ledger = karma_replay_report(KarmaRules())
+        assert ledger["meta"]["weeks"] == 1
+        assert ledger["meta"]["warning"].startswith("1 weeks of history from")
+
+        full = karma_replay_report(KarmaRules(), full_history=True)
+        assert full["meta"]["weeks"] == 2
+        assert full["meta"]["warning"] is None
+        replayed = {user["user_id"]: user["replayed"] for user in full["top"]}
+        assert replayed[users["player1"]] == STARTING_KARMA + 2 * 100
+        assert replayed[users["dm"]] == STARTING_KARMA + 2 * 500
+
+def test_replay_karma_command_writes_a_report(app, users, tmp_path):
+    rules = tmp_path / "rules.json"
+    rules.write_text('{"dm_bonus": 400}')
+    output = tmp_path / "report.json"
+
+    result = app.test_cli_runner().invoke(args=["replay-karma", str(rules), "--output", str(output)])
+
+    assert result.exit_code == 0
+    assert json.loads(output.read_text())["meta"]["rules"]["dm_bonus"] == 400
+
+
+def test_settlement_writes_weekly_rollups(app, users):
+    """Every settled week leaves one rollup per user with the points per rule."""
+    today = date.today()
+    start_of_week, _ = get_this_week(today)
+
+    with app.app_context():
+        adventure = Adventure.create(
+            title="Test Adventure",
+            short_description="A test",
+            user_id=users["dm"],
+            date=start_of_week + timedelta(days=2),
+        )
+        db.session.add(Assignment(user_id=users["player1"], adventure_id=adventure.id, appeared=True, preference_place=2))
+        db.session.commit()
+        reassign_karma(today)
+        add_karma_event(users["player1"], start_of_week, "late_cancel", -300)
+        db.session.commit()
+
+        rollups = {
+            rollup.user_id: rollup
+            for rollup in db.session.execute(db.select(KarmaRollup)).scalars()
+        }
+        assert set(rollups) == {users["dm"], users["player1"]}
+        assert rollups[users["dm"]].breakdown == {"dm": 500}
+        assert rollups[users["player1"]].points == 120 - 300
+        assert rollups[users["player1"]].breakdown == {"choice_2": 120, "late_cancel": -300}
+
+
+def test_karma_history_endpoint(app, client, users):
+    """The history lists settled weeks newest first with the balance after each week."""
+    today = date.today()
+    start_of_week, _ = get_this_week(today)
+
+    with app.app_context():
+        for weeks_ago, appeared in ((1, False), (0, True)):
+            adventure = Adventure.create(
+                title=f"Adventure {weeks_ago}",
+                short_description="A test",
+                user_id=users["dm"],
+                date=start_of_week - timedelta(weeks=weeks_ago, days=-2),
+            )
+            db.session.add(Assignment(user_id=users["player1"], adventure_id=adventure.id, appeared=appeared, preference_place=1))
+            db.session.commit()
+            reassign_karma(today - timedelta(weeks=weeks_ago))
+
+    login(client, users["player1"])
+    response = client.get(f"/api/users/{users['player1']}/karma-history", base_url="https://localhost")
+    assert response.status_code == 200
+    history = response.get_json()
+    assert history["karma"] == 1000 - 500 + 100
+    assert history["rank"] == 4 # behind the DM, player2 and player3
+    assert [(week["points"], week["balance"]) for week in history["weeks"]] == [(100, 600), (-500, 500)]
+    assert history["weeks"][0]["week_start"] == start_of_week.isoformat()
+    assert history["weeks"][1]["breakdown"] == {"no_show": -500}
+
+    response = client.get(f"/api/users/{users['player2']}/karma-history", base_url="https://localhost")
+    assert response.status_code == 401
+
+
+def test_leaderboard_pages_with_shared_ranks(app, client, users, admin_user_id, normal_user_id):
+    """Equal karma shares a rank, also across a page boundary."""
+    with app.app_context():
+        karma = {users["dm"]: 1500, users["player1"]: 1200, users["player2"]: 1200, users["player3"]: 900}
+        db.session.execute(db.update(User), [{"id": user_id, "karma": k} for user_id, k in karma.items()])
+        db.session.execute(db.update(User).where(User.id.in_([admin_user_id, normal_user_id])).values(karma=None))
+        db.session.commit()
+
+    login(client, normal_user_id)
+    assert client.get("/api/users/leaderboard", base_url="https://localhost").status_code == 401
+
+    login(client, admin_user_id)
+    first = client.get("/api/users/leaderboard?limit=2", base_url="https://localhost").get_json()
+    assert [(e["rank"], e["user_id"]) for e in first["entries"]] == [(1, users["dm"]), (2, users["player1"])]
+    assert first["next_cursor"]
+
+    second = client.get(f"/api/users/leaderboard?limit=2&cursor={first['next_cursor']}", base_url="https://localhost").get_json()
+    assert [(e["rank"], e["user_id"]) for e in second["entries"]] == [(2, users["player2"]), (4, users["player3"])]
+    assert second["next_cursor"] is None
+
+    assert client.get("/api/users/leaderboard?cursor=nonsense", base_url="https://localhost").status_code == 400
@@ -0,0 +1,120 @@
+from datetime import date
+import json
+import threading
+
+from app import live
+from app.live import MAX_QUEUED_EVENTS, board_publisher, load_week_summary, stream_week
+from app.models import Adventure, Assignment, User
+from app.provider import db
+from tests.conftest import login
+
+MONDAY = date(2024, 6, 17)
+WEDNESDAY = date(2024, 6, 19)
+
+
+def parse_event(chunk):
+    fields = dict(line.split(": ", 1) for line in chunk.decode().strip().split("\n") if not line.startswith("retry"))
+    return fields["event"], json.loads(fields["data"])
+
+
+def test_player_summary_shows_rosters_once_released(app):
+    with app.app_context():
+        dm = User.create(google_id="dm", name="DM")
+        player = User.create(google_id="player", name="Player")
+        adventure = Adventure.create(title="Adventure", short_description="", user_id=dm.id, date=WEDNESDAY)
+        db.session.add(Assignment(user_id=player.id, adventure_id=adventure.id))
+        db.session.commit()
+
+        summary = load_week_summary(MONDAY)
+        assert [p["display_name"] for p in summary["admin"][adventure.id]["players"]] == ["Player"]
+        assert "players" not in summary["player"][adventure.id]
+
+        adventure.release_assignments = True
+        db.session.commit()
+        assert load_week_summary(MONDAY)["player"][adventure.id]["players"] == summary["admin"][adventure.id]["players"]
+
+
+def test_writes_push_deltas_to_the_subscribers_of_their_week(client, app, admin_user_id):
+    with app.app_context():
+        dm = User.create(google_id="dm", name="DM")
+        adventure_id = Adventure.create(title="Adventure", short_description="", user_id=dm.id, date=WEDNESDAY).id
+        publisher = board_publisher()
+        subscriber = publisher.subscribe(MONDAY, "player", 10)
+        other_week = publisher.subscribe(date(2024, 6, 24), "player", 10)
+
+    kind, data = parse_event(subscriber.events.get(timeout=5))
+    assert kind == "snapshot"
+    assert [(entry["id"], entry["signups"]) for entry in data["adventures"]] == [(adventure_id, 0)]
+    assert parse_event(other_week.events.get(timeout=5))[0] == "snapshot"
+
+    login(client, admin_user_id)
+    response = client.post("/api/signups", json={"adventure_id": adventure_id, "priority": 1}, base_url="https://localhost")
+    assert response.status_code == 200
+
+    kind, data = parse_event(subscriber.events.get(timeout=5))
+    assert kind == "delta"
+    assert [(entry["id"], entry["signups"]) for entry in data["changed"]] == [(adventure_id, 1)]
+    assert data["removed"] == []
+    assert other_week.events.empty()
+
+
+def test_writes_do_not_wait_for_the_publisher(client, app, admin_user_id, monkeypatch):
+    with app.app_context():
+        dm = User.create(google_id="dm", name="DM")
+        adventure_id = Adventure.create(title="Adventure", short_description="", user_id=dm.id, date=WEDNESDAY).id
+        subscriber = board_publisher().subscribe(MONDAY, "admin", 10)
+    assert parse_event(subscriber.events.get(timeout=5))[0] == "snapshot"
+
+    building, release = threading.Event(), threading.Event()
+    def slow_summary(week_start):
+        building.set()
+        assert release.wait(timeout=5)
+        return load_week_summary(week_start)
+    monkeypatch.setattr(live, "load_week_summary", slow_summary)
+
+    login(client, admin_user_id)
+    response = client.post("/api/signups", json={"adventure_id": adventure_id, "priority": 1}, base_url="https://localhost")
+    assert response.status_code == 200 # while the publisher is still building the summary
+    assert building.wait(timeout=5)
+    assert subscriber.events.empty()
+
+    release.set()
+    kind, data = parse_event(subscriber.events.get(timeout=5))
+    assert kind == "delta"
+    assert [entry["signups"] for entry in data["changed"]] == [1]
+
+
+def test_stream_starts_with_a_snapshot_and_unsubscribes_on_close(client, app):
+    response = client.get(f"/api/stream/week/{WEDNESDAY.isoformat()}", base_url="https://localhost", buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+
+    first = next(response.iter_encoded())
+    assert first.startswith(b"retry: ")
+    assert parse_event(first) == ("snapshot", {"week": MONDAY.isoformat(), "adventures": []})
+    assert app.extensions["board_publisher"].subscribers
+
+    response.close()
+    assert not app.extensions["board_publisher"].subscribers
+    assert not app.extensions["board_publisher"].summaries
+
+
+def test_stream_is_refused_over_the_subscriber_cap(client, app):
+    app.config["LIVE"] = {"max_subscribers": 0}
+
+    response = client.get("/api/stream/week/0", base_url="https://localhost")
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "60"
+
+
+def test_slow_subscriber_is_disconnected(app):
+    with app.app_context():
+        publisher = board_publisher()
+        subscriber = publisher.subscribe(MONDAY, "admin", 10)
+        for _ in range(MAX_QUEUED_EVENTS + 1):
+            subscriber.push(b"event: delta\ndata: {}\n\n")
+        assert subscriber.closed
+
+        assert list(stream_week(publisher, subscriber, 1, 1, 3000)) == []
+        assert not publisher.subscribers
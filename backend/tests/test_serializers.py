@@ -0,0 +1,76 @@
+"""The precompiled serializers must produce what the marshmallow schemas produce."""
+from datetime import date
+import json
+
+import pytest
+
+from app.api import (
+    AdventureSchema, BOARD_SERIALIZERS, PLAYER_BOARD_EXCLUDE, USER_SIGNUPS_SERIALIZERS, UserWithSignupsSchema,
+)
+from app.board import load_week_board
+from app.models import Adventure, Assignment, Signup, User
+from app.provider import db
+from app.serializers import dumps, render_week_board
+
+WEEK_START, WEEK_END = date(2024, 6, 17), date(2024, 6, 23)
+
+
+@pytest.fixture()
+def week(app):
+    with app.app_context():
+        dm = User.create(google_id="dm", name="DM", display_name="Dee", karma=1200)
+        players = [User.create(google_id=f"p{i}", name=f"P{i}", display_name=f"Player {i}") for i in range(4)]
+        first = Adventure.create(title="First", short_description="x", user_id=dm.id, date=date(2024, 6, 19), tags="a")
+        second = Adventure.create(title="Second", short_description="y", user_id=None, date=date(2024, 6, 20), max_players=2)
+        Adventure.create(title="Next week", short_description="z", user_id=dm.id, date=date(2024, 6, 26))
+        for i, player in enumerate(players):
+            adventure = first if i % 2 else second
+            db.session.add(Assignment(user_id=player.id, adventure_id=adventure.id, preference_place=1, appeared=i != 3))
+            db.session.add(Signup(user_id=player.id, adventure_id=first.id, priority=1, adventure_date=first.date))
+        db.session.commit()
+
+
+def marshmallow_board(exclude):
+    return json.loads(dumps(AdventureSchema(many=True, exclude=exclude).dump(load_week_board(WEEK_START, WEEK_END))))
+
+
+@pytest.mark.parametrize("released", [False, True])
+def test_board_serializers_match_the_schema(app, week, released):
+    with app.app_context():
+        db.session.execute(db.update(Adventure).values(release_assignments=released))
+        db.session.commit()
+
+        assert json.loads(render_week_board(BOARD_SERIALIZERS, WEEK_START, WEEK_END, True)) == marshmallow_board([])
+        player_exclude = PLAYER_BOARD_EXCLUDE + ([] if released else ["assignments"])
+        player_board = json.loads(render_week_board(BOARD_SERIALIZERS, WEEK_START, WEEK_END, False))
+        assert player_board == marshmallow_board(player_exclude)
+        assert all("karma" not in adventure["creator"] for adventure in player_board if adventure["creator"])
+
+
+@pytest.mark.parametrize("audience,exclude", [("admin", []), ("player", ["privilege_level", "email", "signups", "karma"])])
+def test_user_signups_serializers_match_the_schema(app, week, audience, exclude):
+    with app.app_context():
+        users = db.session.scalars(
+            db.select(User).where(User.signups.any(Signup.adventure_date.between(WEEK_START, WEEK_END))).order_by(User.id)
+        ).all()
+        expected = json.loads(dumps(UserWithSignupsSchema(many=True, exclude=exclude).dump(users)))
+        assert len(expected) == 4 # the players; the DM has no signups
+
+        for chunk_size in (1, 3, 10):
+            chunks = list(USER_SIGNUPS_SERIALIZERS[audience].stream(WEEK_START, WEEK_END, chunk_size))
+            assert json.loads(b"".join(chunks)) == expected
+
+
+def test_user_signups_stream_of_an_empty_week(app, week):
+    with app.app_context():
+        assert b"".join(USER_SIGNUPS_SERIALIZERS["admin"].stream(date(2020, 1, 6), date(2020, 1, 12))) == b"[]"
+
+
+def test_user_signups_stream_holds_no_transaction_while_sending(app, week):
+    with app.app_context():
+        chunks = USER_SIGNUPS_SERIALIZERS["admin"].stream(WEEK_START, WEEK_END, 3)
+        sent = []
+        for chunk in chunks:
+            assert not db.session().in_transaction()
+            sent.append(chunk)
+        assert len(json.loads(b"".join(sent))) == 4
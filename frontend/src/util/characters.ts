@@ -46,7 +46,9 @@ export async function fetchCharacterData(): Promise<{
 
 async function fetchAndJoin(): Promise<{ [id: number]: Character }> {
   const req1 = axios.get('/api/characters/summary');
-  const users = await axios.get('/api/users');
+  const users = await axios.get('/api/users', {
+    params: { fields: 'display_name,dnd_beyond_name' },
+  });
   const usermap = {} as { [username: string]: string };
   for (const u of users.data) {
     usermap[u.dnd_beyond_name?.toLowerCase()] = u.display_name;